@@ -0,0 +1,138 @@
+from collections import Counter, defaultdict
+from typing import List, Optional, Tuple
+
+# Nombre de mots consécutifs formant un shingle (empreinte d'une page)
+SHINGLE_SIZE = 3
+
+# Similarité (Jaccard des shingles) minimale pour apparier deux pages dans l'ordre
+MIN_PAGE_SIMILARITY = 0.2
+
+# Similarité minimale pour reconnaître une page déplacée hors de l'ordre du document
+MIN_MOVED_SIMILARITY = 0.5
+
+# Statuts des pages alignées
+PAGE_MATCHED = "matched"
+PAGE_MOVED = "moved"
+PAGE_INSERTED = "inserted"
+PAGE_DELETED = "deleted"
+
+
+def page_shingles(words: list) -> set:
+    """Empreintes des suites de SHINGLE_SIZE mots d'une page (insensibles à la casse)."""
+    tokens = [w["text"].lower() for w in words]
+    if len(tokens) < SHINGLE_SIZE:
+        return {hash(tuple(tokens))} if tokens else set()
+    return {hash(tuple(tokens[i:i + SHINGLE_SIZE])) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+
+def page_similarities(shingles1: List[set], shingles2: List[set]) -> dict:
+    """
+    Similarité de Jaccard des paires de pages (i1, i2) qui partagent au moins un shingle,
+    trouvées par un index inversé plutôt qu'en comparant toutes les paires. Les shingles
+    présents sur plus de la moitié des pages (en-têtes, pieds de page) ne distinguent
+    pas les pages : ils sont ignorés.
+    """
+    frequency = Counter(h for shingles in shingles1 for h in shingles)
+    common = {h for h, n in frequency.items() if n > max(2, len(shingles1) // 2)}
+    shingles1 = [s - common for s in shingles1]
+    shingles2 = [s - common for s in shingles2]
+
+    index = defaultdict(list)
+    for i1, shingles in enumerate(shingles1):
+        for h in shingles:
+            index[h].append(i1)
+
+    similarities = {}
+    for i2, shingles in enumerate(shingles2):
+        overlap = Counter()
+        for h in shingles:
+            for i1 in index.get(h, ()):
+                overlap[i1] += 1
+        for i1, n in overlap.items():
+            similarities[i1, i2] = n / (len(shingles1[i1]) + len(shingles) - n)
+
+    # Pages sans texte (ou seulement communes) des deux côtés : appariables entre elles
+    empty1 = [i1 for i1, s in enumerate(shingles1) if not s]
+    empty2 = [i2 for i2, s in enumerate(shingles2) if not s]
+    for i1 in empty1:
+        for i2 in empty2:
+            similarities[i1, i2] = 1.0
+    return similarities
+
+
+def align_pages(pages1: list, pages2: list) -> List[Tuple[Optional[int], Optional[int], str]]:
+    """
+    Aligne les pages de deux versions d'un document. Retourne, dans l'ordre d'affichage,
+    des triplets (indice dans pages1 ou None, indice dans pages2 ou None, statut) :
+    pages appariées dans l'ordre ("matched"), déplacées ("moved"), supprimées
+    ("deleted") ou insérées ("inserted").
+
+    L'appariement maximise la somme des similarités des paires retenues sans croiser
+    l'ordre des pages (plus longue sous-suite commune pondérée), puis les pages restées
+    seules de part et d'autre sont rapprochées si elles se ressemblent assez (page déplacée).
+    """
+    n1, n2 = len(pages1), len(pages2)
+    similarities = page_similarities(
+        [page_shingles(page["words"]) for page in pages1],
+        [page_shingles(page["words"]) for page in pages2],
+    )
+
+    def match_score(i1, i2):
+        s = similarities.get((i1, i2), 0.0)
+        return s if s >= MIN_PAGE_SIMILARITY else None
+
+    # score[i1][i2] : meilleur alignement de pages1[:i1] et pages2[:i2]
+    score = [[0.0] * (n2 + 1) for _ in range(n1 + 1)]
+    for i1 in range(1, n1 + 1):
+        row, previous = score[i1], score[i1 - 1]
+        for i2 in range(1, n2 + 1):
+            best = previous[i2] if previous[i2] >= row[i2 - 1] else row[i2 - 1]
+            s = match_score(i1 - 1, i2 - 1)
+            if s is not None and previous[i2 - 1] + s > best:
+                best = previous[i2 - 1] + s
+            row[i2] = best
+
+    # Remontée : à score égal, l'appariement d'abord, puis les insertions (qui seront
+    # ainsi affichées après les suppressions au même endroit)
+    steps = []
+    i1, i2 = n1, n2
+    while i1 > 0 or i2 > 0:
+        s = match_score(i1 - 1, i2 - 1) if i1 > 0 and i2 > 0 else None
+        if s is not None and score[i1][i2] == score[i1 - 1][i2 - 1] + s:
+            steps.append((i1 - 1, i2 - 1, PAGE_MATCHED))
+            i1 -= 1
+            i2 -= 1
+        elif i2 > 0 and score[i1][i2] == score[i1][i2 - 1]:
+            steps.append((None, i2 - 1, PAGE_INSERTED))
+            i2 -= 1
+        else:
+            steps.append((i1 - 1, None, PAGE_DELETED))
+            i1 -= 1
+    steps.reverse()
+
+    # Pages déplacées : meilleures paires d'abord parmi les pages restées seules
+    deleted = {i1 for i1, _, status in steps if status == PAGE_DELETED}
+    inserted = {i2 for _, i2, status in steps if status == PAGE_INSERTED}
+    candidates = sorted(
+        ((s, i1, i2) for (i1, i2), s in similarities.items()
+         if s >= MIN_MOVED_SIMILARITY and i1 in deleted and i2 in inserted),
+        reverse=True,
+    )
+    moved = {}
+    for _, i1, i2 in candidates:
+        if i1 in deleted and i2 in inserted:
+            moved[i2] = i1
+            deleted.discard(i1)
+            inserted.discard(i2)
+
+    # Une page déplacée s'affiche à sa place dans la nouvelle version
+    moved_from = set(moved.values())
+    aligned = []
+    for i1, i2, status in steps:
+        if status == PAGE_DELETED and i1 in moved_from:
+            continue
+        if status == PAGE_INSERTED and i2 in moved:
+            aligned.append((moved[i2], i2, PAGE_MOVED))
+        else:
+            aligned.append((i1, i2, status))
+    return aligned
@@ -0,0 +1,291 @@
+"""
+Suite de benchmarks par étape sur des devis synthétiques (voir `corpus.py`).
+
+    python bench_suite.py run [--pages 1,10,100,500] [--edit-rate 0.05] [--insert-rate 0.05] [-o résultats.json]
+    python bench_suite.py compare avant.json après.json [--tolerance 0.15]
+
+Chaque scénario (nombre de pages, taux de modifications) est mesuré dans un processus
+neuf : temps de chaque étape (extraction, diff_main, diff des pages, rendu, surlignage,
+encodage), pic de mémoire résidente, taille de la réponse JSON et des images. Les
+résultats sont écrits en JSON avec le commit mesuré ; `compare` signale les étapes
+ralenties d'un fichier de résultats à l'autre (code de sortie 1 en cas de régression).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from cache import DocumentCache
+from corpus import ROWS_PER_PAGE, make_quote_corpus
+from services import (RENDER_SCALE, annotate_page, compact_diff, diff_document_pages, diff_texts,
+                      encode_image, ingest_document, render_page)
+
+STAGES = ("extraction", "diff_main", "page_diff", "rendering", "overlay", "encoding")
+
+# Clés d'une page dans la réponse de /compare-versions avec overlay=data, comme le
+# demande le frontend (voir `page_urls` dans main.py)
+PAGE_RESPONSE_KEYS = ("page", "page1", "page2", "status", "unchanged", "size1", "size2",
+                      "points1", "points2", "highlights")
+
+# Contexte de la diff compacte demandé par le frontend (DIFF_CONTEXT dans App.tsx)
+RESPONSE_CONTEXT = 300
+
+# Ralentissement toléré par défaut avant de signaler une régression (mesures bruitées)
+DEFAULT_TOLERANCE = 0.15
+
+# Écarts absolus ignorés : une étape de quelques millisecondes varie d'autant d'une exécution à l'autre
+MIN_SECONDS_DELTA = 0.005
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss est en Ko sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_stages(file1: str, file2: str, directory: str, mode: str) -> dict:
+    """Une comparaison complète, étape par étape, comme le serveur sur des documents jamais vus."""
+    seconds = dict.fromkeys(STAGES, 0.0)
+    cache = DocumentCache(os.path.join(directory, "cache"))
+    cache.clear()
+
+    start = time.perf_counter()
+    doc1 = ingest_document(file1, cache, render=False)
+    doc2 = ingest_document(file2, cache, render=False)
+    seconds["extraction"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text_diff = diff_texts(doc1.text, doc2.text, mode)
+    seconds["diff_main"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pages = diff_document_pages(doc1, doc2, mode)
+    seconds["page_diff"] = time.perf_counter() - start
+
+    # Pages une par une (mémoire bornée), sans cache des rasters : chaque étape est isolée
+    image_bytes = 0
+    rendered = 0
+    for page in pages:
+        if page["unchanged"]:
+            continue
+        for doc, key, words_key, color in ((doc1, "page1", "deleted", (255, 0, 0, 100)),
+                                           (doc2, "page2", "inserted", (0, 255, 0, 100))):
+            if page[key] is None:
+                continue
+            index = page[key] - 1
+            start = time.perf_counter()
+            img = render_page(doc.source_path, index)
+            seconds["rendering"] += time.perf_counter() - start
+            start = time.perf_counter()
+            img = annotate_page(img, doc.pages[index]["words"], page[words_key], color, page["regions"])
+            seconds["overlay"] += time.perf_counter() - start
+            start = time.perf_counter()
+            image_bytes += len(encode_image(img))
+            seconds["encoding"] += time.perf_counter() - start
+            rendered += 1
+
+    # Réponse telle que la reçoit le frontend : diff compacte et surlignages en données
+    response = {
+        "compact_diff": compact_diff(text_diff.to_data(), RESPONSE_CONTEXT),
+        "stats": text_diff.stats(),
+        "complete": text_diff.complete,
+        "num_pages": len(pages),
+        "visual_diff": [{k: page[k] for k in PAGE_RESPONSE_KEYS} for page in pages],
+    }
+    return {
+        "seconds": seconds,
+        "num_pages": [len(doc1.pages), len(doc2.pages)],
+        "changed_pages": sum(1 for page in pages if not page["unchanged"]),
+        "rendered_images": rendered,
+        "response_bytes": len(json.dumps(response)),
+        "image_bytes": image_bytes,
+        "additions": text_diff.additions,
+        "deletions": text_diff.deletions,
+    }
+
+
+def _scenario_child(file1, file2, directory, mode, repeat, queue):
+    # Processus neuf par scénario : le pic de mémoire ne mélange pas les scénarios
+    try:
+        baseline_rss = _peak_rss_mb()
+        best = None
+        for _ in range(repeat):
+            result = _run_stages(file1, file2, directory, mode)
+            if best is None:
+                best = result
+            else:
+                # Meilleur temps de chaque étape sur les répétitions
+                for stage, t in result["seconds"].items():
+                    best["seconds"][stage] = min(best["seconds"][stage], t)
+        best["baseline_rss_mb"] = round(baseline_rss, 1)
+        best["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+        queue.put(best)
+    except Exception as exc:
+        queue.put({"error": repr(exc)})
+
+
+def scenario_name(num_pages: int, edit_rate: float, insert_rate: float, delete_rate: float) -> str:
+    return f"p{num_pages}-e{edit_rate:g}-i{insert_rate:g}-d{delete_rate:g}"
+
+
+def run_scenario(num_pages: int, edit_rate: float = 0.05, insert_rate: float = 0.0, delete_rate: float = 0.0,
+                 rows_per_page: int = ROWS_PER_PAGE, mode: str = "char", repeat: int = 1, seed: int = 0) -> dict:
+    """Génère le corpus du scénario puis le mesure dans un processus dédié."""
+    with tempfile.TemporaryDirectory() as directory:
+        file1, file2, edits = make_quote_corpus(
+            directory, num_pages, edit_rate, insert_rate, delete_rate, rows_per_page, seed
+        )
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        process = context.Process(target=_scenario_child, args=(file1, file2, directory, mode, repeat, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+    if "error" in result:
+        raise RuntimeError(f"Scénario {num_pages} pages : {result['error']}")
+    seconds = result.pop("seconds")
+    return {
+        "name": scenario_name(num_pages, edit_rate, insert_rate, delete_rate),
+        "params": {
+            "pages": num_pages,
+            "edit_rate": edit_rate,
+            "insert_rate": insert_rate,
+            "delete_rate": delete_rate,
+            "rows_per_page": rows_per_page,
+            "mode": mode,
+            "seed": seed,
+        },
+        "repeat": repeat,
+        "edits": edits,
+        "seconds": {stage: round(t, 5) for stage, t in seconds.items()},
+        "total_seconds": round(sum(seconds.values()), 5),
+        **result,
+    }
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def environment() -> dict:
+    """Ce qui identifie une mesure : commit, machine et réglages du rendu."""
+    return {
+        "commit": _git("rev-parse", "HEAD") or None,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "render_scale": RENDER_SCALE,
+    }
+
+
+def print_scenario(result: dict):
+    s = result["seconds"]
+    print(f"{result['name']:28} " + " ".join(f"{s[stage] * 1000:9.1f}" for stage in STAGES)
+          + f" {result['total_seconds'] * 1000:9.1f} {result['peak_rss_mb']:7.1f}"
+          f" {result['response_bytes'] / 1024:9.1f} {result['image_bytes'] / 1024:9.1f}")
+
+
+def run(args) -> dict:
+    results = {"environment": environment(), "scenarios": []}
+    print(f"{'scénario (ms)':28} " + " ".join(f"{stage:>9}" for stage in STAGES)
+          + f" {'total':>9} {'RSS Mo':>7} {'JSON Ko':>9} {'img Ko':>9}")
+    for num_pages in args.pages:
+        result = run_scenario(num_pages, args.edit_rate, args.insert_rate, args.delete_rate,
+                              args.rows, args.mode, args.repeat, args.seed)
+        results["scenarios"].append(result)
+        print_scenario(result)
+    output = args.output or f"bench-{(results['environment']['commit'] or 'local')[:10]}.json"
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Résultats écrits dans {output}")
+    return results
+
+
+def compare_results(before: dict, after: dict, tolerance: float = DEFAULT_TOLERANCE) -> list:
+    """
+    Étapes (et pic de mémoire, taille de réponse) des scénarios communs aux deux
+    résultats : liste de (scénario, mesure, avant, après, régression).
+    """
+    previous = {s["name"]: s for s in before["scenarios"]}
+    rows = []
+    for scenario in after["scenarios"]:
+        old = previous.get(scenario["name"])
+        if old is None or old["params"] != scenario["params"]:
+            continue
+        metrics = [(stage, old["seconds"].get(stage), scenario["seconds"][stage], MIN_SECONDS_DELTA)
+                   for stage in STAGES]
+        metrics += [("total", old["total_seconds"], scenario["total_seconds"], MIN_SECONDS_DELTA),
+                    ("peak_rss_mb", old["peak_rss_mb"], scenario["peak_rss_mb"], 1.0),
+                    ("response_bytes", old["response_bytes"], scenario["response_bytes"], 0),
+                    ("image_bytes", old["image_bytes"], scenario["image_bytes"], 0)]
+        for metric, old_value, new_value, min_delta in metrics:
+            if old_value is None:
+                continue
+            regression = new_value - old_value > max(old_value * tolerance, min_delta)
+            rows.append((scenario["name"], metric, old_value, new_value, regression))
+    return rows
+
+
+def compare(args) -> int:
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"{(before['environment']['commit'] or '?')[:10]} -> {(after['environment']['commit'] or '?')[:10]}")
+    rows = compare_results(before, after, args.tolerance)
+    for name, metric, old_value, new_value, regression in rows:
+        change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+        print(f"{name:28} {metric:15} {old_value:12g} -> {new_value:12g} {change:+7.1f} %"
+              + ("  RÉGRESSION" if regression else ""))
+    regressions = sum(1 for row in rows if row[4])
+    print(f"{regressions} régression(s) au-delà de {args.tolerance:.0%}")
+    return 1 if regressions else 0
+
+
+def _int_list(value: str) -> list:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks par étape de la comparaison de devis")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="mesurer les scénarios et écrire les résultats en JSON")
+    run_parser.add_argument("--pages", type=_int_list, default=[1, 10, 50, 100],
+                            help="nombres de pages, séparés par des virgules (1 à 500)")
+    run_parser.add_argument("--edit-rate", type=float, default=0.05, help="proportion de lignes modifiées")
+    run_parser.add_argument("--insert-rate", type=float, default=0.05, help="proportion de pages insérées")
+    run_parser.add_argument("--delete-rate", type=float, default=0.0, help="proportion de pages supprimées")
+    run_parser.add_argument("--rows", type=int, default=ROWS_PER_PAGE, help="lignes du tableau de prix par page")
+    run_parser.add_argument("--mode", default="char", choices=("char", "word", "line"))
+    run_parser.add_argument("--repeat", type=int, default=1, help="répétitions (meilleur temps par étape)")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("-o", "--output", help="fichier de résultats (défaut : bench-<commit>.json)")
+
+    compare_parser = commands.add_parser("compare", help="comparer deux fichiers de résultats")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                                help="ralentissement relatif toléré (0.15 = 15 %%)")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run(args)
+        return 0
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
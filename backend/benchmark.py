@@ -0,0 +1,402 @@
+"""
+Mesures ciblées des étapes du serveur, une par sous-commande (voir `bench_suite.py` pour
+le suivi des régressions) :
+
+    python benchmark.py pipeline [v1.pdf v2.pdf]
+    python benchmark.py workers|unchanged_pages|pixel_diff|batch|search|wire_format|overlay|memory
+    python benchmark.py all
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from cache import ComparisonCache, DocumentCache
+from compression import BROTLI_QUALITY, GZIP_LEVEL, brotli
+from corpus import make_quote_corpus
+from raster_diff import changed_regions
+from search import SearchIndex
+from services import (ingest_document, comparison_text, compact_diff, diff_document_pages, diff_texts,
+                      document_page_image, generate_comparison_images, open_comparison, open_comparisons,
+                      page_pixel_regions, page_raster, render_comparison_pages)
+
+def timed(fn, *args, repeat=5, **kwargs):
+    """Meilleur temps (en secondes) sur `repeat` exécutions, et le dernier résultat."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def compare(file1, file2, cache=None):
+    doc1 = ingest_document(file1, cache)
+    doc2 = ingest_document(file2, cache)
+    text_diff = diff_texts(doc1.text, doc2.text)
+    text_diff.to_html()
+    return generate_comparison_images(doc1, doc2)
+
+# Proportion de lignes modifiées sur les pages choisies : au moins une ligne par page
+PAGE_EDIT_RATE = 0.2
+
+def _draw_quote_page(c, n, num_pages, stamped):
+    width, height = A4
+    # Logo, tableau de prix à filets, et pour la version "tamponnée" un tampon et une signature
+    c.setFillColorRGB(0.1, 0.3, 0.6)
+    c.rect(50, height - 90, 80, 40, fill=1, stroke=0)
+    c.setFillColorRGB(0, 0, 0)
+    c.setFont("Helvetica", 10)
+    c.drawString(150, height - 70, f"Devis - page {n}/{num_pages}")
+    top = height - 120
+    for k in range(25):
+        y = top - k * 22
+        c.line(50, y, width - 50, y)
+        c.drawString(55, y - 15, f"Article {n}.{k + 1}: prestation {k + 1}")
+        c.drawRightString(width - 55, y - 15, f"{(k + 1) * (100 + n)}.00 EUR")
+    c.line(50, top, 50, top - 25 * 22)
+    c.line(width - 50, top, width - 50, top - 25 * 22)
+    if stamped:
+        c.setStrokeColorRGB(0.8, 0, 0)
+        c.setLineWidth(3)
+        c.circle(width - 130, 90, 45)
+        c.bezier(70, 60, 120, 110, 160, 20, 230, 80)
+        c.setStrokeColorRGB(0, 0, 0)
+        c.setLineWidth(1)
+    c.showPage()
+
+def make_graphic_corpus(directory, num_pages=20, stamped_pages=None):
+    """
+    Deux devis au texte identique, avec logo et tableau à filets ; la seconde version
+    porte un tampon et une signature (sans texte) sur les pages `stamped_pages` (toutes
+    si None) : changements invisibles pour le diff des mots.
+    """
+    files = []
+    for version in (1, 2):
+        path = os.path.join(directory, f"graphic_v{version}.pdf")
+        c = canvas.Canvas(path, pagesize=A4)
+        for n in range(1, num_pages + 1):
+            stamped = version == 2 and (stamped_pages is None or n in stamped_pages)
+            _draw_quote_page(c, n, num_pages, stamped)
+        c.save()
+        files.append(path)
+    return files
+
+def bench_pixel_diff(num_pages=20):
+    """Coût par page de la comparaison des rasters (scale 2), et détection des tampons."""
+    with tempfile.TemporaryDirectory() as directory:
+        file1, file2 = make_graphic_corpus(directory, num_pages, stamped_pages=set(range(1, num_pages + 1, 2)))
+        cache = DocumentCache(os.path.join(directory, "cache"))
+        doc1 = ingest_document(file1, cache)
+        doc2 = ingest_document(file2, cache)
+        img1, img2 = page_raster(doc1, 0), page_raster(doc2, 0)
+        print(f"Différence des rasters ({img1.width}x{img1.height} px), par page :")
+        t, regions = timed(changed_regions, img1, img2, repeat=20)
+        print(f"  rasters en mémoire               : {t * 1000:8.2f} ms ({len(regions)} zone(s))")
+        t, _ = timed(page_pixel_regions, doc1, 0, doc2, 0, repeat=20)
+        print(f"  + lecture des rasters, hors texte : {t * 1000:8.2f} ms")
+        t, _ = timed(page_pixel_regions, doc1, 1, doc2, 1, repeat=20)
+        print(f"  page au rendu identique          : {t * 1000:8.2f} ms")
+        t_text, pages = timed(diff_document_pages, doc1, doc2, repeat=3)
+        t_pixels, pages = timed(diff_document_pages, doc1, doc2, "char", True, repeat=3)
+        found = sum(1 for page in pages if page["regions"])
+        print(f"Diff de {num_pages} pages : texte seul {t_text * 1000:8.1f} ms, "
+              f"texte + rasters {t_pixels * 1000:8.1f} ms "
+              f"({(t_pixels - t_text) / num_pages * 1000:.1f} ms/page) ; "
+              f"pages modifiées détectées : {found}/{num_pages // 2 + num_pages % 2}")
+
+def bench_workers(worker_counts=(1, 2, 4), num_pages=30):
+    """Temps de rendu/surlignage des pages selon la taille du pool de processus."""
+    with tempfile.TemporaryDirectory() as directory:
+        file1, file2, _ = make_quote_corpus(directory, num_pages)
+        cache = DocumentCache(os.path.join(directory, "cache"))
+        doc1 = ingest_document(file1, cache)
+        doc2 = ingest_document(file2, cache)
+        print(f"Rendu et surlignage de {num_pages} pages ({os.cpu_count()} CPU) :")
+        for workers in worker_counts:
+            if workers == 1:
+                t, _ = timed(generate_comparison_images, doc1, doc2, repeat=3)
+            else:
+                with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    # Premier appel hors mesure : démarrage des workers
+                    generate_comparison_images(doc1, doc2, executor=executor, workers=workers)
+                    t, _ = timed(generate_comparison_images, doc1, doc2, executor=executor, workers=workers, repeat=3)
+            print(f"  {workers} worker(s) : {t * 1000:8.1f} ms")
+
+def _full_comparison(doc1, doc2, directory):
+    # Diff des mots et rendu de toutes les pages, comparaison absente du cache
+    comparisons = ComparisonCache(directory)
+    comparisons.clear()
+    entry = open_comparison(doc1, doc2, "char", comparisons)
+    for _ in render_comparison_pages(entry, doc1, doc2, list(range(1, len(entry.pages) + 1))):
+        pass
+    return entry
+
+def bench_unchanged_pages(num_pages=50):
+    """Comparaison complète d'un devis dont une seule page a changé (documents déjà analysés)."""
+    with tempfile.TemporaryDirectory() as directory:
+        file1, file2, _ = make_quote_corpus(directory, num_pages, PAGE_EDIT_RATE, edited_pages={num_pages // 2})
+        cache = DocumentCache(os.path.join(directory, "cache"))
+        doc1 = ingest_document(file1, cache)
+        doc2 = ingest_document(file2, cache)
+        t, entry = timed(_full_comparison, doc1, doc2, os.path.join(directory, "comparisons"), repeat=3)
+        unchanged = sum(1 for page in entry.pages if page["unchanged"])
+        print(f"Comparaison de {num_pages} pages, 1 page modifiée ({unchanged} inchangées) : {t * 1000:8.1f} ms")
+        start = time.perf_counter()
+        for page in entry.pages:
+            if page["unchanged"]:
+                document_page_image(doc1, page["page1"] - 1)
+                document_page_image(doc2, page["page2"] - 1)
+        print(f"  + images des pages inchangées (une fois par document) : {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+def _pairwise(files, cache, directory):
+    # Une comparaison par révision, comme des appels /compare-versions successifs (sans rendu)
+    comparisons = ComparisonCache(directory)
+    comparisons.clear()
+    for revision in files[1:]:
+        baseline = ingest_document(files[0], cache, render=False)
+        doc = ingest_document(revision, cache, render=False)
+        comparison_text(open_comparison(baseline, doc, "word", comparisons), baseline, doc)
+
+def _batch(files, cache, directory, executor=None):
+    comparisons = ComparisonCache(directory)
+    comparisons.clear()
+    docs = [ingest_document(path, cache, render=False) for path in files]
+    return open_comparisons(docs[0], docs[1:], "word", comparisons, executor=executor)
+
+def bench_batch(num_revisions=8, num_pages=30, worker_counts=(1, 2, 4)):
+    """Une référence comparée à `num_revisions` révisions : paire par paire, puis en lot."""
+    with tempfile.TemporaryDirectory() as directory:
+        files = []
+        for k in range(num_revisions):
+            revision_dir = os.path.join(directory, f"r{k}")
+            os.makedirs(revision_dir)
+            baseline, revision, _ = make_quote_corpus(revision_dir, num_pages, PAGE_EDIT_RATE,
+                                                      edited_pages=set(range(1, num_pages + 1, k + 1)))
+            files = files or [baseline]
+            files.append(revision)
+        cache = DocumentCache(os.path.join(directory, "cache"))
+        for path in files:
+            ingest_document(path, cache, render=False)
+        comparisons_dir = os.path.join(directory, "comparisons")
+        print(f"Référence contre {num_revisions} révisions de {num_pages} pages (diff texte et pages, sans rendu) :")
+        t, _ = timed(_pairwise, files, cache, comparisons_dir, repeat=3)
+        print(f"  paire par paire      : {t * 1000:8.1f} ms")
+        for workers in worker_counts:
+            if workers == 1:
+                t, _ = timed(_batch, files, cache, comparisons_dir, repeat=3)
+            else:
+                with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    _batch(files, cache, comparisons_dir, executor)
+                    t, _ = timed(_batch, files, cache, comparisons_dir, executor, repeat=3)
+            print(f"  en lot, {workers} worker(s) : {t * 1000:8.1f} ms")
+
+def _wire_formats(text_diff):
+    # Corps JSON de la diff texte d'une réponse, dans chaque format (voir text_payload dans main.py)
+    full = {"html_diff": text_diff.to_html(), "raw_diff": text_diff.to_data(),
+            "stats": text_diff.stats(), "complete": text_diff.complete}
+    yield "complet", lambda: json.dumps(full).encode()
+    for context in (None, 200):
+        label = "compact" if context is None else f"compact, contexte {context}"
+        yield label, lambda context=context: json.dumps(
+            {"compact_diff": compact_diff(text_diff.to_data(), context), "stats": text_diff.stats(),
+             "complete": text_diff.complete}).encode()
+
+def bench_wire_format(page_counts=(50, 200)):
+    """Taille et temps de sérialisation de la diff texte selon le format et la compression."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as directory:
+        pairs = [("devis_multi", os.path.join(root, "devis_multi_v1.pdf"), os.path.join(root, "devis_multi_v2.pdf"))]
+        for num_pages in page_counts:
+            file1, file2, _ = make_quote_corpus(os.path.join(directory, str(num_pages)), num_pages)
+            pairs.append((f"devis de {num_pages} pages", file1, file2))
+        compressors = [("gzip", lambda data: zlib.compress(data, GZIP_LEVEL))]
+        if brotli is not None:
+            compressors.append(("br", lambda data: brotli.compress(data, quality=BROTLI_QUALITY)))
+        print("Diff texte par format : octets, sérialisation, puis compression")
+        for name, file1, file2 in pairs:
+            text_diff = diff_texts(ingest_document(file1, render=False).text,
+                                   ingest_document(file2, render=False).text)
+            print(f"  {name} :")
+            for label, serialize in _wire_formats(text_diff):
+                t, body = timed(serialize, repeat=3)
+                line = f"    {label:22} {len(body):10d} o {t * 1000:7.1f} ms"
+                for encoding, compress in compressors:
+                    t, compressed = timed(compress, body, repeat=3)
+                    line += f" | {encoding} {len(compressed):9d} o {t * 1000:6.1f} ms"
+                print(line)
+
+def _overlay_images(files, cache, directory):
+    # Comparaisons successives de la référence (pages annotées rendues, comparaison absente du
+    # cache ; pages inchangées servies par les images des documents)
+    comparisons = ComparisonCache(directory)
+    comparisons.clear()
+    produced = 0
+    baseline = ingest_document(files[0], cache, render=False)
+    for revision in files[1:]:
+        doc = ingest_document(revision, cache, render=False)
+        entry = open_comparison(baseline, doc, "char", comparisons)
+        for page in render_comparison_pages(entry, baseline, doc, list(range(1, len(entry.pages) + 1))):
+            if page["unchanged"]:
+                document_page_image(baseline, page["page1"] - 1)
+                document_page_image(doc, page["page2"] - 1)
+                continue
+            for side in ("img1", "img2"):
+                if page[side]:
+                    produced += len(entry.load_image(page["page"], side))
+    return produced
+
+def _overlay_data(files, cache, directory):
+    # Mêmes comparaisons, surlignages en données sur les pages non annotées des documents
+    comparisons = ComparisonCache(directory)
+    comparisons.clear()
+    produced = 0
+    baseline = ingest_document(files[0], cache, render=False)
+    for revision in files[1:]:
+        doc = ingest_document(revision, cache, render=False)
+        entry = open_comparison(baseline, doc, "char", comparisons)
+        produced += len(json.dumps([page["highlights"] for page in entry.pages]))
+        for page in entry.pages:
+            document_page_image(baseline, page["page1"] - 1)
+            document_page_image(doc, page["page2"] - 1)
+    return produced
+
+def bench_overlay(num_revisions=4, num_pages=20):
+    """Surlignage incrusté dans les images ou envoyé en données, référence contre plusieurs révisions."""
+    with tempfile.TemporaryDirectory() as directory:
+        files = []
+        for k in range(num_revisions):
+            revision_dir = os.path.join(directory, f"r{k}")
+            os.makedirs(revision_dir)
+            baseline, revision, _ = make_quote_corpus(revision_dir, num_pages, PAGE_EDIT_RATE,
+                                                      edited_pages=set(range(1, num_pages + 1, k + 2)))
+            files = files or [baseline]
+            files.append(revision)
+        comparisons_dir = os.path.join(directory, "comparisons")
+        print(f"Référence contre {num_revisions} révisions de {num_pages} pages, toutes les pages affichées :")
+        for label, fn in (("images annotées", _overlay_images), ("surlignages en données", _overlay_data)):
+            # Documents analysés et rastérisés (upload), sans image encodée
+            cache = DocumentCache(os.path.join(directory, label.split()[0]))
+            for path in files:
+                ingest_document(path, cache)
+            t_first, produced = timed(fn, files, cache, comparisons_dir, repeat=1)
+            t_again, _ = timed(fn, files, cache, comparisons_dir, repeat=3)
+            print(f"  {label:24} : {t_first * 1000:8.1f} ms, puis {t_again * 1000:8.1f} ms "
+                  f"(comparaisons refaites) ; {produced / 1e3:8.1f} Ko par série")
+
+def _synthetic_pages(n, num_pages):
+    # Pages d'un devis sous forme de mots positionnés, sans PDF : seul l'index est mesuré
+    pages = []
+    for p in range(1, num_pages + 1):
+        lines = [f"Fournisseur SUPPLIER{n:05d} Devis REF-{n}-{p} page {p}"] + [
+            f"Article {p}.{k}: prestation {k} {k} x {100 + (n + p * k) % 900}.00 €" for k in range(1, 30)
+        ]
+        words = [
+            {"text": text, "x0": 50.0 + 40 * i, "x1": 85.0 + 40 * i, "top": 50.0 + 20 * row, "bottom": 62.0 + 20 * row}
+            for row, line in enumerate(lines) for i, text in enumerate(line.split())
+        ]
+        pages.append({"words": words, "width": 595.0, "height": 842.0})
+    return pages
+
+def bench_search(num_documents=3000, num_pages=5):
+    """Index plein texte : ajout d'un document et temps de réponse des requêtes."""
+    with tempfile.TemporaryDirectory() as directory:
+        index = SearchIndex(os.path.join(directory, "search.sqlite3"))
+        start = time.perf_counter()
+        for n in range(num_documents):
+            index.add(f"{n:064x}", _synthetic_pages(n, num_pages))
+        elapsed = time.perf_counter() - start
+        print(f"Index de {num_documents} documents de {num_pages} pages : "
+              f"{elapsed / num_documents * 1000:.2f} ms par document, "
+              f"{os.path.getsize(os.path.join(directory, 'search.sqlite3')) / 1e6:.0f} Mo")
+        for query, phrase in (("SUPPLIER01234", False), ("REF-1234-3", False), ("supplier01234 prestation", False),
+                              ("prestation 7 7", True), ("article prestation", False)):
+            t, results = timed(index.search, query, phrase, repeat=5)
+            print(f"  {query!r:30} {'(phrase)' if phrase else '        '} : {t * 1000:8.2f} ms, {len(results)} page(s)")
+        t, _ = timed(index.remove, f"{0:064x}", repeat=1)
+        print(f"  suppression d'un document : {t * 1000:8.2f} ms")
+
+def _peak_rss_child(num_pages, queue):
+    # Pipeline du serveur (ingestion sans rendu, diff, rendu de toutes les pages)
+    with tempfile.TemporaryDirectory() as directory:
+        file1, file2, _ = make_quote_corpus(directory, num_pages)
+        start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        cache = DocumentCache(os.path.join(directory, "cache"))
+        comparisons = ComparisonCache(os.path.join(directory, "comparisons"))
+        doc1 = ingest_document(file1, cache, render=False)
+        doc2 = ingest_document(file2, cache, render=False)
+        entry = open_comparison(doc1, doc2, "char", comparisons)
+        for _ in render_comparison_pages(entry, doc1, doc2, list(range(1, num_pages + 1))):
+            pass
+        queue.put((start_rss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+def bench_memory(page_counts=(10, 50, 100)):
+    """Pic de mémoire résidente d'une comparaison complète selon le nombre de pages."""
+    context = multiprocessing.get_context("spawn")
+    print("Pic de mémoire (RSS) d'une comparaison complète :")
+    for num_pages in page_counts:
+        queue = context.Queue()
+        process = context.Process(target=_peak_rss_child, args=(num_pages, queue))
+        process.start()
+        start_rss, peak_rss = queue.get()
+        process.join()
+        print(f"  {num_pages:4d} pages : {peak_rss / 1024:7.1f} Mo (après génération du corpus : {start_rss / 1024:7.1f} Mo)")
+
+def bench_pipeline(file1=None, file2=None):
+    """Ingestion et comparaison complète d'une paire de devis, sans cache puis avec."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    file1 = file1 or os.path.join(root, "devis_multi_v1.pdf")
+    file2 = file2 or os.path.join(root, "devis_multi_v2.pdf")
+    print(f"Benchmark : {os.path.basename(file1)} / {os.path.basename(file2)}")
+
+    t, _ = timed(ingest_document, file1)
+    print(f"Ingestion (texte + mots + rasters, sans cache) : {t * 1000:8.1f} ms")
+
+    t, _ = timed(compare, file1, file2)
+    print(f"Comparaison complète, sans cache              : {t * 1000:8.1f} ms")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = DocumentCache(cache_dir)
+        t, _ = timed(compare, file1, file2, cache, repeat=1)
+        print(f"Comparaison complète, cache froid             : {t * 1000:8.1f} ms")
+        t, _ = timed(ingest_document, file1, cache)
+        print(f"Ingestion, cache chaud                        : {t * 1000:8.1f} ms")
+        t, _ = timed(compare, file1, file2, cache)
+        print(f"Comparaison complète, cache chaud             : {t * 1000:8.1f} ms")
+
+# Sous-commandes : nom de la mesure sans le préfixe bench_
+BENCHMARKS = {bench.__name__[len("bench_"):]: bench for bench in (
+    bench_pipeline, bench_workers, bench_unchanged_pages, bench_pixel_diff, bench_batch,
+    bench_search, bench_wire_format, bench_overlay, bench_memory)}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Mesures ciblées de la comparaison de devis")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, bench in BENCHMARKS.items():
+        command = commands.add_parser(name, help=bench.__doc__)
+        if bench is bench_pipeline:
+            command.add_argument("file1", nargs="?", help="version 1 (défaut : devis_multi_v1.pdf)")
+            command.add_argument("file2", nargs="?", help="version 2 (défaut : devis_multi_v2.pdf)")
+    commands.add_parser("all", help="toutes les mesures à la suite (plusieurs minutes)")
+
+    args = parser.parse_args(argv)
+    if args.command == "all":
+        for bench in BENCHMARKS.values():
+            print("-" * 50)
+            bench()
+    elif args.command == "pipeline":
+        bench_pipeline(args.file1, args.file2)
+    else:
+        BENCHMARKS[args.command]()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
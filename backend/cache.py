@@ -0,0 +1,335 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from PIL import Image
+
+META_FILENAME = "meta.json"
+
+# Résultat de la diff texte d'une comparaison, stocké à part pour garder meta.json léger
+TEXT_FILENAME = "text.json"
+
+# Format des pages annotées servies au navigateur
+IMAGE_EXTENSION = "webp"
+
+
+def file_sha256(file_path: str) -> str:
+    """Empreinte SHA-256 du contenu d'un fichier (lecture par blocs)."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def page_content_hash(page: dict) -> str:
+    """Empreinte du contenu d'une page (texte et mots avec leurs positions)."""
+    payload = json.dumps([page["text"], page["words"]], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def save_png_atomic(image: Image.Image, path: str):
+    """Écriture atomique : un lecteur concurrent ne voit jamais de PNG tronqué."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    image.save(tmp_path, format="PNG", compress_level=1)
+    os.replace(tmp_path, path)
+
+
+def save_bytes_atomic(data: bytes, path: str):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_bytes(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class CachedDocument:
+    """
+    Données extraites d'un PDF : texte et mots (avec coordonnées) par page.
+    Les rasters des pages sont stockés à côté, sur disque, et chargés à la demande.
+    """
+
+    def __init__(self, sha256: str, directory: Optional[str], pages: List[dict]):
+        self.sha256 = sha256
+        self.directory = directory
+        # Chaque page : {"text": str, "words": [...], "width": float, "height": float, "hash": str}
+        self.pages = pages
+        # Sans dossier (hors cache), les rasters restent en mémoire
+        self._rasters = {}
+        # Chemin du PDF analysé (non persisté) : permet de refaire un rendu de page
+        self.source_path: Optional[str] = None
+
+    def to_meta(self) -> dict:
+        return {"pages": self.pages}
+
+    @classmethod
+    def from_meta(cls, sha256: str, directory: str, meta: dict) -> "CachedDocument":
+        pages = meta["pages"]
+        for page in pages:
+            # Entrées écrites avant l'ajout des empreintes de pages
+            if "hash" not in page:
+                page["hash"] = page_content_hash(page)
+        return cls(sha256, directory, pages)
+
+    @property
+    def text(self) -> str:
+        return "".join(page["text"] + "\n" for page in self.pages)
+
+    def raster_path(self, index: int) -> str:
+        return os.path.join(self.directory, f"page_{index + 1}.png")
+
+    def load_raster(self, index: int) -> Optional[Image.Image]:
+        if self.directory is None:
+            return self._rasters.get(index)
+        path = self.raster_path(index)
+        if not os.path.exists(path):
+            return None
+        with Image.open(path) as img:
+            img.load()
+            return img
+
+    def store_raster(self, index: int, image: Image.Image):
+        if self.directory is None:
+            self._rasters[index] = image
+            return
+        # L'entrée a pu être évincée pendant l'analyse : on recrée son dossier
+        os.makedirs(self.directory, exist_ok=True)
+        save_png_atomic(image, self.raster_path(index))
+
+    def image_path(self, index: int) -> str:
+        # Page non annotée, encodée pour le navigateur (pages inchangées d'une comparaison)
+        return os.path.join(self.directory, f"page_{index + 1}.{IMAGE_EXTENSION}")
+
+    def load_image(self, index: int) -> Optional[bytes]:
+        return load_bytes(self.image_path(index))
+
+    def store_image(self, index: int, data: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        save_bytes_atomic(data, self.image_path(index))
+
+
+class CachedComparison:
+    """
+    Pages annotées d'une comparaison, encodées une seule fois puis servies telles quelles.
+    `sha256` est l'empreinte de la paire de documents et des options de comparaison.
+    """
+
+    def __init__(self, sha256: str, directory: str, pages: List[dict], info: Optional[dict] = None):
+        self.sha256 = sha256
+        self.directory = directory
+        # Chaque page : {"page": int, "img1": bool, "img2": bool, "size1", "size2", "deleted", "inserted"}
+        # img1/img2 indiquent si la page existe dans le document ; l'image est produite à la demande
+        self.pages = pages
+        # Documents comparés et options : {"doc1", "doc2", "source1", "source2", "mode"}
+        self.info = info or {}
+
+    def to_meta(self) -> dict:
+        return {"pages": self.pages, "info": self.info}
+
+    @classmethod
+    def from_meta(cls, sha256: str, directory: str, meta: dict) -> "CachedComparison":
+        return cls(sha256, directory, meta["pages"], meta.get("info"))
+
+    def has_image(self, page: int, side: str) -> bool:
+        return os.path.exists(self.image_path(page, side))
+
+    def image_path(self, page: int, side: str) -> str:
+        return os.path.join(self.directory, f"page_{page}_{side}.{IMAGE_EXTENSION}")
+
+    def store_image(self, page: int, side: str, data: bytes):
+        # L'entrée a pu être évincée pendant le rendu : on recrée son dossier
+        os.makedirs(self.directory, exist_ok=True)
+        save_bytes_atomic(data, self.image_path(page, side))
+
+    def load_image(self, page: int, side: str) -> Optional[bytes]:
+        return load_bytes(self.image_path(page, side))
+
+    def store_text(self, data: dict):
+        """Diff texte de la comparaison : {"html_diff", "raw_diff", "stats"}."""
+        path = os.path.join(self.directory, TEXT_FILENAME)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load_text(self) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.directory, TEXT_FILENAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+class DocumentCache:
+    """
+    Cache des extractions PDF indexé par l'empreinte du contenu.
+    Persistant sur disque (un dossier par document), borné en nombre de documents
+    avec éviction LRU. L'ordre LRU survit aux redémarrages via la date de modification
+    de meta.json, mise à jour à chaque accès.
+    """
+
+    entry_class = CachedDocument
+
+    def __init__(self, directory: str, max_documents: int = 64):
+        self.directory = directory
+        self.max_documents = max_documents
+        self._lock = threading.Lock()
+        # sha256 -> CachedDocument (None tant que les métadonnées ne sont pas relues)
+        self._entries: "OrderedDict[str, Optional[CachedDocument]]" = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def __contains__(self, sha256: str) -> bool:
+        with self._lock:
+            return sha256 in self._entries
+
+    def _entry_dir(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256)
+
+    def create(self, sha256: str) -> CachedDocument:
+        """
+        Prépare le dossier d'une nouvelle entrée pour y écrire les rasters pendant l'analyse.
+        L'entrée n'est visible qu'après `put`, qui écrit meta.json en dernier.
+        """
+        entry_dir = self._entry_dir(sha256)
+        os.makedirs(entry_dir, exist_ok=True)
+        return self.entry_class(sha256, entry_dir, [])
+
+    def _load_index(self):
+        found = []
+        for name in os.listdir(self.directory):
+            meta_path = os.path.join(self.directory, name, META_FILENAME)
+            if os.path.isfile(meta_path):
+                found.append((os.stat(meta_path).st_mtime, name))
+            elif os.path.isdir(os.path.join(self.directory, name)):
+                # Entrée incomplète (arrêt pendant une écriture)
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        for _, name in sorted(found):
+            self._entries[name] = None
+        self._evict()
+
+    def _read_entry(self, sha256: str) -> Optional[CachedDocument]:
+        entry_dir = self._entry_dir(sha256)
+        try:
+            with open(os.path.join(entry_dir, META_FILENAME), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return self.entry_class.from_meta(sha256, entry_dir, meta)
+
+    def get(self, sha256: str) -> Optional[CachedDocument]:
+        with self._lock:
+            if sha256 not in self._entries:
+                return None
+            doc = self._entries[sha256]
+            if doc is None:
+                doc = self._read_entry(sha256)
+                if doc is None:
+                    del self._entries[sha256]
+                    self._forget(sha256)
+                    return None
+                self._entries[sha256] = doc
+            self._entries.move_to_end(sha256)
+        try:
+            os.utime(os.path.join(doc.directory, META_FILENAME))
+        except OSError:
+            pass
+        return doc
+
+    def put(self, doc: CachedDocument) -> CachedDocument:
+        sha256 = doc.sha256
+        meta_path = os.path.join(doc.directory, META_FILENAME)
+        os.makedirs(doc.directory, exist_ok=True)
+        tmp_path = f"{meta_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(doc.to_meta(), f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+
+        with self._lock:
+            self._entries[sha256] = doc
+            self._entries.move_to_end(sha256)
+            self._indexed(sha256, doc)
+            self._evict()
+        return doc
+
+    def _indexed(self, sha256: str, entry):
+        # Entrée ajoutée à l'index (appelé sous le verrou) : index secondaires des sous-classes
+        pass
+
+    def _forget(self, sha256: str):
+        # Entrée retirée de l'index (appelé sous le verrou)
+        pass
+
+    def _evict(self):
+        while len(self._entries) > self.max_documents:
+            sha256, _ = self._entries.popitem(last=False)
+            self._forget(sha256)
+            shutil.rmtree(self._entry_dir(sha256), ignore_errors=True)
+
+    def invalidate(self, sha256: str):
+        with self._lock:
+            if sha256 in self._entries:
+                del self._entries[sha256]
+                self._forget(sha256)
+            shutil.rmtree(self._entry_dir(sha256), ignore_errors=True)
+
+    def clear(self):
+        with self._lock:
+            for sha256 in list(self._entries):
+                shutil.rmtree(self._entry_dir(sha256), ignore_errors=True)
+                self._forget(sha256)
+            self._entries.clear()
+
+
+class ComparisonCache(DocumentCache):
+    """Même cache disque LRU, pour les pages annotées des comparaisons."""
+
+    entry_class = CachedComparison
+
+    def __init__(self, directory: str, max_documents: int = 64):
+        # Contenu d'un document -> comparisons qui l'utilisent, et l'inverse
+        self._by_document: Dict[str, Set[str]] = {}
+        self._documents: Dict[str, Tuple[str, ...]] = {}
+        super().__init__(directory, max_documents)
+
+    def _load_index(self):
+        super()._load_index()
+        # Documents de chaque comparaison, lus une fois au démarrage (entrées toujours
+        # chargées à la demande)
+        for key in list(self._entries):
+            entry = self._read_entry(key)
+            if entry is not None:
+                self._indexed(key, entry)
+
+    def _indexed(self, key: str, entry: CachedComparison):
+        docs = tuple(sha for sha in (entry.info.get("doc1"), entry.info.get("doc2")) if sha)
+        self._documents[key] = docs
+        for sha in docs:
+            self._by_document.setdefault(sha, set()).add(key)
+
+    def _forget(self, key: str):
+        for sha in self._documents.pop(key, ()):
+            keys = self._by_document.get(sha)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_document[sha]
+
+    def invalidate_document(self, sha256: str):
+        """Supprime les comparaisons dont l'un des deux documents a le contenu `sha256`."""
+        with self._lock:
+            keys = list(self._by_document.get(sha256, ()))
+        for key in keys:
+            self.invalidate(key)
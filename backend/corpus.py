@@ -0,0 +1,95 @@
+import os
+import random
+from typing import Optional, Set
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+# Lignes du tableau de prix par page (tableau dense, police 8 pt)
+ROWS_PER_PAGE = 40
+
+# Colonnes : référence, désignation, quantité, prix unitaire, total (abscisses en points)
+COLUMNS = (40, 110, 360, 420, 495)
+
+DESIGNATIONS = (
+    "Câble cuivre 3G2.5", "Disjoncteur 20A", "Gaine ICTA 20mm", "Tableau 3 rangées",
+    "Prise 2P+T", "Interrupteur va-et-vient", "Main d'oeuvre électricien", "Spot LED encastré",
+    "Goulotte 60x40", "Détecteur de fumée", "Boîte de dérivation", "Câble RJ45 cat6",
+)
+
+
+def _quote_rows(rng: random.Random, page_id: int, rows_per_page: int) -> list:
+    rows = []
+    for k in range(1, rows_per_page + 1):
+        quantity = rng.randint(1, 50)
+        unit_price = rng.randint(100, 99900) / 100
+        rows.append([f"REF-{page_id:04d}-{k:02d}", rng.choice(DESIGNATIONS), quantity, unit_price])
+    return rows
+
+
+def _draw_page(c: canvas.Canvas, title: str, rows: list):
+    width, height = A4
+    c.setFont("Helvetica-Bold", 11)
+    c.drawString(COLUMNS[0], height - 50, title)
+    c.setFont("Helvetica", 8)
+    top = height - 75
+    row_height = (top - 60) / max(len(rows), 1)
+    for k, (reference, designation, quantity, unit_price) in enumerate(rows):
+        y = top - k * row_height
+        c.line(COLUMNS[0] - 4, y, width - 40, y)
+        c.drawString(COLUMNS[0], y - row_height + 4, reference)
+        c.drawString(COLUMNS[1], y - row_height + 4, designation)
+        c.drawRightString(COLUMNS[2] + 30, y - row_height + 4, str(quantity))
+        c.drawRightString(COLUMNS[3] + 55, y - row_height + 4, f"{unit_price:.2f} €")
+        c.drawRightString(width - 44, y - row_height + 4, f"{quantity * unit_price:.2f} €")
+    c.showPage()
+
+
+def _write_pdf(path: str, pages: list):
+    c = canvas.Canvas(path, pagesize=A4)
+    for n, (page_id, rows) in enumerate(pages, 1):
+        _draw_page(c, f"Devis - lot {page_id} - page {n}/{len(pages)}", rows)
+    c.save()
+
+
+def make_quote_corpus(directory: str, num_pages: int = 10, edit_rate: float = 0.05,
+                      insert_rate: float = 0.0, delete_rate: float = 0.0,
+                      rows_per_page: int = ROWS_PER_PAGE, seed: int = 0,
+                      edited_pages: Optional[Set[int]] = None):
+    """
+    Deux versions d'un devis de `num_pages` pages de tableaux de prix denses, générées
+    de façon reproductible (`seed`). La version 2 modifie une proportion `edit_rate` des
+    lignes (quantité ou prix), sur les seules pages `edited_pages` (numéros à partir de 1)
+    si elles sont précisées, supprime une proportion `delete_rate` des pages et insère
+    après une proportion `insert_rate` des pages une page nouvelle. Retourne les chemins
+    des deux PDF et le décompte des modifications.
+    """
+    rng = random.Random(seed)
+    pages_v1 = [(n, _quote_rows(rng, n, rows_per_page)) for n in range(1, num_pages + 1)]
+    pages_v2 = []
+    edits = {"edited_rows": 0, "inserted_pages": 0, "deleted_pages": 0}
+    next_id = num_pages + 1
+    for page_id, rows in pages_v1:
+        if rng.random() < delete_rate:
+            edits["deleted_pages"] += 1
+            continue
+        new_rows = []
+        for reference, designation, quantity, unit_price in rows:
+            if (edited_pages is None or page_id in edited_pages) and rng.random() < edit_rate:
+                edits["edited_rows"] += 1
+                if rng.random() < 0.5:
+                    quantity += rng.randint(1, 5)
+                else:
+                    unit_price = round(unit_price * rng.uniform(0.8, 1.2), 2)
+            new_rows.append([reference, designation, quantity, unit_price])
+        pages_v2.append((page_id, new_rows))
+        if rng.random() < insert_rate:
+            edits["inserted_pages"] += 1
+            pages_v2.append((next_id, _quote_rows(rng, next_id, rows_per_page)))
+            next_id += 1
+
+    os.makedirs(directory, exist_ok=True)
+    file1 = os.path.join(directory, f"quote_{num_pages}p_v1.pdf")
+    file2 = os.path.join(directory, f"quote_{num_pages}p_v2.pdf")
+    _write_pdf(file1, pages_v1)
+    _write_pdf(file2, pages_v2)
+    return file1, file2, edits
@@ -0,0 +1,114 @@
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Optional, Tuple
+
+# États d'un job : en file, en cours, terminé, en échec
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_ERROR = "error"
+
+
+class Job:
+    """
+    Traitement exécuté en arrière-plan (comparaison, ingestion d'un document). Son
+    identifiant est une empreinte de contenu (paire de documents et options, ou
+    document seul) : deux demandes identiques partagent le même job.
+    """
+
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.status = JOB_PENDING
+        # Progression : pages prêtes sur le total (connu une fois le document ouvert)
+        self.pages_done = 0
+        self.total_pages: Optional[int] = None
+        # Exception levée par le job en échec
+        self.exception: Optional[BaseException] = None
+        # Paramètres de la première demande (noms de fichiers, mode)
+        self.params: dict = {}
+        # Signalé à la fin du job, en succès comme en échec
+        self.finished = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        return self.status in (JOB_PENDING, JOB_RUNNING)
+
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "pages_done": self.pages_done,
+            "total_pages": self.total_pages,
+        }
+
+
+class JobRegistry:
+    """
+    Registre de jobs avec déduplication des demandes en vol ("single-flight") : une
+    demande identique à un job en file ou en cours s'y rattache au lieu de relancer le
+    calcul. Les jobs terminés sont conservés (au plus `max_jobs`) pour consulter leur
+    état ; leurs résultats vivent dans les caches (comparaisons, documents).
+    `max_active` borne le nombre de jobs en file ou en cours (None : sans limite).
+    """
+
+    def __init__(self, executor: Executor, max_jobs: int = 256, max_active: Optional[int] = 32):
+        self.executor = executor
+        self.max_jobs = max_jobs
+        self.max_active = max_active
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def submit(self, job_id: str, fn, *args, params: Optional[dict] = None) -> Tuple[Optional[Job], bool]:
+        """
+        Lance `fn(job, *args)` en arrière-plan, sauf si un job actif porte déjà cet
+        identifiant. Retourne (job, créé) ; (None, False) si la file est pleine.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.active:
+                return job, False
+            if (self.max_active is not None
+                    and sum(1 for j in self._jobs.values() if j.active) >= self.max_active):
+                return None, False
+            job = Job(job_id)
+            job.params = params or {}
+            self._jobs[job_id] = job
+            self._jobs.move_to_end(job_id)
+            self._trim()
+        self.executor.submit(self._run, job, fn, args)
+        return job, True
+
+    def _run(self, job: Job, fn, args):
+        job.status = JOB_RUNNING
+        try:
+            fn(job, *args)
+            job.status = JOB_DONE
+        except Exception as e:
+            traceback.print_exc()
+            job.exception = e
+            job.status = JOB_ERROR
+        finally:
+            job.finished.set()
+
+    def wait(self, job_id: str) -> Optional[Job]:
+        """Attend la fin du job actif `job_id`, s'il y en a un ; retourne le job."""
+        job = self.get(job_id)
+        if job is not None and job.active:
+            job.finished.wait()
+        return job
+
+    def _trim(self):
+        # Les jobs actifs ne sont jamais oubliés
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[job_id]
+
+    def clear_finished(self):
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items() if not job.active]:
+                del self._jobs[job_id]
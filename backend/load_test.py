@@ -0,0 +1,116 @@
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from create_multipage_test import create_multi_page_pdf
+
+API_URL = os.environ.get("API_URL", "http://localhost:8000")
+
+def request(method, path, body=None, headers=None):
+    req = urllib.request.Request(API_URL + path, data=body, method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(req) as response:
+            response.read()
+            return response.status, response.headers
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers
+
+def upload(file_path):
+    # Multipart minimal, pour rester sans dépendance
+    boundary = uuid.uuid4().hex
+    filename = os.path.basename(file_path)
+    with open(file_path, "rb") as f:
+        content = f.read()
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        "Content-Type: application/pdf\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return request("POST", "/upload", body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+def make_pair(directory, index, num_pages):
+    """Paire de devis propre à chaque client (contenu unique : pas de cache partagé)."""
+    nonce = uuid.uuid4().hex
+    pages_v1, pages_v2 = [], []
+    for n in range(1, num_pages + 1):
+        lines = [f"Devis {nonce} - page {n}/{num_pages}", ""] + [
+            f"Article {n}.{k}: prestation {k}    {k} x {100 + n * k}.00 €" for k in range(1, 30)
+        ]
+        pages_v1.append(lines)
+        pages_v2.append(lines[:5] + [f"Article {n}.4: prestation révisée    4 x {130 + n}.00 €"] + lines[6:])
+    names = []
+    for version, pages in (("v1", pages_v1), ("v2", pages_v2)):
+        name = f"load_{index}_{version}.pdf"
+        create_multi_page_pdf(os.path.join(directory, name), pages)
+        upload(os.path.join(directory, name))
+        names.append(name)
+    return names
+
+def sample_latency(stop, latencies, interval=0.05):
+    while not stop.is_set():
+        start = time.perf_counter()
+        request("GET", "/versions")
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(interval)
+
+def compare_loop(stop, pair, statuses):
+    modes = ["char", "word", "line"]
+    i = 0
+    while not stop.is_set():
+        body = json.dumps({"file1": pair[0], "file2": pair[1], "mode": modes[i % len(modes)]}).encode()
+        status, headers = request("POST", "/compare-versions", body, {"Content-Type": "application/json"})
+        statuses.append(status)
+        if status == 503:
+            # Le serveur est saturé : on respecte le délai annoncé
+            stop.wait(float(headers.get("Retry-After", 1)))
+            continue
+        i += 1
+
+def summary(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    print(f"{label:<28} n={len(latencies):4d}  p50={statistics.median(latencies):7.1f} ms  "
+          f"p95={p95:7.1f} ms  max={latencies[-1]:7.1f} ms")
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    num_pages = int(sys.argv[3]) if len(sys.argv) > 3 else 40
+
+    print(f"Test de charge sur {API_URL} : {clients} clients, {duration:.0f} s, {num_pages} pages")
+    with tempfile.TemporaryDirectory() as directory:
+        pairs = [make_pair(directory, i, num_pages) for i in range(clients)]
+
+    # Latence de référence, sans comparaison en cours
+    stop = threading.Event()
+    idle = []
+    sampler = threading.Thread(target=sample_latency, args=(stop, idle))
+    sampler.start()
+    time.sleep(3)
+    stop.set()
+    sampler.join()
+
+    stop = threading.Event()
+    loaded, statuses = [], []
+    threads = [threading.Thread(target=sample_latency, args=(stop, loaded))]
+    threads += [threading.Thread(target=compare_loop, args=(stop, pair, statuses)) for pair in pairs]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    print("-" * 50)
+    summary("GET /versions au repos", idle)
+    summary("GET /versions sous charge", loaded)
+    counts = {code: statuses.count(code) for code in sorted(set(statuses))}
+    print(f"Réponses de /compare-versions : {counts}")
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,29 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import uvicorn
+import asyncio
+import contextvars
+import functools
+import time
 import os
-import shutil
-from typing import List, Optional
-from pydantic import BaseModel
-import glob
-from services import extract_text_from_pdf, compare_texts, compare_texts_data, generate_comparison_images
+import threading
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+import json
+import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from services import (ingest_document, open_comparison, open_comparisons, comparison_key, comparison_text,
+                      compact_diff, render_comparison_pages, document_page_image, parse_page_range,
+                      check_pdf, TEXT_DIFF_BUDGET)
+from jobs import JobRegistry, JOB_DONE, JOB_ERROR
+from cache import ComparisonCache, DocumentCache, IMAGE_EXTENSION
+from storage import InvalidUpload, UploadStore, UploadTooLarge
+from search import SearchIndex
+from compression import CompressionMiddleware
+import metrics
 
 app = FastAPI()
 
@@ -20,44 +36,373 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compression brotli/gzip des réponses JSON et NDJSON de plus de COMPRESSION_MIN_BYTES octets
+app.add_middleware(CompressionMiddleware,
+                   minimum_size=int(os.environ.get("COMPRESSION_MIN_BYTES", "1024")))
+
+# Profil cProfile par requête (`?profile=true`), désactivé par défaut : coûteux, et le
+# résumé expose le détail du code
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """
+    Durée de chaque requête par route (GET /metrics) et en-tête Server-Timing : durée
+    cumulée de chaque étape du traitement (extraction, diff_main, rendering, encoding...)
+    mesurée pendant la requête. Pour une réponse en flux, seules les étapes antérieures
+    au premier envoi y figurent. Avec `?profile=true` (si PROFILING_ENABLED=1), la
+    réponse est remplacée par le résumé cProfile du calcul de la comparaison.
+    """
+    profile = request.query_params.get("profile") in ("1", "true")
+    if profile and not PROFILING_ENABLED:
+        return JSONResponse(content={"error": "Profilage désactivé (PROFILING_ENABLED=1)"}, status_code=403)
+    timings, token = metrics.start_request(profile)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.end_request(token)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    metrics.observe_request(route.path if route is not None else "other", response.status_code, elapsed)
+    if "content-length" in response.headers:
+        metrics.record_bytes("response", int(response.headers["content-length"]))
+    server_timing = timings.server_timing(elapsed)
+    if timings.profiler is not None:
+        return PlainTextResponse(timings.profile_summary(), headers={
+            "Server-Timing": server_timing,
+            "X-Original-Status": str(response.status_code),
+        })
+    response.headers["Server-Timing"] = server_timing
+    return response
+
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Index plein texte des versions, mis à jour à l'analyse de chaque nouveau contenu et
+# à la suppression d'un contenu
+search_index = SearchIndex(os.path.join(UPLOAD_DIR, "search.sqlite3"))
+
+# Cache des extractions (texte, mots, rasters) indexé par empreinte du contenu
+CACHE_DIR = os.environ.get("CACHE_DIR", "cache")
+CACHE_MAX_DOCUMENTS = int(os.environ.get("CACHE_MAX_DOCUMENTS", "64"))
+document_cache = DocumentCache(CACHE_DIR, max_documents=CACHE_MAX_DOCUMENTS)
+
+# Pages annotées des comparaisons, encodées une fois et servies comme ressources binaires
+COMPARISON_CACHE_DIR = os.environ.get("COMPARISON_CACHE_DIR", "comparisons")
+COMPARISON_CACHE_MAX = int(os.environ.get("COMPARISON_CACHE_MAX", "256"))
+comparison_cache = ComparisonCache(COMPARISON_CACHE_DIR, max_documents=COMPARISON_CACHE_MAX)
+
+def collect_content(sha256: str):
+    """Contenu sans plus aucun nom (remplacé par un upload du même nom) : index et caches nettoyés."""
+    search_index.remove(sha256)
+    document_cache.invalidate(sha256)
+    comparison_cache.invalidate_document(sha256)
+
+# Uploads adressés par contenu (un blob par contenu, les noms en sont des alias) et
+# catalogue SQLite des versions ; un fichier qui ne s'ouvre pas comme PDF est refusé, et
+# les PDF déposés à plat dans uploads/ sont copiés au démarrage
+upload_store = UploadStore(UPLOAD_DIR, on_collect=collect_content, validate=check_pdf)
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", str(50 * 1024 * 1024)))
+
+# Pool de processus pour le rendu/surlignage des pages (1 = traitement séquentiel)
+COMPARE_WORKERS = int(os.environ.get("COMPARE_WORKERS", str(os.cpu_count() or 1)))
+_page_executor = None
+
+def get_page_executor():
+    """Pool créé à la première comparaison ; "spawn" évite de dupliquer l'état pdfium du parent."""
+    global _page_executor
+    if _page_executor is None and COMPARE_WORKERS > 1:
+        _page_executor = ProcessPoolExecutor(
+            max_workers=COMPARE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _page_executor
+
+# Contrôle d'admission : au plus MAX_CONCURRENT_COMPARISONS comparaisons à la fois,
+# exécutées hors de la boucle d'événements ; au-delà, réponse 503 immédiate
+MAX_CONCURRENT_COMPARISONS = int(os.environ.get("MAX_CONCURRENT_COMPARISONS", "2"))
+COMPARISON_RETRY_AFTER = int(os.environ.get("COMPARISON_RETRY_AFTER", "5"))
+comparison_slots = threading.BoundedSemaphore(MAX_CONCURRENT_COMPARISONS)
+comparison_executor = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_COMPARISONS, thread_name_prefix="comparison")
+
+def busy_response():
+    return JSONResponse(
+        content={"error": "Trop de comparaisons en cours, réessayez plus tard"},
+        status_code=503,
+        headers={"Retry-After": str(COMPARISON_RETRY_AFTER)},
+    )
+
+async def run_admitted(slots: threading.BoundedSemaphore, executor: ThreadPoolExecutor, fn, *args):
+    """Exécute `fn` dans `executor` si une place de `slots` est libre, sinon 503."""
+    if not slots.acquire(blocking=False):
+        return busy_response()
+    try:
+        # Le contexte suit dans le thread : étapes mesurées et profil de la requête en cours
+        work = functools.partial(contextvars.copy_context().run, metrics.run_profiled, fn, *args)
+        future = executor.submit(work)
+    except BaseException:
+        slots.release()
+        raise
+    # La place est rendue à la fin du calcul, et non quand la requête se termine : un
+    # client déconnecté n'arrête pas le thread, qui doit rester compté
+    future.add_done_callback(lambda _: slots.release())
+    return await asyncio.wrap_future(future)
+
+async def run_comparison_work(fn, *args):
+    """Exécute `fn` dans le pool de comparaisons si une place est libre, sinon 503."""
+    return await run_admitted(comparison_slots, comparison_executor, fn, *args)
+
+# Rendu à la demande des images de pages : pool à part, pour qu'un encodage WebP ne
+# dispute pas les places des comparaisons. Les demandes attendent leur tour dans la file
+# (au plus MAX_QUEUED_IMAGES en file ou en cours) au lieu d'être refusées
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+MAX_QUEUED_IMAGES = int(os.environ.get("MAX_QUEUED_IMAGES", "64"))
+image_slots = threading.BoundedSemaphore(MAX_QUEUED_IMAGES)
+image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+
+async def run_image_work(fn, *args):
+    """Exécute `fn` dans le pool des images, en file d'attente bornée (503 si elle est pleine)."""
+    return await run_admitted(image_slots, image_executor, fn, *args)
+
+# Jobs de comparaison asynchrones (POST /comparisons) : ils attendent une place de
+# comparaison au lieu d'être refusés ; au plus MAX_ACTIVE_JOBS jobs en file ou en cours
+MAX_ACTIVE_JOBS = int(os.environ.get("MAX_ACTIVE_JOBS", "32"))
+job_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_COMPARISONS, thread_name_prefix="job")
+jobs = JobRegistry(job_executor, max_jobs=COMPARISON_CACHE_MAX, max_active=MAX_ACTIVE_JOBS)
+
+# Ingestion en tâche de fond dès l'upload (texte, mots, empreintes et rasters des pages) ;
+# une comparaison qui arrive pendant l'ingestion l'attend au lieu de la refaire
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "1"))
+ingest_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+ingestions = JobRegistry(ingest_executor, max_jobs=CACHE_MAX_DOCUMENTS, max_active=None)
+
+@app.on_event("startup")
+def index_existing_uploads():
+    """Contenus présents avant l'index (ou déposés à plat) : analysés et indexés en tâche de fond."""
+    upload_store.import_directory(UPLOAD_DIR)
+    for sha256 in upload_store.blobs():
+        if sha256 not in search_index:
+            start_ingestion({"sha256": sha256})
+
+@app.on_event("shutdown")
+def shutdown_page_executor():
+    comparison_executor.shutdown(wait=False, cancel_futures=True)
+    image_executor.shutdown(wait=False, cancel_futures=True)
+    job_executor.shutdown(wait=False, cancel_futures=True)
+    ingest_executor.shutdown(wait=False, cancel_futures=True)
+    if _page_executor is not None:
+        _page_executor.shutdown(wait=False, cancel_futures=True)
+
+# Budget de temps (secondes) du diff texte d'une paire : par défaut, et maximum accepté
+# dans une requête (`diff_budget`)
+DEFAULT_DIFF_BUDGET = float(os.environ.get("TEXT_DIFF_BUDGET", str(TEXT_DIFF_BUDGET)))
+MAX_DIFF_BUDGET = float(os.environ.get("MAX_TEXT_DIFF_BUDGET", "10"))
+
+def diff_budget(requested: Optional[float]) -> float:
+    return min(requested, MAX_DIFF_BUDGET) if requested is not None else DEFAULT_DIFF_BUDGET
+
+# Format de la diff texte dans les réponses : complet (`html_diff`, `raw_diff`, `stats`) ou
+# compact (`compact_diff`, d'où le client reconstruit la vue, et `stats`)
+DiffFormat = Literal["full", "compact"]
+
+def text_payload(text: dict, diff_format: DiffFormat = "full", context: Optional[int] = None) -> dict:
+    """Champs de la diff texte d'une réponse ; `context` limite le texte commun envoyé (compact)."""
+    if diff_format == "full":
+        return text
+    return {"compact_diff": compact_diff(text["raw_diff"], context), "stats": text["stats"],
+            "complete": text["complete"]}
+
 class CompareRequest(BaseModel):
     file1: str
     file2: str
+    # Granularité du diff (texte et visuel) : caractère, mot ou ligne
+    mode: Literal["char", "word", "line"] = "char"
+    # Comparaison des rendus des pages en plus du texte (logos, tampons, signatures, scans)
+    pixels: bool = False
+    # Budget de temps du diff texte en secondes (au plus MAX_TEXT_DIFF_BUDGET)
+    diff_budget: Optional[float] = Field(None, gt=0)
+
+# Nombre maximal de révisions comparées à une référence en un seul appel
+MAX_BATCH_REVISIONS = int(os.environ.get("MAX_BATCH_REVISIONS", "50"))
+
+class BatchCompareRequest(BaseModel):
+    # Version de référence (ex. devis signé) et révisions à lui comparer
+    baseline: str
+    revisions: List[str]
+    mode: Literal["char", "word", "line"] = "char"
+    pixels: bool = False
+    diff_budget: Optional[float] = Field(None, gt=0)
+
+@app.get("/metrics")
+def get_metrics():
+    """Mesures au format Prometheus : durées par étape et par route, pages, octets, caches."""
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 def read_root():
     return {"message": "API de comparaison de devis est en ligne"}
 
 @app.get("/versions")
-def list_versions():
-    """Liste tous les fichiers PDF dans le dossier uploads, triés par date de modification"""
-    files = []
-    for filename in os.listdir(UPLOAD_DIR):
-        if filename.lower().endswith('.pdf'):
-            filepath = os.path.join(UPLOAD_DIR, filename)
-            stats = os.stat(filepath)
-            files.append({
-                "filename": filename,
-                "path": filepath,
-                "size": stats.st_size,
-                "created": stats.st_ctime,
-                "modified": stats.st_mtime
-            })
-    
-    # Tri par date de modification (le plus récent en dernier)
-    files.sort(key=lambda x: x['modified'])
-    return files
+def list_versions(response: Response, offset: int = 0, limit: Optional[int] = None):
+    """
+    Liste les PDF uploadés, triés par date de modification (le plus récent en dernier).
+    `offset`/`limit` paginent la liste ; le total est renvoyé dans l'en-tête X-Total-Count.
+    """
+    if offset < 0 or (limit is not None and limit < 0):
+        return JSONResponse(content={"error": "Pagination invalide"}, status_code=400)
+    response.headers["X-Total-Count"] = str(upload_store.count())
+    return [
+        {
+            "filename": version["filename"],
+            "path": upload_store.blob_path(version["sha256"]),
+            "sha256": version["sha256"],
+            "size": version["size"],
+            "created": version["created"],
+            "modified": version["modified"],
+            **ingestion_status(version)
+        }
+        for version in upload_store.list(offset, limit)
+    ]
+
+@app.get("/search")
+def search_versions(q: str, phrase: bool = False, limit: int = 50):
+    """
+    Recherche plein texte dans toutes les versions : pages contenant tous les mots de `q`
+    (la suite exacte avec `phrase`), groupées par version (la plus récente en premier),
+    avec les rectangles des mots trouvés en points PDF. Au plus `limit` pages sont
+    détaillées, toutes versions confondues ; `total_pages` compte toutes les pages trouvées.
+    """
+    if limit < 0:
+        return JSONResponse(content={"error": "Limite invalide"}, status_code=400)
+    found = {}
+    for sha256, page in search_index.search(q, phrase):
+        found.setdefault(sha256, []).append(page)
+    versions = upload_store.find(found)
+
+    # Rectangles lus pour les pages retenues seulement, une fois par contenu
+    pages_of = {}
+    remaining = limit
+    for version in versions:
+        sha256 = version["sha256"]
+        if sha256 in pages_of:
+            continue
+        pages_of[sha256] = []
+        for page in found[sha256][:remaining]:
+            hits = search_index.page_hits(sha256, page, q, phrase)
+            # None : contenu retiré de l'index entre-temps
+            if hits is not None:
+                pages_of[sha256].append({"page": page, **hits})
+        remaining -= len(pages_of[sha256])
+
+    return {
+        "query": q,
+        "total_pages": sum(len(found[sha256]) for sha256 in pages_of),
+        "results": [
+            {
+                "filename": version["filename"],
+                "sha256": version["sha256"],
+                "modified": version["modified"],
+                "pages": pages_of[version["sha256"]],
+            }
+            for version in versions
+            if pages_of[version["sha256"]]
+        ],
+    }
+
+def get_upload(filename: str) -> dict:
+    version = upload_store.get(filename)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Un ou plusieurs fichiers introuvables")
+    return version
+
+def run_ingestion_job(job, file_path: str):
+    if not os.path.exists(file_path):
+        # Contenu supprimé entre-temps (nom réattribué à un autre contenu, /reset)
+        return
+    def progress(done, total):
+        job.pages_done = done
+        job.total_pages = total
+    doc = ingest_document(file_path, document_cache, render=True, on_page=progress)
+    job.pages_done = job.total_pages = len(doc.pages)
+    upload_store.set_num_pages(doc.sha256, len(doc.pages))
+    if doc.sha256 not in search_index:
+        search_index.add(doc.sha256, doc.pages)
+
+def start_ingestion(version: dict):
+    sha256 = version["sha256"]
+    return ingestions.submit(sha256, run_ingestion_job, upload_store.blob_path(sha256))
+
+def ingestion_status(version: dict) -> dict:
+    """
+    État de l'analyse d'un upload : "pending"/"running" (avec progression), "done",
+    "error", ou None si le document n'a pas encore été analysé.
+    """
+    job = ingestions.get(version["sha256"])
+    if job is not None and job.status != JOB_DONE:
+        return {"ingestion": job.status, "num_pages": job.total_pages, "pages_done": job.pages_done}
+    if version["sha256"] not in document_cache:
+        return {"ingestion": None, "num_pages": version["num_pages"], "pages_done": 0}
+    return {"ingestion": JOB_DONE, "num_pages": version["num_pages"], "pages_done": version["num_pages"]}
+
+def ingest_upload(version: dict):
+    """Analyse (sans rendu) d'un upload, en attendant l'ingestion en tâche de fond si elle est en cours."""
+    ingestions.wait(version["sha256"])
+    doc = ingest_document(upload_store.blob_path(version["sha256"]), document_cache, render=False)
+    if version["num_pages"] is None:
+        upload_store.set_num_pages(doc.sha256, len(doc.pages))
+    return doc
+
+def check_upload_name(filename: Optional[str]) -> str:
+    if not filename or not filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Seuls les fichiers PDF sont acceptés")
+    return filename
 
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     try:
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        return {"filename": file.filename, "message": "Fichier uploadé avec succès"}
+        filename = check_upload_name(file.filename)
+        # Copie par blocs avec calcul de l'empreinte, hors de la boucle d'événements ;
+        # un contenu déjà connu n'est pas réécrit
+        version = await run_in_threadpool(upload_store.save, filename, file.file, MAX_UPLOAD_SIZE)
+        # Analyse du document en tâche de fond : la comparaison n'aura plus qu'à comparer
+        start_ingestion(version)
+        return {"filename": filename, "sha256": version["sha256"], "message": "Fichier uploadé avec succès"}
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    except UploadTooLarge as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
+    except InvalidUpload as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.put("/upload/{filename}")
+async def upload_file_stream(filename: str, request: Request):
+    """
+    Upload du corps brut de la requête sous le nom `filename`, écrit par blocs à mesure
+    de sa réception (sans fichier temporaire multipart intermédiaire).
+    """
+    try:
+        check_upload_name(filename)
+        writer = upload_store.writer(MAX_UPLOAD_SIZE)
+        try:
+            async for chunk in request.stream():
+                # Écriture et empreinte hors de la boucle d'événements
+                await run_in_threadpool(writer.write, chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        version = await run_in_threadpool(writer.commit, filename)
+        start_ingestion(version)
+        return {"filename": filename, "sha256": version["sha256"], "message": "Fichier uploadé avec succès"}
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    except UploadTooLarge as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
+    except InvalidUpload as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
@@ -65,47 +410,481 @@ async def upload_file(file: UploadFile = File(...)):
 def reset_files():
     """Supprime tous les fichiers uploadés"""
     try:
-        for filename in os.listdir(UPLOAD_DIR):
-            file_path = os.path.join(UPLOAD_DIR, filename)
-            if os.path.isfile(file_path):
-                os.unlink(file_path)
+        upload_store.clear()
+        search_index.clear()
+        document_cache.clear()
+        comparison_cache.clear()
+        jobs.clear_finished()
+        ingestions.clear_finished()
         return {"message": "Tous les fichiers ont été supprimés"}
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
-@app.post("/compare-versions")
-async def compare_versions(request: CompareRequest):
-    try:
-        file1_path = os.path.join(UPLOAD_DIR, request.file1)
-        file2_path = os.path.join(UPLOAD_DIR, request.file2)
-        
-        if not os.path.exists(file1_path) or not os.path.exists(file2_path):
-            raise HTTPException(status_code=404, detail="Un ou plusieurs fichiers introuvables")
+# Surlignage des pages : incrusté dans des images annotées par comparaison ("image"), ou
+# envoyé en données sur les images non annotées des documents ("data")
+OverlayMode = Literal["image", "data"]
 
-        # Extraction du texte
-        text1 = extract_text_from_pdf(file1_path)
-        text2 = extract_text_from_pdf(file2_path)
-        
-        # Comparaison texte
-        html_diff = compare_texts(text1, text2)
-        raw_diff = compare_texts_data(text1, text2)
+def page_urls(entry, page: dict, skip_unchanged: bool = False, overlay: OverlayMode = "image") -> dict:
+    """
+    Description publique d'une page : pages correspondantes des deux versions et statut
+    de l'alignement, URLs des images annotées et dimensions. Une page inchangée renvoie
+    aux images non annotées des documents (partagées entre comparaisons), ou à aucune
+    image si le client les ignore (`skip_unchanged`). Avec `overlay="data"`, toutes les
+    pages renvoient aux images non annotées, et les surlignages sont décrits par
+    `highlights` dans le repère `points1` / `points2` des pages.
+    """
+    urls = {
+        "page": page["page"],
+        "page1": page["page1"],
+        "page2": page["page2"],
+        "status": page["status"],
+        "unchanged": page["unchanged"],
+        "size1": page["size1"],
+        "size2": page["size2"],
+    }
+    for n, side in (("1", "img1"), ("2", "img2")):
+        if not page[side] or (page["unchanged"] and skip_unchanged):
+            urls[side] = None
+        elif page["unchanged"] or overlay == "data":
+            urls[side] = f"/documents/{entry.info['doc' + n]}/pages/{page['page' + n]}.{IMAGE_EXTENSION}"
+        else:
+            urls[side] = f"/comparisons/{entry.sha256}/pages/{page['page']}/{side}.{IMAGE_EXTENSION}"
+    if overlay == "data":
+        urls["points1"] = page["points1"]
+        urls["points2"] = page["points2"]
+        urls["highlights"] = page["highlights"]
+    return urls
+
+def comparison_pages(entry, doc1, doc2, page_numbers: list, overlay: OverlayMode):
+    """Pages demandées d'une comparaison, avec leurs images annotées rendues si besoin."""
+    if overlay == "data":
+        # Rien à rendre : les images des documents se rendent à leur première demande
+        return (entry.pages[n - 1] for n in page_numbers)
+    return render_comparison_pages(entry, doc1, doc2, page_numbers, get_page_executor(), COMPARE_WORKERS)
+
+def comparison_documents(entry):
+    """Documents d'une comparaison, relus du cache ou ré-analysés depuis les uploads."""
+    docs = []
+    for n in ("1", "2"):
+        doc = document_cache.get(entry.info["doc" + n])
+        source_path = entry.info["source" + n]
+        if doc is None:
+            if not source_path or not os.path.exists(source_path):
+                raise HTTPException(status_code=410, detail="Documents de la comparaison supprimés")
+            doc = ingest_document(source_path, document_cache, render=False)
+            if doc.sha256 != entry.info["doc" + n]:
+                raise HTTPException(status_code=410, detail="Documents de la comparaison modifiés")
+        elif not doc.source_path:
+            doc.source_path = source_path
+        docs.append(doc)
+    return docs
+
+def get_comparison_entry(comparison_id: str):
+    entry = comparison_cache.get(comparison_id) if re.fullmatch(r"[0-9a-f]{64}", comparison_id) else None
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Comparaison introuvable")
+    return entry
+
+def prepare_comparison(request: CompareRequest):
+    """Analyse (sans rendu) des deux documents, diff texte et diff des mots de toutes les pages."""
+    version1 = get_upload(request.file1)
+    version2 = get_upload(request.file2)
+
+    # Analyse des PDF en un seul parcours (mise en cache par empreinte du contenu, en
+    # général déjà faite à l'upload) ; sinon les pages ne sont rastérisées qu'à la demande
+    doc1 = ingest_upload(version1)
+    doc2 = ingest_upload(version2)
+    
+    entry = open_comparison(doc1, doc2, request.mode, comparison_cache, request.pixels)
+    # Comparaison texte : un seul diff, dont dérivent HTML, données brutes et statistiques,
+    # conservé avec la comparaison ; les régions modifiées d'un long document sont diffées
+    # en parallèle dans le pool
+    text = comparison_text(entry, doc1, doc2, diff_budget(request.diff_budget), get_page_executor())
+    return doc1, doc2, text, entry
+
+def run_compare_versions(request: CompareRequest, pages: Optional[str], skip_unchanged: bool,
+                         diff_format: DiffFormat, context: Optional[int], overlay: OverlayMode):
+    try:
+        doc1, doc2, text, entry = prepare_comparison(request)
+        page_numbers = parse_page_range(pages, len(entry.pages))
         
-        # Génération images visuelles
-        visual_diff = generate_comparison_images(file1_path, file2_path)
+        # Génération images visuelles (réutilisées si la paire a déjà été comparée)
+        rendered = comparison_pages(entry, doc1, doc2, page_numbers, overlay)
+        visual_diff = [page_urls(entry, page, skip_unchanged, overlay) for page in rendered]
         
         return JSONResponse(content={
-            "html_diff": html_diff,
-            "raw_diff": raw_diff,
+            "comparison_id": entry.sha256,
+            **text_payload(text, diff_format, context),
+            "num_pages": len(entry.pages),
             "visual_diff": visual_diff,
             "filename1": request.file1,
             "filename2": request.file2
         })
         
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
     except Exception as e:
         import traceback
         traceback.print_exc()
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+@app.post("/compare-versions")
+async def compare_versions(request: CompareRequest, pages: Optional[str] = None, skip_unchanged: bool = False,
+                           diff_format: DiffFormat = "full", context: Optional[int] = Query(None, ge=0),
+                           overlay: OverlayMode = "image"):
+    """
+    Compare deux versions. `pages` (ex. "1-3") limite le rendu des images à une fenêtre ;
+    les autres pages se chargent ensuite via GET /comparisons/{id}/pages. Avec
+    `skip_unchanged`, les pages inchangées sont listées sans image. `diff_format=compact`
+    remplace la diff HTML et brute par `compact_diff`, réduite au voisinage des
+    modifications avec `context`. `overlay=data` renvoie les surlignages en données
+    plutôt que des images annotées.
+    """
+    return await run_comparison_work(run_compare_versions, request, pages, skip_unchanged,
+                                     diff_format, context, overlay)
+
+@app.post("/compare-versions/stream")
+async def compare_versions_stream(request: CompareRequest, pages: Optional[str] = None, skip_unchanged: bool = False,
+                                  diff_format: DiffFormat = "full", context: Optional[int] = Query(None, ge=0),
+                                  overlay: OverlayMode = "image"):
+    """
+    Variante en flux (NDJSON) de /compare-versions : une ligne "text" avec la diff texte,
+    puis une ligne "page" par page annotée dès qu'elle est prête, puis "done".
+    La place de comparaison est occupée jusqu'à la fin du flux ; chaque étape s'exécute
+    dans le pool de comparaisons, mesurée comme les autres.
+    """
+    if not comparison_slots.acquire(blocking=False):
+        return busy_response()
+    running = None
+
+    def run_step(fn, *args):
+        nonlocal running
+        work = functools.partial(contextvars.copy_context().run, metrics.run_profiled, fn, *args)
+        running = comparison_executor.submit(work)
+        return asyncio.wrap_future(running)
+
+    def release():
+        # Une étape encore en cours (client déconnecté) garde la place jusqu'à sa fin
+        if running is not None and not running.done():
+            running.add_done_callback(lambda _: comparison_slots.release())
+        else:
+            comparison_slots.release()
+
+    try:
+        doc1, doc2, text, entry = await run_step(prepare_comparison, request)
+        page_numbers = parse_page_range(pages, len(entry.pages))
+        rendered = await run_step(comparison_pages, entry, doc1, doc2, page_numbers, overlay)
+    except HTTPException as e:
+        release()
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    except ValueError as e:
+        release()
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except BaseException:
+        release()
+        raise
+
+    async def events():
+        try:
+            yield json.dumps({
+                "type": "text",
+                "comparison_id": entry.sha256,
+                **text_payload(text, diff_format, context),
+                "num_pages": len(entry.pages),
+                "filename1": request.file1,
+                "filename2": request.file2
+            }) + "\n"
+            while True:
+                page = await run_step(next, rendered, None)
+                if page is None:
+                    break
+                yield json.dumps({"type": "page", **page_urls(entry, page, skip_unchanged, overlay)}) + "\n"
+            yield json.dumps({"type": "done"}) + "\n"
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+        finally:
+            release()
+
+    # Le générateur est démarré ici : même si le client se déconnecte avant la
+    # première lecture, sa fermeture exécutera le `finally` qui libère la place
+    stream = events()
+    first_line = await stream.__anext__()
+
+    async def body():
+        try:
+            yield first_line
+            async for line in stream:
+                yield line
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+def change_matrix_row(filename: str, entry, text: dict) -> dict:
+    """Ligne de la matrice des changements : comptes de la paire et page modifiée ou non."""
+    changed = [0 if page["unchanged"] else 1 for page in entry.pages]
+    return {
+        "filename": filename,
+        "comparison_id": entry.sha256,
+        "status_url": f"/comparisons/{entry.sha256}",
+        "num_pages": len(entry.pages),
+        "stats": text["stats"],
+        "pages_changed": sum(changed),
+        "changed": changed,
+    }
+
+def run_compare_batch(request: BatchCompareRequest):
+    try:
+        if not request.revisions:
+            raise ValueError("Aucune révision à comparer")
+        if len(request.revisions) > MAX_BATCH_REVISIONS:
+            raise ValueError(f"Trop de révisions (maximum {MAX_BATCH_REVISIONS})")
+        # Chaque document n'est analysé qu'une fois, même cité plusieurs fois
+        docs = {}
+        for filename in [request.baseline, *request.revisions]:
+            if filename not in docs:
+                docs[filename] = ingest_upload(get_upload(filename))
+        baseline = docs[request.baseline]
+        revisions = [docs[filename] for filename in request.revisions]
+
+        # Diff des paires en parallèle ; les images se rendent à la demande, paire par paire
+        budget = diff_budget(request.diff_budget)
+        entries = open_comparisons(baseline, revisions, request.mode, comparison_cache,
+                                   request.pixels, get_page_executor(), budget)
+        return {
+            "baseline": request.baseline,
+            "num_pages": len(baseline.pages),
+            "revisions": [
+                change_matrix_row(filename, entry, comparison_text(entry, baseline, doc, budget))
+                for filename, entry, doc in zip(request.revisions, entries, revisions)
+            ],
+        }
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.post("/compare-batch")
+async def compare_batch(request: BatchCompareRequest):
+    """
+    Compare une version de référence à plusieurs révisions en un appel et renvoie la
+    matrice des changements. Le détail d'une paire (diff texte, pages annotées) se
+    consulte ensuite via GET /comparisons/{comparison_id}.
+    """
+    return await run_comparison_work(run_compare_batch, request)
+
+def run_comparison_pages(comparison_id: str, pages: Optional[str], skip_unchanged: bool, overlay: OverlayMode):
+    try:
+        entry = get_comparison_entry(comparison_id)
+        page_numbers = parse_page_range(pages, len(entry.pages))
+        # Surlignages en données : ni documents à relire, ni rendu
+        doc1, doc2 = comparison_documents(entry) if overlay == "image" else (None, None)
+        rendered = comparison_pages(entry, doc1, doc2, page_numbers, overlay)
+        return {
+            "comparison_id": entry.sha256,
+            "num_pages": len(entry.pages),
+            "visual_diff": [page_urls(entry, page, skip_unchanged, overlay) for page in rendered],
+        }
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+@app.get("/comparisons/{comparison_id}/pages")
+async def get_comparison_pages(comparison_id: str, pages: Optional[str] = None, skip_unchanged: bool = False,
+                               overlay: OverlayMode = "image"):
+    """Rend (si nécessaire) une fenêtre de pages d'une comparaison existante, ex. ?pages=4-6."""
+    return await run_comparison_work(run_comparison_pages, comparison_id, pages, skip_unchanged, overlay)
+
+def run_comparison_job(job, request: CompareRequest):
+    """Corps d'un job : analyse, diff texte puis rendu de toutes les pages, avec progression."""
+    # Un job attend une place de comparaison plutôt que d'être refusé
+    with comparison_slots:
+        doc1, doc2, text, entry = prepare_comparison(request)
+        if entry.sha256 != job.id:
+            raise HTTPException(status_code=409, detail="Fichiers modifiés pendant la comparaison")
+        job.total_pages = len(entry.pages)
+        page_numbers = list(range(1, len(entry.pages) + 1))
+        for _ in render_comparison_pages(entry, doc1, doc2, page_numbers, get_page_executor(), COMPARE_WORKERS):
+            job.pages_done += 1
+
+def start_comparison_job(request: CompareRequest):
+    # L'identifiant ne dépend que des contenus et des options : les demandes identiques se rejoignent
+    job_id = comparison_key(get_upload(request.file1)["sha256"], get_upload(request.file2)["sha256"],
+                            request.mode, request.pixels)
+    params = {"filename1": request.file1, "filename2": request.file2}
+    return jobs.submit(job_id, run_comparison_job, request, params=params)
+
+@app.post("/comparisons", status_code=202)
+async def create_comparison_job(request: CompareRequest):
+    """
+    Lance une comparaison en arrière-plan et renvoie aussitôt son identifiant ; la
+    progression et le résultat se consultent via GET /comparisons/{id}.
+    """
+    try:
+        job, created = await run_in_threadpool(start_comparison_job, request)
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    if job is None:
+        return busy_response()
+    return JSONResponse(
+        content={
+            "comparison_id": job.id,
+            **job.to_dict(),
+            "created": created,
+            "status_url": f"/comparisons/{job.id}",
+        },
+        status_code=202,
+    )
+
+def comparison_result(comparison_id: str, job, skip_unchanged: bool = False,
+                      diff_format: DiffFormat = "full", context: Optional[int] = None,
+                      overlay: OverlayMode = "image", recompute: bool = False) -> Optional[dict]:
+    """
+    Résultat complet d'une comparaison terminée, relu depuis le cache des comparaisons.
+    Une diff texte incomplète (budget dépassé) n'y est pas conservée : sans `recompute`,
+    None ; avec, elle est refaite (à exécuter dans une place de comparaison).
+    """
+    entry = get_comparison_entry(comparison_id)
+    text = entry.load_text()
+    if text is None:
+        if not recompute:
+            return None
+        doc1, doc2 = comparison_documents(entry)
+        text = comparison_text(entry, doc1, doc2, DEFAULT_DIFF_BUDGET)
+    params = job.params if job is not None else {}
+    pages_done = sum(
+        1 for page in entry.pages
+        if page["unchanged"]
+        or all(not page[side] or entry.has_image(page["page"], side) for side in ("img1", "img2"))
+    )
+    return {
+        "comparison_id": entry.sha256,
+        "status": "done",
+        "pages_done": pages_done,
+        "total_pages": len(entry.pages),
+        **text_payload(text, diff_format, context),
+        "num_pages": len(entry.pages),
+        "visual_diff": [page_urls(entry, page, skip_unchanged, overlay) for page in entry.pages],
+        "filename1": params.get("filename1") or os.path.basename(entry.info.get("source1") or ""),
+        "filename2": params.get("filename2") or os.path.basename(entry.info.get("source2") or ""),
+    }
+
+@app.get("/comparisons/{comparison_id}")
+async def get_comparison(comparison_id: str, skip_unchanged: bool = False,
+                         diff_format: DiffFormat = "full", context: Optional[int] = Query(None, ge=0),
+                         overlay: OverlayMode = "image"):
+    """
+    État d'une comparaison : progression (pages prêtes sur le total) tant qu'elle est
+    en cours, puis résultat complet, disponible jusqu'à son éviction du cache.
+    """
+    job = jobs.get(comparison_id)
+    if job is not None and job.active:
+        return {"comparison_id": comparison_id, **job.to_dict()}
+    if job is not None and job.status == JOB_ERROR:
+        e = job.exception
+        error = e.detail if isinstance(e, HTTPException) else str(e)
+        return {"comparison_id": comparison_id, **job.to_dict(), "error": error}
+    try:
+        args = (comparison_id, job, skip_unchanged, diff_format, context, overlay)
+        result = await run_in_threadpool(comparison_result, *args)
+        if result is None:
+            # Diff texte à refaire : calcul borné comme les autres comparaisons (503 si occupé)
+            result = await run_comparison_work(comparison_result, *args, True)
+        return result
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+
+def comparison_page_entry(comparison_id: str, page: int, side: str):
+    entry = get_comparison_entry(comparison_id)
+    if not 1 <= page <= len(entry.pages) or not entry.pages[page - 1][side]:
+        raise HTTPException(status_code=404, detail="Image introuvable")
+    return entry
+
+def load_comparison_page(comparison_id: str, page: int, side: str) -> Optional[bytes]:
+    """Image annotée déjà rendue, ou None."""
+    return comparison_page_entry(comparison_id, page, side).load_image(page, side)
+
+def render_comparison_page(comparison_id: str, page: int, side: str) -> bytes:
+    entry = comparison_page_entry(comparison_id, page, side)
+    doc1, doc2 = comparison_documents(entry)
+    for _ in render_comparison_pages(entry, doc1, doc2, [page]):
+        pass
+    return entry.load_image(page, side)
+
+@app.get("/comparisons/{comparison_id}/pages/{page}/{side}.webp")
+async def get_comparison_page(comparison_id: str, page: int, side: str, request: Request):
+    """
+    Image annotée d'une page, servie en binaire et mise en cache par le navigateur.
+    Une page pas encore rendue l'est à la première demande, dans le pool des images.
+    """
+    if side not in ("img1", "img2"):
+        return JSONResponse(content={"error": "Ressource invalide"}, status_code=404)
+    # Le contenu d'une comparaison ne change jamais pour un identifiant donné
+    etag = f'"{comparison_id[:16]}-{page}-{side}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    try:
+        data = await run_in_threadpool(load_comparison_page, comparison_id, page, side)
+        if data is None:
+            data = await run_image_work(render_comparison_page, comparison_id, page, side)
+            if isinstance(data, Response):
+                return data
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    return Response(content=data, media_type=f"image/{IMAGE_EXTENSION}", headers=headers)
+
+def load_document_page(sha256: str, page: int) -> Optional[bytes]:
+    """Image non annotée déjà encodée, ou None."""
+    doc = document_cache.get(sha256)
+    if doc is None or not 1 <= page <= len(doc.pages):
+        return None
+    return doc.load_image(page - 1)
+
+def render_document_page(sha256: str, page: int) -> bytes:
+    doc = document_cache.get(sha256)
+    blob_path = upload_store.blob_path(sha256)
+    if doc is None and os.path.exists(blob_path):
+        # Document évincé du cache mais toujours présent dans le stockage
+        doc = ingest_document(blob_path, document_cache, render=False)
+    if doc is None or not 1 <= page <= len(doc.pages):
+        raise HTTPException(status_code=404, detail="Image introuvable")
+    if not doc.source_path:
+        doc.source_path = blob_path
+    return document_page_image(doc, page - 1)
+
+@app.get("/documents/{sha256}/pages/{page}.webp")
+async def get_document_page(sha256: str, page: int, request: Request):
+    """
+    Page d'un document sans surlignage, désignée par l'empreinte du contenu : image des
+    pages inchangées, encodée une seule fois et partagée par toutes les comparaisons.
+    L'encodage (et l'analyse d'un document évincé) passe par le pool des images.
+    """
+    etag = f'"{sha256[:16]}-{page}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    if not re.fullmatch(r"[0-9a-f]{64}", sha256):
+        return JSONResponse(content={"error": "Image introuvable"}, status_code=404)
+    try:
+        data = await run_in_threadpool(load_document_page, sha256, page)
+        if data is None:
+            data = await run_image_work(render_document_page, sha256, page)
+            if isinstance(data, Response):
+                return data
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    return Response(content=data, media_type=f"image/{IMAGE_EXTENSION}", headers=headers)
+
 # Garder l'ancien endpoint pour compatibilité temporaire si besoin, ou le supprimer
 @app.post("/compare")
 async def compare_files(file1: UploadFile = File(...), file2: UploadFile = File(...)):
@@ -0,0 +1,198 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# Bornes (secondes) des histogrammes : d'une page (quelques ms) à une comparaison complète
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Lignes du résumé cProfile renvoyé par requête (fonctions triées par temps cumulé)
+PROFILE_LINES = 40
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.label_names = name, help, labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Histogramme cumulatif au format Prometheus (bornes fixes, somme et nombre)."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: tuple = STAGE_BUCKETS):
+        self.name, self.help, self.label_names, self.buckets = name, help, labels, buckets
+        # Par jeu de labels : [compte par intervalle (+Inf compris), somme]
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][index] += 1
+            counts[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+stage_seconds = Histogram("quote_compare_stage_seconds",
+                          "Durée d'une étape du traitement (par page ou par document)", ("stage",))
+stage_pages = Counter("quote_compare_stage_pages_total", "Pages traitées par étape", ("stage",))
+produced_bytes = Counter("quote_compare_bytes_total", "Octets produits", ("kind",))
+cache_accesses = Counter("quote_compare_cache_total", "Accès aux caches", ("cache", "result"))
+request_seconds = Histogram("quote_compare_request_seconds", "Durée des requêtes HTTP",
+                            ("route",), REQUEST_BUCKETS)
+responses = Counter("quote_compare_responses_total", "Réponses HTTP", ("route", "status"))
+
+METRICS = (stage_seconds, stage_pages, produced_bytes, cache_accesses, request_seconds, responses)
+
+
+def render_metrics() -> str:
+    """Toutes les mesures au format texte de Prometheus (GET /metrics)."""
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+class RequestTimings:
+    """Durées cumulées par étape pendant une requête (en-tête Server-Timing) et profil optionnel."""
+
+    def __init__(self, profile: bool = False):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, float] = {}
+        self.profiler = cProfile.Profile() if profile else None
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self, total: float) -> str:
+        with self._lock:
+            parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        return ", ".join(parts + [f"total;dur={total * 1000:.1f}"])
+
+    def profile_summary(self) -> str:
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).strip_dirs().sort_stats("cumulative").print_stats(PROFILE_LINES)
+        return out.getvalue()
+
+
+# Mesures de la requête en cours (posées par le middleware, suivies dans les threads
+# du pool via la copie du contexte)
+_request: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+# Dans un worker (`captured`), les étapes sont collectées pour être renvoyées au parent
+_captured: ContextVar[Optional[list]] = ContextVar("captured_stages", default=None)
+
+
+def record_stage(stage: str, seconds: float, pages: int = 0):
+    captured = _captured.get()
+    if captured is not None:
+        captured.append((stage, seconds, pages))
+        return
+    stage_seconds.observe(seconds, stage)
+    if pages:
+        stage_pages.inc(pages, stage)
+    timings = _request.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def stage(name: str, pages: int = 0):
+    """Mesure la durée du bloc comme une observation de l'étape `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start, pages)
+
+
+@contextmanager
+def captured():
+    """
+    Collecte les étapes du bloc au lieu de les enregistrer : un worker d'un pool de
+    processus renvoie la liste avec son résultat, et le parent l'enregistre
+    (`merge_captured`).
+    """
+    stages = []
+    token = _captured.set(stages)
+    try:
+        yield stages
+    finally:
+        _captured.reset(token)
+
+
+def merge_captured(stages: List[tuple]):
+    for name, seconds, pages in stages:
+        record_stage(name, seconds, pages)
+
+
+def record_bytes(kind: str, size: int):
+    produced_bytes.inc(size, kind)
+
+
+def record_cache(cache: str, hit: bool):
+    cache_accesses.inc(1, cache, "hit" if hit else "miss")
+
+
+def start_request(profile: bool = False):
+    """Ouvre les mesures d'une requête ; renvoie (mesures, jeton pour `end_request`)."""
+    timings = RequestTimings(profile)
+    return timings, _request.set(timings)
+
+
+def end_request(token):
+    _request.reset(token)
+
+
+def observe_request(route: str, status: int, seconds: float):
+    request_seconds.observe(seconds, route)
+    responses.inc(1, route, str(status))
+
+
+def run_profiled(fn, *args):
+    """
+    Exécute `fn` sous cProfile si la requête en cours l'a demandé. cProfile ne suit que
+    le thread courant : à appeler dans le thread qui fait le travail.
+    """
+    timings = _request.get()
+    if timings is None or timings.profiler is None:
+        return fn(*args)
+    return timings.profiler.runcall(fn, *args)
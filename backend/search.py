@@ -0,0 +1,244 @@
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    num_pages INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT PRIMARY KEY,
+    df INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    positions BLOB NOT NULL,
+    PRIMARY KEY (term, doc, page)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings(doc);
+CREATE TABLE IF NOT EXISTS page_words (
+    doc INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    width REAL NOT NULL,
+    height REAL NOT NULL,
+    boxes BLOB NOT NULL,
+    PRIMARY KEY (doc, page)
+) WITHOUT ROWID;
+"""
+
+# Ponctuation retirée autour d'un mot ("(1", "an)", "HT:") ; celle de l'intérieur reste
+# ("5000.00", "REF-12/B")
+_EDGE_PUNCTUATION = re.compile(r"^[^\w€$£%]+|[^\w€$£%]+$")
+
+# Au-delà de ce nombre de pages candidates, les postings d'un terme sont lus en bloc
+# plutôt que page par page
+CANDIDATE_LOOKUP_LIMIT = 256
+
+
+def normalize_term(text: str) -> str:
+    """Forme indexée d'un mot : minuscules, sans accents ni ponctuation aux extrémités."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _EDGE_PUNCTUATION.sub("", text)
+
+
+def query_terms(query: str) -> List[str]:
+    return [term for term in (normalize_term(w) for w in query.split()) if term]
+
+
+def _pack(positions: List[int]) -> bytes:
+    return array("I", positions).tobytes()
+
+
+def _unpack(data: bytes) -> List[int]:
+    positions = array("I")
+    positions.frombytes(data)
+    return positions.tolist()
+
+
+class SearchIndex:
+    """
+    Index inversé du texte des versions uploadées, tenu à jour à chaque ajout ou
+    suppression de contenu (jamais reconstruit). Pour chaque terme et chaque page d'un
+    contenu (empreinte SHA-256), les positions du terme parmi les mots de la page ; les
+    rectangles des mots sont conservés à part pour surligner les occurrences trouvées.
+    Chaque terme garde le nombre de pages qui le contiennent : une requête part du
+    terme le plus rare.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def __contains__(self, sha256: str) -> bool:
+        with self._lock:
+            return self._doc_id(sha256) is not None
+
+    def _doc_id(self, sha256: str) -> Optional[int]:
+        row = self._db.execute("SELECT id FROM documents WHERE sha256 = ?", (sha256,)).fetchone()
+        return row[0] if row is not None else None
+
+    def add(self, sha256: str, pages: List[dict]):
+        """Indexe les pages (mots avec coordonnées, voir `ingest_document`) d'un contenu."""
+        page_terms = []
+        page_words = []
+        document_frequency = Counter()
+        for page_number, page in enumerate(pages, 1):
+            positions: Dict[str, List[int]] = {}
+            for position, word in enumerate(page["words"]):
+                term = normalize_term(word["text"])
+                if term:
+                    positions.setdefault(term, []).append(position)
+            page_terms.append((page_number, positions))
+            document_frequency.update(positions.keys())
+            boxes = array("f", [v for w in page["words"] for v in (w["x0"], w["top"], w["x1"], w["bottom"])])
+            page_words.append((page_number, page["width"], page["height"], boxes.tobytes()))
+
+        with self._lock, self._db:
+            if self._doc_id(sha256) is not None:
+                return
+            doc = self._db.execute(
+                "INSERT INTO documents (sha256, num_pages) VALUES (?, ?)", (sha256, len(pages))
+            ).lastrowid
+            self._db.executemany(
+                "INSERT INTO postings VALUES (?, ?, ?, ?)",
+                ((term, doc, page_number, _pack(term_positions))
+                 for page_number, positions in page_terms for term, term_positions in positions.items()),
+            )
+            self._db.executemany(
+                "INSERT INTO page_words VALUES (?, ?, ?, ?, ?)", ((doc, *row) for row in page_words)
+            )
+            self._db.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                document_frequency.items(),
+            )
+
+    def remove(self, sha256: str):
+        """Retire un contenu de l'index (blob supprimé)."""
+        with self._lock, self._db:
+            doc = self._doc_id(sha256)
+            if doc is None:
+                return
+            counts = self._db.execute(
+                "SELECT term, COUNT(*) FROM postings WHERE doc = ? GROUP BY term", (doc,)
+            ).fetchall()
+            self._db.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(n, term) for term, n in counts])
+            self._db.execute("DELETE FROM terms WHERE df <= 0")
+            self._db.execute("DELETE FROM postings WHERE doc = ?", (doc,))
+            self._db.execute("DELETE FROM page_words WHERE doc = ?", (doc,))
+            self._db.execute("DELETE FROM documents WHERE id = ?", (doc,))
+
+    def clear(self):
+        with self._lock, self._db:
+            for table in ("postings", "page_words", "terms", "documents"):
+                self._db.execute(f"DELETE FROM {table}")
+
+    def _pages_with(self, term: str, candidates: Optional[Set[Tuple[int, int]]]) -> Set[Tuple[int, int]]:
+        # Pages (doc, page) contenant `term`, lues dans la clé primaire sans les positions
+        if candidates is not None and len(candidates) <= CANDIDATE_LOOKUP_LIMIT:
+            return {
+                key for key in candidates
+                if self._db.execute(
+                    "SELECT 1 FROM postings WHERE term = ? AND doc = ? AND page = ?", (term, *key)
+                ).fetchone()
+            }
+        pages = set(self._db.execute("SELECT doc, page FROM postings WHERE term = ?", (term,)))
+        return pages if candidates is None else pages & candidates
+
+    def _positions(self, terms: List[str], doc: int, page: int) -> Dict[str, List[int]]:
+        rows = self._db.execute(
+            f"SELECT term, positions FROM postings WHERE doc = ? AND page = ? "
+            f"AND term IN ({','.join('?' * len(terms))})",
+            (doc, page, *terms),
+        )
+        return {term: _unpack(data) for term, data in rows}
+
+    def _phrase_pages(self, terms: List[str], distinct: List[str],
+                      pages: Set[Tuple[int, int]]) -> Set[Tuple[int, int]]:
+        # Peu de pages : positions lues page par page ; sinon, en bloc terme par terme
+        if len(pages) <= CANDIDATE_LOOKUP_LIMIT:
+            return {key for key in pages if self._match(terms, self._positions(distinct, *key), True)}
+        by_term = {}
+        for term in distinct:
+            rows = self._db.execute("SELECT doc, page, positions FROM postings WHERE term = ?", (term,))
+            by_term[term] = {(doc, page): data for doc, page, data in rows if (doc, page) in pages}
+        return {
+            key for key in pages
+            if self._match(terms, {term: _unpack(by_term[term][key]) for term in distinct}, True)
+        }
+
+    @staticmethod
+    def _match(terms: List[str], positions: Dict[str, List[int]], phrase: bool) -> List[int]:
+        """Positions des mots trouvés sur une page : toutes les occurrences, ou celles des suites exactes."""
+        if not (phrase and len(terms) > 1):
+            return sorted(set(p for term_positions in positions.values() for p in term_positions))
+        # Débuts de suite : positions du premier terme, recoupées avec celles du k-ième décalées de k
+        starts = set(positions[terms[0]])
+        for k, term in enumerate(terms[1:], 1):
+            starts &= {p - k for p in positions[term]}
+            if not starts:
+                return []
+        return [start + k for start in sorted(starts) for k in range(len(terms))]
+
+    def search(self, query: str, phrase: bool = False) -> List[Tuple[str, int]]:
+        """
+        Pages contenant tous les termes de `query` (ou la suite exacte des termes avec
+        `phrase`) : liste de (empreinte, page à partir de 1), triée par contenu puis par
+        page. Les positions ne sont lues que pour vérifier les suites exactes.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        distinct = list(dict.fromkeys(terms))
+        with self._lock:
+            frequencies = dict(self._db.execute(
+                f"SELECT term, df FROM terms WHERE term IN ({','.join('?' * len(distinct))})", distinct
+            ).fetchall())
+            if len(frequencies) < len(distinct):
+                return []
+            # Intersection en partant du terme le plus rare
+            pages = None
+            for term in sorted(distinct, key=frequencies.get):
+                pages = self._pages_with(term, pages)
+                if not pages:
+                    return []
+            if phrase and len(terms) > 1:
+                pages = self._phrase_pages(terms, distinct, pages)
+            sha256s = dict(self._db.execute(
+                f"SELECT id, sha256 FROM documents WHERE id IN ({','.join('?' * len({d for d, _ in pages}))})",
+                list({d for d, _ in pages}),
+            )) if pages else {}
+        return sorted((sha256s[doc], page) for doc, page in pages)
+
+    def page_hits(self, sha256: str, page: int, query: str, phrase: bool = False) -> Optional[dict]:
+        """
+        Dimensions de la page (points) et rectangles [x0, top, x1, bottom] des mots de
+        `query` trouvés sur cette page.
+        """
+        terms = query_terms(query)
+        with self._lock:
+            doc = self._doc_id(sha256)
+            row = self._db.execute(
+                "SELECT width, height, boxes FROM page_words WHERE doc = ? AND page = ?", (doc, page)
+            ).fetchone()
+            if row is None or not terms:
+                return None
+            positions = self._positions(list(dict.fromkeys(terms)), doc, page)
+        boxes = array("f")
+        boxes.frombytes(row[2])
+        hits = self._match(terms, positions, phrase) if len(positions) == len(set(terms)) else []
+        return {
+            "width": row[0],
+            "height": row[1],
+            "hits": [[round(v, 2) for v in boxes[4 * p:4 * p + 4]] for p in hits],
+        }
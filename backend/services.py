@@ -1,239 +1,877 @@
 import pdfplumber
 import diff_match_patch as dmp_module
-from PIL import Image, ImageDraw
+from PIL import Image
 import pypdfium2 as pdfium
 import io
-import base64
+import re
+import hashlib
+from bisect import bisect_right
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, Optional
+from alignment import align_pages, PAGE_DELETED, PAGE_INSERTED
+from text_alignment import align_lines
+from raster_diff import changed_regions
+from cache import (CachedComparison, CachedDocument, ComparisonCache, DocumentCache, file_sha256,
+                   load_bytes, page_content_hash, save_png_atomic)
+from metrics import captured, merge_captured, record_bytes, record_cache, stage
+
+# pypdfium2 scale=2 -> 144 DPI, les coordonnées pdfplumber sont en points (72 DPI)
+RENDER_SCALE = 2
+
+# Qualité WebP des pages annotées
+IMAGE_QUALITY = 90
+
+# Paires de pages en cours par worker du pool : borne la mémoire quelle que soit la longueur
+PAGES_IN_FLIGHT_PER_WORKER = 2
+
+# Granularités de diff : caractère (historique), mot ou ligne
+DIFF_MODES = ("char", "word", "line")
+
+# Version du format des entrées de comparaison : la changer écarte les entrées existantes
+COMPARISON_FORMAT = 6
+
+# Budget de temps (secondes) du diff texte d'une comparaison, partagé entre les régions
+# modifiées au prorata de leur taille ; une région atteinte après l'échéance est marquée
+# supprimée puis insérée en bloc
+TEXT_DIFF_BUDGET = 2.0
+
+# Délai de diff_main pour une région : sa part du temps restant (au prorata de sa
+# taille) multipliée par REGION_TIMEOUT_SLACK, la plupart des régions finissant bien
+# avant, et au moins MIN_REGION_TIMEOUT tant que le budget n'est pas épuisé
+REGION_TIMEOUT_SLACK = 4
+MIN_REGION_TIMEOUT = 0.05
+
+# Taille cumulée (caractères) des régions modifiées au-delà de laquelle elles sont
+# diffées par lots de DIFF_BATCH_CHARS dans le pool de processus
+PARALLEL_DIFF_MIN_CHARS = 100_000
+DIFF_BATCH_CHARS = 50_000
+
+# Clés conservées pour chaque mot (le reste de extract_words() n'est pas utilisé)
+WORD_KEYS = ("text", "x0", "x1", "top", "bottom")
 
 def extract_text_from_pdf(file_path: str) -> str:
-    text = ""
-    with pdfplumber.open(file_path) as pdf:
-        for page in pdf.pages:
-            text += page.extract_text() + "\n"
-    return text
+    return ingest_document(file_path, render=False).text
 
-def compare_texts(text1: str, text2: str) -> str:
+def ingest_document(file_path: str, cache: Optional[DocumentCache] = None, render: bool = True,
+                    on_page: Optional[Callable[[int, int], None]] = None) -> CachedDocument:
+    """
+    Analyse le PDF en un seul parcours : pour chaque page, texte et mots avec coordonnées
+    (pdfplumber), empreinte du contenu, puis raster (pypdfium2, si `render` ; sinon les
+    rasters sont produits à la demande lors du rendu des pages). Le résultat est relu
+    depuis le cache quand le contenu (empreinte SHA-256) a déjà été analysé.
+    `on_page(pages_traitées, total)` est appelé après chaque page.
+    """
+    sha256 = file_sha256(file_path)
+    if cache is not None:
+        doc = cache.get(sha256)
+        record_cache("document", doc is not None)
+        if doc is not None:
+            doc.source_path = file_path
+            if render:
+                _render_missing_rasters(doc, on_page)
+            return doc
+        doc = cache.create(sha256)
+    else:
+        doc = CachedDocument(sha256, None, [])
+
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            total = len(pdf.pages)
+            for i, page in enumerate(pdf.pages):
+                with stage("extraction", pages=1):
+                    words = [
+                        {k: (w[k] if k == "text" else round(w[k], 2)) for k in WORD_KEYS}
+                        for w in page.extract_words()
+                    ]
+                    page_data = {
+                        "text": page.extract_text() or "",
+                        "words": words,
+                        "width": float(page.width),
+                        "height": float(page.height),
+                    }
+                    page_data["hash"] = page_content_hash(page_data)
+                doc.pages.append(page_data)
+                if render:
+                    doc.store_raster(i, render_page(file_path, i))
+                # Libère les objets analysés de la page : la mémoire ne croît pas avec le document
+                page.close()
+                if on_page is not None:
+                    on_page(i + 1, total)
+    except BaseException:
+        # Analyse interrompue (PDF illisible...) : pas d'entrée incomplète dans le cache
+        if cache is not None:
+            cache.invalidate(sha256)
+        raise
+
+    doc.source_path = file_path
+    if cache is not None:
+        return cache.put(doc)
+    return doc
+
+def check_pdf(file_path: str):
+    """Vérifie que le fichier s'ouvre comme un PDF d'au moins une page ; ValueError sinon."""
+    with _pdfium_lock:
+        try:
+            pdf = pdfium.PdfDocument(file_path)
+        except pdfium.PdfiumError as e:
+            raise ValueError(f"PDF illisible : {e}") from e
+        try:
+            if len(pdf) == 0:
+                raise ValueError("PDF sans aucune page")
+        finally:
+            pdf.close()
+
+def _render_missing_rasters(doc: CachedDocument, on_page: Optional[Callable[[int, int], None]] = None):
+    """Rastérise les pages d'un document déjà analysé dont le raster n'est pas en cache."""
+    total = len(doc.pages)
+    for i in range(total):
+        if doc.directory is not None and not os.path.exists(doc.raster_path(i)):
+            doc.store_raster(i, render_page(doc.source_path, i))
+        if on_page is not None:
+            on_page(i + 1, total)
+
+class TextDiff:
+    """
+    Diff texte calculé une seule fois (voir `diff_texts`), dont on dérive la diff HTML,
+    les opérations brutes et les statistiques. `complete` est faux si le budget de temps
+    n'a pas suffi à différ finement toutes les régions modifiées.
+    """
+
+    def __init__(self, diffs: list, complete: bool = True):
+        self.diffs = diffs
+        self.complete = complete
+        self.additions = sum(1 for op, _ in diffs if op == dmp_module.diff_match_patch.DIFF_INSERT)
+        self.deletions = sum(1 for op, _ in diffs if op == dmp_module.diff_match_patch.DIFF_DELETE)
+
+    def to_html(self) -> str:
+        return dmp_module.diff_match_patch().diff_prettyHtml(self.diffs)
+
+    def to_data(self) -> list:
+        return self.diffs
+
+    def stats(self) -> dict:
+        return {
+            "additions": self.additions,
+            "deletions": self.deletions,
+            "changes": self.additions + self.deletions,
+        }
+
+def compact_diff(diffs: list, context: Optional[int] = None) -> dict:
+    """
+    Forme compacte d'une diff `[op, texte]` pour le client : le texte des segments n'est
+    envoyé qu'une fois (`text`) et chaque opération devient `[op, début, longueur]` dans
+    ce texte. Avec `context`, seuls `context` caractères de texte commun sont gardés de
+    part et d'autre d'une modification : le reste d'un segment identique est remplacé
+    par `[0, null, longueur]`.
+    """
+    parts, ops = [], []
+    offset = 0
+
+    def keep(op: int, piece: str):
+        nonlocal offset
+        parts.append(piece)
+        ops.append([op, offset, len(piece)])
+        offset += len(piece)
+
+    last = len(diffs) - 1
+    for k, (op, piece) in enumerate(diffs):
+        if op != dmp_module.diff_match_patch.DIFF_EQUAL or context is None:
+            keep(op, piece)
+            continue
+        head = context if k > 0 else 0
+        tail = context if k < last else 0
+        if head + tail >= len(piece):
+            keep(op, piece)
+            continue
+        if head:
+            keep(op, piece[:head])
+        ops.append([op, None, len(piece) - head - tail])
+        if tail:
+            keep(op, piece[len(piece) - tail:])
+    return {"text": "".join(parts), "ops": ops}
+
+def _tokens_to_chars(tokens1: list, tokens2: list):
+    """
+    Équivalent de diff_linesToChars de dmp pour une liste quelconque de tokens :
+    chaque token distinct est remplacé par un caractère unicode unique, ce qui permet
+    à diff_main de travailler sur des mots ou des lignes entières.
+    """
+    token_array = [""]  # L'index 0 est réservé, comme dans dmp
+    token_hash = {}
+
+    def encode(tokens):
+        chars = []
+        for token in tokens:
+            if token not in token_hash:
+                token_array.append(token)
+                token_hash[token] = len(token_array) - 1
+            chars.append(chr(token_hash[token]))
+        return "".join(chars)
+
+    return encode(tokens1), encode(tokens2), token_array
+
+def _tokenize(text: str, mode: str) -> list:
+    # Les séparateurs restent attachés aux tokens : "".join(tokens) == text
+    if mode == "word":
+        return re.findall(r"\S+\s*|\s+", text)
+    return text.splitlines(keepends=True)
+
+def _diff_main(text1: str, text2: str, timeout: float, checklines: bool = True):
+    """
+    diff_main + diff_cleanupSemantic limité à `timeout` secondes ; indique aussi si le
+    délai a été atteint (diff_main rend alors un diff grossier pour la fin du texte).
+    """
     dmp = dmp_module.diff_match_patch()
-    # Comparaison ligne par ligne ou mot par mot est souvent plus lisible pour les humains
-    # que caractère par caractère. 
-    # Pour l'instant on fait une diff simple, on optimisera pour le rendu visuel.
-    
-    diffs = dmp.diff_main(text1, text2)
+    dmp.Diff_Timeout = timeout
+    start = time.time()
+    diffs = dmp.diff_main(text1, text2, checklines)
+    complete = time.time() - start < timeout
     dmp.diff_cleanupSemantic(diffs)
-    
-    html_output = dmp.diff_prettyHtml(diffs)
-    return html_output
+    return diffs, complete
+
+def _diff_tokens(tokens1: list, tokens2: list, timeout: float = 1.0):
+    """Diff au niveau des tokens ; chaque caractère des diffs retournés est un token."""
+    chars1, chars2, token_array = _tokens_to_chars(tokens1, tokens2)
+    diffs, complete = _diff_main(chars1, chars2, timeout, False)
+    return diffs, token_array, complete
+
+def _diff_region(text1: str, text2: str, mode: str, timeout: float):
+    """Diff fin d'une région modifiée, à la granularité `mode` ; voir `_diff_main`."""
+    if mode != "char":
+        diffs, token_array, complete = _diff_tokens(_tokenize(text1, mode), _tokenize(text2, mode), timeout)
+        dmp_module.diff_match_patch().diff_charsToLines(diffs, token_array)
+        return diffs, complete
+    # Comparaison ligne par ligne ou mot par mot est souvent plus lisible pour les humains
+    # que caractère par caractère : voir les modes "word" et "line".
+    return _diff_main(text1, text2, timeout)
+
+def diff_regions(regions: list, mode: str, deadline: float):
+    """
+    Diff fin des régions modifiées [(texte1, texte2)], dans l'ordre, avant `deadline`
+    (time.time(), comparable d'un processus à l'autre) : chaque région reçoit une part
+    du temps restant proportionnelle à sa taille. Retourne les opérations de chaque
+    région et si toutes ont été diffées finement. Peut s'exécuter dans un processus worker.
+    """
+    remaining_chars = sum(len(text1) + len(text2) for text1, text2 in regions)
+    results, complete = [], True
+    for text1, text2 in regions:
+        size = len(text1) + len(text2)
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            # Budget épuisé : région remplacée en bloc (diff exact, mais grossier)
+            diffs = [(op, text) for op, text in ((dmp_module.diff_match_patch.DIFF_DELETE, text1),
+                                                 (dmp_module.diff_match_patch.DIFF_INSERT, text2)) if text]
+            complete = False
+        else:
+            share = remaining * size / remaining_chars
+            timeout = min(remaining, max(REGION_TIMEOUT_SLACK * share, MIN_REGION_TIMEOUT))
+            diffs, region_complete = _diff_region(text1, text2, mode, timeout)
+            complete = complete and region_complete
+        remaining_chars -= size
+        results.append(diffs)
+    return results, complete
+
+def _diff_all_regions(regions: list, mode: str, deadline: float, executor: Optional[Executor]):
+    if executor is None or sum(len(a) + len(b) for a, b in regions) < PARALLEL_DIFF_MIN_CHARS:
+        return diff_regions(regions, mode, deadline)
+    # Lots de régions consécutives d'environ DIFF_BATCH_CHARS caractères, un par tâche
+    batches, batch, batch_chars = [], [], 0
+    for region in regions:
+        batch.append(region)
+        batch_chars += len(region[0]) + len(region[1])
+        if batch_chars >= DIFF_BATCH_CHARS:
+            batches.append(batch)
+            batch, batch_chars = [], 0
+    if batch:
+        batches.append(batch)
+    futures = [executor.submit(diff_regions, batch, mode, deadline) for batch in batches]
+    results, complete = [], True
+    for future in futures:
+        batch_results, batch_complete = future.result()
+        results.extend(batch_results)
+        complete = complete and batch_complete
+    return results, complete
+
+def diff_texts(text1: str, text2: str, mode: str = "char", budget: float = TEXT_DIFF_BUDGET,
+               executor: Optional[Executor] = None) -> TextDiff:
+    """
+    Diff hiérarchique de deux textes : leurs lignes sont d'abord alignées par leur contenu
+    (voir `align_lines`), puis seules les régions modifiées passent par diff_main, à la
+    granularité `mode`, dans le budget de temps `budget` (secondes). Le temps ne dépend
+    plus de la longueur du document mais de l'étendue des modifications. Avec un
+    `executor` (pool de processus), les régions d'un grand document sont diffées par
+    lots en parallèle.
+    """
+    if mode not in DIFF_MODES:
+        raise ValueError(f"Mode de diff inconnu : {mode}")
+    with stage("diff_main"):
+        deadline = time.time() + budget
+        lines1 = text1.splitlines(keepends=True)
+        lines2 = text2.splitlines(keepends=True)
+        blocks = align_lines(lines1, lines2)
+        regions = [("".join(lines1[s1:e1]), "".join(lines2[s2:e2]))
+                   for s1, e1, s2, e2, equal in blocks if not equal]
+        region_diffs, complete = _diff_all_regions(regions, mode, deadline, executor)
+        operations = []
+        region_diffs = iter(region_diffs)
+        for s1, e1, s2, e2, equal in blocks:
+            if equal:
+                operations.append((dmp_module.diff_match_patch.DIFF_EQUAL, "".join(lines1[s1:e1])))
+            else:
+                operations.extend(next(region_diffs))
+        # Opérations voisines de même type fusionnées aux frontières des régions (sans
+        # diff_cleanupMerge, qui redécouperait les mots et les lignes remplacés)
+        diffs = []
+        for op, text in operations:
+            if diffs and diffs[-1][0] == op:
+                diffs[-1] = (op, diffs[-1][1] + text)
+            elif text:
+                diffs.append((op, text))
+        return TextDiff(diffs, complete)
+
+def compare_texts(text1: str, text2: str) -> str:
+    return diff_texts(text1, text2).to_html()
 
 def compare_texts_data(text1: str, text2: str) -> list:
     """
     Retourne les diffs sous forme de données brutes pour que le frontend puisse les manipuler
     (afficher côte à côte, etc.)
     """
+    return diff_texts(text1, text2).to_data()
+
+def _group_lines(words: list) -> list:
+    """Regroupe les indices de mots consécutifs situés sur la même ligne (même `top`)."""
+    lines = []
+    for i, w in enumerate(words):
+        if lines and abs(w["top"] - words[lines[-1][-1]]["top"]) <= 1:
+            lines[-1].append(i)
+        else:
+            lines.append([i])
+    return lines
+
+def diff_page_words(words1: list, words2: list, mode: str = "char"):
+    """
+    Indices des mots supprimés (dans words1) et ajoutés (dans words2) sur une page.
+    En mode "word"/"line", dmp travaille directement sur les tokens et les indices
+    se lisent dans les diffs. En mode "char", le texte est reconstitué en joignant
+    les mots par des espaces et les plages de caractères sont rapportées aux mots
+    par recherche dichotomique sur leurs positions de début.
+    """
+    if mode not in DIFF_MODES:
+        raise ValueError(f"Mode de diff inconnu : {mode}")
+    deleted, inserted = set(), set()
+
+    if mode != "char":
+        if mode == "word":
+            spans1 = [[i] for i in range(len(words1))]
+            spans2 = [[i] for i in range(len(words2))]
+        else:
+            spans1 = _group_lines(words1)
+            spans2 = _group_lines(words2)
+        tokens1 = [" ".join(words1[i]["text"] for i in span) for span in spans1]
+        tokens2 = [" ".join(words2[i]["text"] for i in span) for span in spans2]
+        diffs, _, _ = _diff_tokens(tokens1, tokens2)
+
+        pos1 = pos2 = 0
+        for op, chars in diffs:
+            length = len(chars)
+            if op == dmp_module.diff_match_patch.DIFF_DELETE:
+                for span in spans1[pos1:pos1 + length]:
+                    deleted.update(span)
+            elif op == dmp_module.diff_match_patch.DIFF_INSERT:
+                for span in spans2[pos2:pos2 + length]:
+                    inserted.update(span)
+            if op != dmp_module.diff_match_patch.DIFF_INSERT:
+                pos1 += length
+            if op != dmp_module.diff_match_patch.DIFF_DELETE:
+                pos2 += length
+        return deleted, inserted
+
+    # Reconstitution du texte pour le diff
+    text1 = " ".join([w['text'] for w in words1])
+    text2 = " ".join([w['text'] for w in words2])
+    
     dmp = dmp_module.diff_match_patch()
     diffs = dmp.diff_main(text1, text2)
     dmp.diff_cleanupSemantic(diffs)
-    return diffs
 
-def generate_comparison_images(file_path1: str, file_path2: str):
+    # Position de début de chaque mot dans le texte joint (+1 pour l'espace)
+    def word_starts(words):
+        starts = []
+        offset = 0
+        for w in words:
+            starts.append(offset)
+            offset += len(w['text']) + 1
+        return starts
+
+    def affected_words(words, starts, begin, end):
+        # Mots dont l'intervalle [start, start + len) recoupe [begin, end)
+        affected = set()
+        k = max(bisect_right(starts, begin) - 1, 0)
+        while k < len(words) and starts[k] < end:
+            if starts[k] + len(words[k]['text']) > begin:
+                affected.add(k)
+            k += 1
+        return affected
+
+    starts1 = word_starts(words1)
+    starts2 = word_starts(words2)
+    current_char1 = 0
+    current_char2 = 0
+    for op, text in diffs:
+        length = len(text)
+        if op == 0: # EQUAL
+            current_char1 += length
+            current_char2 += length
+        elif op == -1: # DELETE (in text1, not in text2)
+            deleted |= affected_words(words1, starts1, current_char1, current_char1 + length)
+            current_char1 += length
+        elif op == 1: # INSERT (in text2, not in text1)
+            inserted |= affected_words(words2, starts2, current_char2, current_char2 + length)
+            current_char2 += length
+    return deleted, inserted
+
+# Documents pypdfium2 ouverts par le processus courant (chaque worker ouvre les siens).
+# pdfium n'est pas thread-safe : tous les appels d'un processus passent par ce verrou.
+_pdfium_docs = {}
+_pdfium_lock = threading.Lock()
+
+def _open_pdfium(file_path: str) -> pdfium.PdfDocument:
+    # La date de modification fait partie de la clé : un fichier remplacé est rouvert
+    key = (file_path, os.stat(file_path).st_mtime_ns)
+    if key not in _pdfium_docs:
+        if len(_pdfium_docs) >= 8:
+            _pdfium_docs.pop(next(iter(_pdfium_docs))).close()
+        _pdfium_docs[key] = pdfium.PdfDocument(file_path)
+    return _pdfium_docs[key]
+
+def render_page(file_path: str, index: int) -> Image.Image:
+    """Raster d'une page avec pypdfium2."""
+    with stage("rendering", pages=1), _pdfium_lock:
+        page = _open_pdfium(file_path)[index]
+        try:
+            return page.render(scale=RENDER_SCALE).to_pil()
+        finally:
+            page.close()
+
+def page_raster(doc: CachedDocument, index: int) -> Image.Image:
+    """Raster d'une page d'un document analysé, rendu et conservé s'il manque."""
+    img = doc.load_raster(index)
+    record_cache("raster", img is not None)
+    if img is None:
+        img = render_page(doc.source_path, index)
+        doc.store_raster(index, img)
+    return img
+
+def _page_side(doc: CachedDocument, index: Optional[int], highlight: list,
+               regions: list) -> Optional[dict]:
+    """Ce dont un worker a besoin pour traiter une page d'un document (sérialisable)."""
+    if index is None:
+        return None
+    return {
+        "index": index,
+        "words": doc.pages[index]["words"],
+        # Indices des mots à surligner sur cette page
+        "highlight": highlight,
+        # Zones graphiques modifiées (en pixels du raster), voir `raster_diff`
+        "regions": regions,
+        "source_path": doc.source_path,
+        "raster_path": doc.raster_path(index) if doc.directory else None,
+        # Hors cache, le raster produit à l'ingestion est transmis directement
+        "image": None if doc.directory else doc.load_raster(index),
+    }
+
+def _load_page_image(side: dict) -> Image.Image:
+    if side["image"] is not None:
+        # Copie : le surlignage modifie l'image en place
+        return side["image"].copy()
+    raster_path = side["raster_path"]
+    if raster_path and os.path.exists(raster_path):
+        with stage("raster_load", pages=1), Image.open(raster_path) as img:
+            img.load()
+            return img
+    img = render_page(side["source_path"], side["index"])
+    if raster_path:
+        save_png_atomic(img, raster_path)
+    return img
+
+def encode_image(img: Image.Image) -> bytes:
+    # WebP avec pertes légères : aussi rapide à encoder que le PNG, 2 à 3 fois plus compact
+    buf = io.BytesIO()
+    with stage("encoding", pages=1):
+        img.convert("RGB").save(buf, format="WEBP", quality=IMAGE_QUALITY, method=2)
+    return buf.getvalue()
+
+def _word_box(w: dict) -> tuple:
+    # Facteur d'échelle entre pdfplumber (points) et pypdfium2 (pixels à scale=2)
+    # pypdfium2 scale=2 -> 72 * 2 = 144 DPI.
+    # pdfplumber coords sont en points (1/72 inch).
+    scale = float(RENDER_SCALE)
+    # Coords: x0, top, x1, bottom (bornes incluses, comme ImageDraw.rectangle)
+    return (int(w['x0']*scale), int(w['top']*scale), int(w['x1']*scale) + 1, int(w['bottom']*scale) + 1)
+
+def annotate_page(img: Image.Image, words: list, highlight: list, color: tuple,
+                  regions: tuple = ()) -> Image.Image:
     """
-    Génère des images des pages des deux PDF avec les différences surlignées.
-    Retourne une liste de dictionnaires contenant les images encodées en base64.
+    Surligne les mots (et les zones `regions`, en pixels) en place par mélange de la
+    couleur sur chaque rectangle (même résultat qu'un calque RGBA composé, sans copie
+    pleine page).
     """
-    images_data = []
+    if img.mode != "RGB":
+        img = img.convert("RGB")
     
-    # Ouvrir les PDFs avec pdfplumber pour l'extraction de texte et coordonnées
-    pdf1 = pdfplumber.open(file_path1)
-    pdf2 = pdfplumber.open(file_path2)
-    
-    # Ouvrir les PDFs avec pypdfium2 pour le rendu d'image haute qualité
-    pdfium1 = pdfium.PdfDocument(file_path1)
-    pdfium2 = pdfium.PdfDocument(file_path2)
-    
-    # On suppose pour l'instant que les PDFs ont le même nombre de pages ou on itère sur le max
-    num_pages = max(len(pdf1.pages), len(pdf2.pages))
-    
-    for i in range(num_pages):
-        page_data = {"page": i + 1}
-        
-        # Traitement PDF 1
-        if i < len(pdf1.pages):
-            plumber_page1 = pdf1.pages[i]
-            # Rendu image avec pypdfium2
-            # scale=2 pour une meilleure qualité (environ 144 dpi)
-            pil_image1 = pdfium1[i].render(scale=2).to_pil() 
-            
-            # Extraction des mots avec coordonnées
-            words1 = plumber_page1.extract_words()
-            text1_words = [w['text'] for w in words1]
-            
-            # On stocke l'image originale et les mots pour le diff plus tard
-            page_data["words1"] = words1
-            page_data["image1"] = pil_image1
+    rgb, alpha = color[:3], color[3]
+    boxes = [_word_box(words[w_idx]) for w_idx in highlight] + [tuple(box) for box in regions]
+    with stage("overlay", pages=1):
+        for box in boxes:
+            if box[2] <= box[0] or box[3] <= box[1]:
+                continue
+            mask = Image.new("L", (box[2] - box[0], box[3] - box[1]), alpha)
+            img.paste(rgb, box, mask)
+    return img
+
+def render_page_pair(task: dict) -> dict:
+    """
+    Surlignage et encodage d'une paire de pages, à partir des mots déjà identifiés par
+    le diff. Indépendant des autres pages : peut s'exécuter dans un processus worker.
+    """
+    output = {"page": task["page"], "img1": None, "img2": None}
+    # Durées des étapes renvoyées avec le résultat : le worker peut être un autre processus
+    with captured() as stages:
+        # Suppressions en rouge transparent sur img1, ajouts en vert sur img2
+        for key, color in (("img1", (255, 0, 0, 100)), ("img2", (0, 255, 0, 100))):
+            side = task["side" + key[-1]]
+            if side is not None:
+                img = annotate_page(_load_page_image(side), side["words"], side["highlight"], color, side["regions"])
+                output[key] = encode_image(img)
+    output["stages"] = stages
+    return output
+
+def _page_points(doc: CachedDocument, index: Optional[int]) -> Optional[list]:
+    # Dimensions de la page en points PDF, repère des rectangles de `_page_highlights`
+    if index is None:
+        return None
+    page = doc.pages[index]
+    return [round(page["width"], 1), round(page["height"], 1)]
+
+def _page_highlights(words1: list, words2: list, deleted: set, inserted: set, regions: list) -> list:
+    """
+    Surlignages d'une ligne de l'affichage sous forme de données, pour un calque dessiné
+    par le client sur les pages non annotées : `[op, x0, top, x1, bottom]` en points PDF,
+    op -1 sur la page de la version 1 (mots supprimés), 1 sur celle de la version 2
+    (mots ajoutés). Les zones graphiques modifiées figurent des deux côtés.
+    """
+    highlights = []
+    for op, words, indices in ((-1, words1, deleted), (1, words2, inserted)):
+        for k in sorted(indices):
+            w = words[k]
+            highlights.append([op, round(w["x0"], 1), round(w["top"], 1), round(w["x1"], 1), round(w["bottom"], 1)])
+    for op in (-1, 1):
+        for box in regions:
+            highlights.append([op] + [round(v / RENDER_SCALE, 1) for v in box])
+    return highlights
+
+def _raster_size(doc: CachedDocument, index: Optional[int]) -> Optional[list]:
+    # Dimensions en pixels du rendu, connues sans rasteriser la page
+    if index is None:
+        return None
+    page = doc.pages[index]
+    return [round(page["width"] * RENDER_SCALE), round(page["height"] * RENDER_SCALE)]
+
+def page_pixel_regions(doc1: CachedDocument, i1: int, doc2: CachedDocument, i2: int) -> list:
+    """
+    Zones graphiques modifiées entre deux pages appariées (voir `changed_regions`). Les
+    rectangles des mots des deux pages sont exclus : le texte relève du diff des mots,
+    et un texte qui se décale ne doit pas couvrir la page de zones modifiées.
+    """
+    if doc1.directory and doc2.directory:
+        # Rendus identiques : mêmes fichiers PNG (encodage déterministe), rien à décoder
+        data1 = load_bytes(doc1.raster_path(i1))
+        if data1 is not None and data1 == load_bytes(doc2.raster_path(i2)):
+            return []
+    text_boxes = []
+    for w in doc1.pages[i1]["words"] + doc2.pages[i2]["words"]:
+        # Marges : les boîtes de pdfplumber ne couvrent pas toujours le glyphe rendu
+        # (police de substitution plus large, largeur nulle pour certains "€")
+        x0, top, x1, bottom = _word_box(w)
+        height = bottom - top
+        text_boxes.append((x0 - height // 2, top - 2, x1 + 2 * height, bottom + 2))
+    return changed_regions(page_raster(doc1, i1), page_raster(doc2, i2), text_boxes)
+
+def diff_document_pages(doc1: CachedDocument, doc2: CachedDocument, mode: str = "char",
+                        pixels: bool = False) -> list:
+    """
+    Diff des mots de toutes les pages, sans aucun rendu, après alignement des pages (voir
+    `align_pages`). Pour chaque ligne de l'affichage : pages correspondantes (`page1`,
+    `page2`, à partir de 1 ou None), statut, indices des mots supprimés et ajoutés,
+    dimensions (images et points) et surlignages en données (voir `_page_highlights`).
+    Une page insérée ou supprimée est entièrement surlignée ; une paire de même empreinte
+    de contenu est `unchanged`, sans diff. Avec `pixels`, les rasters des pages appariées
+    sont aussi comparés (`regions` : zones graphiques modifiées, hors texte) et comptent
+    pour le statut.
+    """
+    pages = []
+    with stage("alignment"):
+        alignment = align_pages(doc1.pages, doc2.pages)
+    for row, (i1, i2, status) in enumerate(alignment, 1):
+        words1 = doc1.pages[i1]["words"] if i1 is not None else []
+        words2 = doc2.pages[i2]["words"] if i2 is not None else []
+        unchanged = False
+        if status in (PAGE_INSERTED, PAGE_DELETED):
+            deleted, inserted = set(range(len(words1))), set(range(len(words2)))
+        elif doc1.pages[i1]["hash"] == doc2.pages[i2]["hash"]:
+            unchanged = True
+            deleted, inserted = set(), set()
         else:
-            page_data["words1"] = []
-            page_data["image1"] = None
-
-        # Traitement PDF 2
-        if i < len(pdf2.pages):
-            plumber_page2 = pdf2.pages[i]
-            pil_image2 = pdfium2[i].render(scale=2).to_pil()
-            words2 = plumber_page2.extract_words()
-            page_data["words2"] = words2
-            page_data["image2"] = pil_image2
+            with stage("page_diff", pages=1):
+                deleted, inserted = diff_page_words(words1, words2, mode)
+        regions = []
+        if pixels and status not in (PAGE_INSERTED, PAGE_DELETED):
+            with stage("pixel_diff", pages=1):
+                regions = page_pixel_regions(doc1, i1, doc2, i2)
+            unchanged = unchanged and not regions
+        pages.append({
+            "page": row,
+            "page1": i1 + 1 if i1 is not None else None,
+            "page2": i2 + 1 if i2 is not None else None,
+            "status": status,
+            "unchanged": unchanged,
+            "img1": i1 is not None,
+            "img2": i2 is not None,
+            "size1": _raster_size(doc1, i1),
+            "size2": _raster_size(doc2, i2),
+            "points1": _page_points(doc1, i1),
+            "points2": _page_points(doc2, i2),
+            "deleted": sorted(deleted),
+            "inserted": sorted(inserted),
+            "regions": regions,
+            "highlights": _page_highlights(words1, words2, deleted, inserted, regions),
+        })
+    return pages
+
+def _page_task(doc1: CachedDocument, doc2: CachedDocument, page: dict) -> dict:
+    i1 = page["page1"] - 1 if page["page1"] else None
+    i2 = page["page2"] - 1 if page["page2"] else None
+    return {
+        "page": page["page"],
+        "side1": _page_side(doc1, i1, page["deleted"], page["regions"]),
+        "side2": _page_side(doc2, i2, page["inserted"], page["regions"]),
+    }
+
+def _bounded_map(executor: Executor, fn, iterable, limit: int):
+    """
+    Comme executor.map, mais avec au plus `limit` tâches soumises et non consommées :
+    les pages sont soumises au fil de la lecture des résultats, dans l'ordre.
+    """
+    pending = deque()
+    for item in iterable:
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, item))
+    while pending:
+        yield pending.popleft().result()
+
+def _merge_page_stages(results):
+    for result in results:
+        merge_captured(result.pop("stages"))
+        yield result
+
+def _map_pages(tasks, executor: Optional[Executor], workers: int = 1):
+    # Séquentiel : une seule paire de pages vivante à la fois ; sinon quelques paires
+    # d'avance par worker (`workers` : taille du pool)
+    if executor is None:
+        return _merge_page_stages(map(render_page_pair, tasks))
+    return _merge_page_stages(
+        _bounded_map(executor, render_page_pair, tasks, PAGES_IN_FLIGHT_PER_WORKER * workers)
+    )
+
+def iter_comparison_images(doc1: CachedDocument, doc2: CachedDocument, mode: str = "char",
+                           executor: Optional[Executor] = None, pixels: bool = False, workers: int = 1):
+    """
+    Version itérative de `generate_comparison_images` : chaque page est produite dès
+    qu'elle est prête (et que les pages précédentes l'ont été), dans l'ordre des pages.
+    """
+    pages = diff_document_pages(doc1, doc2, mode, pixels)
+    return _map_pages((_page_task(doc1, doc2, page) for page in pages), executor, workers)
+
+def generate_comparison_images(doc1: CachedDocument, doc2: CachedDocument, mode: str = "char",
+                               executor: Optional[Executor] = None, pixels: bool = False, workers: int = 1):
+    """
+    Génère des images des pages des deux PDF avec les différences surlignées.
+    Retourne une liste de dictionnaires contenant les images encodées (WebP).
+    Les mots et les rasters proviennent de `ingest_document`, `mode` fixe la
+    granularité du diff (voir `diff_page_words`). Avec un `executor` (pool de
+    processus de `workers` workers), les paires de pages sont traitées en parallèle ;
+    l'ordre de sortie reste celui des pages. `pixels` ajoute la comparaison des rasters (voir
+    `diff_document_pages`).
+    """
+    return list(iter_comparison_images(doc1, doc2, mode, executor, pixels, workers))
+
+def comparison_key(sha1: str, sha2: str, mode: str, pixels: bool = False) -> str:
+    """Identifiant d'une comparaison : empreinte des deux contenus et des options."""
+    options = f"{mode}:pixels" if pixels else mode
+    return hashlib.sha256(f"{COMPARISON_FORMAT}:{sha1}:{sha2}:{options}".encode()).hexdigest()
+
+def open_comparison(doc1: CachedDocument, doc2: CachedDocument, mode: str,
+                    comparisons: ComparisonCache, pixels: bool = False) -> CachedComparison:
+    """
+    Entrée de cache de la comparaison : diff des mots de tout le document, calculé une
+    seule fois par paire de contenus et options. Les images sont produites à la demande
+    par `render_comparison_pages`.
+    """
+    key = comparison_key(doc1.sha256, doc2.sha256, mode, pixels)
+    entry = comparisons.get(key)
+    record_cache("comparison", entry is not None)
+    if entry is not None:
+        return entry
+    entry = comparisons.create(key)
+    entry.pages = diff_document_pages(doc1, doc2, mode, pixels)
+    entry.info = _comparison_info(doc1, doc2, mode, pixels)
+    return comparisons.put(entry)
+
+def _comparison_info(doc1: CachedDocument, doc2: CachedDocument, mode: str, pixels: bool) -> dict:
+    return {
+        "doc1": doc1.sha256,
+        "doc2": doc2.sha256,
+        "source1": doc1.source_path,
+        "source2": doc2.source_path,
+        "mode": mode,
+        "pixels": pixels,
+    }
+
+def _text_result(text_diff: TextDiff) -> dict:
+    return {
+        "html_diff": text_diff.to_html(),
+        "raw_diff": text_diff.to_data(),
+        "stats": text_diff.stats(),
+        # Faux si le budget de temps n'a pas suffi : le diff reste exact, mais plus grossier
+        "complete": text_diff.complete,
+    }
+
+def diff_pair(doc1: CachedDocument, doc2: CachedDocument, mode: str = "char", pixels: bool = False,
+              budget: float = TEXT_DIFF_BUDGET) -> dict:
+    """
+    Diff complet d'une paire de documents analysés, sans rendu : diff des pages (voir
+    `diff_document_pages`) et diff texte. Peut s'exécuter dans un processus worker.
+    """
+    with captured() as stages:
+        pages = diff_document_pages(doc1, doc2, mode, pixels)
+        text = _text_result(diff_texts(doc1.text, doc2.text, mode, budget))
+    return {"pages": pages, "text": text, "stages": stages}
+
+def open_comparisons(baseline: CachedDocument, revisions: list, mode: str, comparisons: ComparisonCache,
+                     pixels: bool = False, executor: Optional[Executor] = None,
+                     budget: float = TEXT_DIFF_BUDGET) -> list:
+    """
+    Comparaisons d'un document de référence avec chacune des `revisions` (documents déjà
+    analysés), dans l'ordre des révisions. Les paires absentes du cache sont calculées en
+    parallèle dans `executor` (pool de processus), chaque paire distincte une seule fois ;
+    la diff texte (chacune dans le budget `budget`) est conservée avec chaque comparaison
+    si elle est complète.
+    """
+    keys = [comparison_key(baseline.sha256, doc.sha256, mode, pixels) for doc in revisions]
+    entries, missing = {}, {}
+    for key, doc in zip(keys, revisions):
+        if key in entries or key in missing:
+            continue
+        entry = comparisons.get(key)
+        record_cache("comparison", entry is not None)
+        if entry is None:
+            missing[key] = doc
         else:
-            page_data["words2"] = []
-            page_data["image2"] = None
-            
-        images_data.append(page_data)
+            entries[key] = entry
+    if executor is None:
+        results = (diff_pair(baseline, doc, mode, pixels, budget) for doc in missing.values())
+    else:
+        futures = [executor.submit(diff_pair, baseline, doc, mode, pixels, budget) for doc in missing.values()]
+        results = (future.result() for future in futures)
+    for (key, doc), result in zip(missing.items(), results):
+        merge_captured(result["stages"])
+        entry = comparisons.create(key)
+        entry.pages = result["pages"]
+        entry.info = _comparison_info(baseline, doc, mode, pixels)
+        entries[key] = comparisons.put(entry)
+        if result["text"]["complete"]:
+            entry.store_text(result["text"])
+    return [entries[key] for key in keys]
 
-    pdf1.close()
-    pdf2.close()
-    
-    # Calcul du diff global (ou par page - ici on fait page par page pour simplifier l'alignement visuel)
-    # Note: Un diff global serait plus précis si le texte coule d'une page à l'autre, 
-    # mais pour l'affichage page par page, un diff local est souvent suffisant.
-    
-    final_output = []
-    
-    for p_data in images_data:
-        img1 = p_data.get("image1")
-        img2 = p_data.get("image2")
-        words1 = p_data.get("words1", [])
-        words2 = p_data.get("words2", [])
-        
-        # Reconstitution du texte pour le diff
-        text1 = " ".join([w['text'] for w in words1])
-        text2 = " ".join([w['text'] for w in words2])
-        
-        dmp = dmp_module.diff_match_patch()
-        diffs = dmp.diff_main(text1, text2)
-        dmp.diff_cleanupSemantic(diffs)
-        
-        # On doit mapper les diffs aux mots.
-        # C'est complexe car dmp travaille sur les caractères.
-        # On va parcourir les diffs et avancer dans les listes de mots.
-        
-        draw1 = ImageDraw.Draw(img1) if img1 else None
-        draw2 = ImageDraw.Draw(img2) if img2 else None
-        
-        # Mode RGBA pour la transparence
-        if img1: img1 = img1.convert("RGBA")
-        if img2: img2 = img2.convert("RGBA")
-        
-        # Overlay layers
-        overlay1 = Image.new('RGBA', img1.size, (255,255,255,0)) if img1 else None
-        overlay2 = Image.new('RGBA', img2.size, (255,255,255,0)) if img2 else None
-        draw_ov1 = ImageDraw.Draw(overlay1) if overlay1 else None
-        draw_ov2 = ImageDraw.Draw(overlay2) if overlay2 else None
-
-        # Indices de caractères courants
-        idx1 = 0
-        idx2 = 0
-        
-        # Facteur d'échelle entre pdfplumber (points) et pypdfium2 (pixels à scale=2)
-        # pypdfium2 scale=2 -> 72 * 2 = 144 DPI.
-        # pdfplumber coords sont en points (1/72 inch).
-        # Donc scale factor = 2.
-        scale = 2.0
-        
-        # On va essayer de mapper grossièrement les caractères aux mots
-        # Une méthode plus robuste serait de faire un diff sur les mots directement.
-        # Pour simplifier ici: on va iterer sur les mots et voir s'ils sont dans un range de diff.
-        # Mais dmp retourne des caractères.
-        
-        # Approche alternative : Diff de mots
-        # On convertit les mots en caractères uniques (unicode) pour dmp, puis on remap.
-        # Ou plus simple : on utilise diff_main sur les textes, et on essaie de retrouver les mots.
-        
-        # Pour l'instant, implémentation naïve :
-        # On parcourt le texte et les mots simultanément.
-        
-        # Construction d'une map : char_index -> word_index
-        char_map1 = []
-        current_idx = 0
-        for i, w in enumerate(words1):
-            # +1 pour l'espace ajouté lors du join, sauf pour le dernier (mais on simplifie)
-            l = len(w['text'])
-            for _ in range(l):
-                char_map1.append(i)
-            # Espace
-            char_map1.append(-1) 
-            
-        char_map2 = []
-        current_idx = 0
-        for i, w in enumerate(words2):
-            l = len(w['text'])
-            for _ in range(l):
-                char_map2.append(i)
-            char_map2.append(-1)
-
-        current_char1 = 0
-        current_char2 = 0
-        
-        for op, text in diffs:
-            length = len(text)
-            
-            if op == 0: # EQUAL
-                current_char1 += length
-                current_char2 += length
-            elif op == -1: # DELETE (in text1, not in text2) -> Highlight Red on Img1
-                # Trouver les mots touchés
-                affected_words = set()
-                for k in range(current_char1, current_char1 + length):
-                    if k < len(char_map1):
-                        w_idx = char_map1[k]
-                        if w_idx != -1:
-                            affected_words.add(w_idx)
-                
-                if draw_ov1:
-                    for w_idx in affected_words:
-                        w = words1[w_idx]
-                        # Coords: x0, top, x1, bottom
-                        box = (w['x0']*scale, w['top']*scale, w['x1']*scale, w['bottom']*scale)
-                        # Rouge transparent
-                        draw_ov1.rectangle(box, fill=(255, 0, 0, 100))
-                
-                current_char1 += length
-            elif op == 1: # INSERT (in text2, not in text1) -> Highlight Green on Img2
-                affected_words = set()
-                for k in range(current_char2, current_char2 + length):
-                    if k < len(char_map2):
-                        w_idx = char_map2[k]
-                        if w_idx != -1:
-                            affected_words.add(w_idx)
-                            
-                if draw_ov2:
-                    for w_idx in affected_words:
-                        w = words2[w_idx]
-                        box = (w['x0']*scale, w['top']*scale, w['x1']*scale, w['bottom']*scale)
-                        # Vert transparent
-                        draw_ov2.rectangle(box, fill=(0, 255, 0, 100))
-                
-                current_char2 += length
-
-        # Composite images
-        if img1 and overlay1:
-            img1 = Image.alpha_composite(img1, overlay1)
-        if img2 and overlay2:
-            img2 = Image.alpha_composite(img2, overlay2)
-            
-        # Convert to base64
-        img1_b64 = None
-        if img1:
-            buf = io.BytesIO()
-            img1.convert("RGB").save(buf, format="PNG")
-            img1_b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-            
-        img2_b64 = None
-        if img2:
-            buf = io.BytesIO()
-            img2.convert("RGB").save(buf, format="PNG")
-            img2_b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-            
-        final_output.append({
-            "page": p_data["page"],
-            "img1": img1_b64,
-            "img2": img2_b64
-        })
-        
-    return final_output
+def comparison_text(entry: CachedComparison, doc1: CachedDocument, doc2: CachedDocument,
+                    budget: float = TEXT_DIFF_BUDGET, executor: Optional[Executor] = None) -> dict:
+    """
+    Diff texte de la comparaison (HTML, données brutes, statistiques), calculée une
+    seule fois dans le budget de temps `budget` (voir `diff_texts`) puis relue depuis
+    l'entrée de cache tant qu'elle n'est pas évincée. Une diff incomplète (budget
+    dépassé) n'est pas conservée : elle sera refaite à la demande suivante.
+    """
+    text = entry.load_text()
+    record_cache("comparison_text", text is not None)
+    if text is None:
+        text = _text_result(diff_texts(doc1.text, doc2.text, entry.info["mode"], budget, executor))
+        if text["complete"]:
+            entry.store_text(text)
+    return text
+
+def render_comparison_pages(entry: CachedComparison, doc1: CachedDocument, doc2: CachedDocument,
+                            page_numbers: list, executor: Optional[Executor] = None, workers: int = 1):
+    """
+    Rastérise, surligne et stocke les images manquantes des pages demandées.
+    Produit chaque description de page dans l'ordre, dès que ses images sont prêtes.
+    """
+    pages = [entry.pages[n - 1] for n in page_numbers]
+    # Les pages inchangées n'ont pas d'image annotée : voir `document_page_image`
+    missing = [
+        page for page in pages
+        if not page["unchanged"]
+        and any(page[side] and not entry.has_image(page["page"], side) for side in ("img1", "img2"))
+    ]
+    missing_numbers = {page["page"] for page in missing}
+    for page in pages:
+        if not page["unchanged"]:
+            record_cache("page_image", page["page"] not in missing_numbers)
+    # Les résultats arrivent dans l'ordre de `missing`, lui-même dans l'ordre de `pages`
+    results = _map_pages((_page_task(doc1, doc2, page) for page in missing), executor, workers)
+    for page in pages:
+        if page["page"] in missing_numbers:
+            result = next(results)
+            for side in ("img1", "img2"):
+                if result[side] is not None:
+                    record_bytes("annotated_image", len(result[side]))
+                    entry.store_image(result["page"], side, result[side])
+        yield page
+
+def document_page_image(doc: CachedDocument, index: int) -> bytes:
+    """
+    Page d'un document sans surlignage (WebP), encodée une seule fois puis conservée avec
+    le document : c'est l'image des pages inchangées, partagée par toutes les comparaisons.
+    """
+    data = doc.load_image(index) if doc.directory else None
+    record_cache("document_image", data is not None)
+    if data is None:
+        data = encode_image(page_raster(doc, index))
+        record_bytes("document_image", len(data))
+        if doc.directory:
+            doc.store_image(index, data)
+    return data
+
+def parse_page_range(spec: Optional[str], num_pages: int) -> list:
+    """
+    Numéros de pages (à partir de 1) décrits par `spec`, par exemple "1-3", "5" ou "1-3,8".
+    Sans `spec`, toutes les pages. Les bornes au-delà du document sont ignorées.
+    """
+    if not spec:
+        return list(range(1, num_pages + 1))
+    numbers = set()
+    for part in spec.split(","):
+        bounds = part.strip().split("-")
+        if len(bounds) > 2 or not all(b.strip().isdigit() for b in bounds):
+            raise ValueError(f"Plage de pages invalide : {spec}")
+        first = int(bounds[0])
+        last = int(bounds[-1])
+        if first < 1 or last < first:
+            raise ValueError(f"Plage de pages invalide : {spec}")
+        numbers.update(range(first, min(last, num_pages) + 1))
+    return sorted(numbers)
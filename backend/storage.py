@@ -0,0 +1,263 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import BinaryIO, Callable, Iterable, List, Optional
+
+# Taille des blocs lus/écrits pendant un upload
+CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    num_pages INTEGER
+);
+CREATE TABLE IF NOT EXISTS versions (
+    filename TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL REFERENCES blobs(sha256),
+    created REAL NOT NULL,
+    modified REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_modified ON versions(modified);
+CREATE INDEX IF NOT EXISTS versions_sha256 ON versions(sha256);
+CREATE TABLE IF NOT EXISTS imports (
+    filename TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+);
+"""
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class InvalidUpload(ValueError):
+    pass
+
+
+class BlobWriter:
+    """
+    Écriture d'un upload par blocs dans un fichier temporaire, avec calcul de
+    l'empreinte au fil de l'eau. `commit` range le contenu sous son empreinte.
+    """
+
+    def __init__(self, store: "UploadStore", max_size: Optional[int]):
+        self.store = store
+        self.max_size = max_size
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._tmp_path = os.path.join(store.tmp_dir, uuid.uuid4().hex)
+        self._file = open(self._tmp_path, "wb")
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            self.abort()
+            raise UploadTooLarge(f"Fichier trop volumineux (maximum {self.max_size} octets)")
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.unlink(self._tmp_path)
+        except OSError:
+            pass
+
+    def commit(self, filename: str) -> dict:
+        self._file.close()
+        if self.store.validate is not None:
+            try:
+                self.store.validate(self._tmp_path)
+            except Exception as e:
+                self.abort()
+                raise InvalidUpload(str(e)) from e
+        return self.store._commit(filename, self._tmp_path, self._digest.hexdigest(), self.size)
+
+
+class UploadStore:
+    """
+    Stockage des uploads adressé par contenu : chaque contenu distinct est écrit une
+    seule fois (blobs/<sha[:2]>/<sha>.pdf), les noms de fichiers n'en sont que des alias.
+    Le catalogue SQLite (noms, empreintes, tailles, dates, nombre de pages) évite de
+    parcourir le dossier pour lister les versions.
+    `on_collect(sha256)` est appelé quand un contenu sans plus aucun alias est supprimé.
+    `validate(chemin)` vérifie chaque upload avant qu'il ne soit rangé (exception : refusé).
+    """
+
+    def __init__(self, directory: str, on_collect: Optional[Callable[[str], None]] = None,
+                 validate: Optional[Callable[[str], None]] = None):
+        self.directory = directory
+        self.on_collect = on_collect
+        self.validate = validate
+        self.blob_dir = os.path.join(directory, "blobs")
+        self.tmp_dir = os.path.join(directory, "tmp")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        # Uploads interrompus lors d'un arrêt précédent
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "catalog.sqlite3"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.blob_dir, sha256[:2], f"{sha256}.pdf")
+
+    def writer(self, max_size: Optional[int] = None) -> BlobWriter:
+        return BlobWriter(self, max_size)
+
+    def save(self, filename: str, source: BinaryIO, max_size: Optional[int] = None) -> dict:
+        """Copie `source` par blocs sous le nom `filename` ; retourne la version enregistrée."""
+        writer = self.writer(max_size)
+        try:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit(filename)
+
+    def _commit(self, filename: str, tmp_path: str, sha256: str, size: int, modified: Optional[float] = None) -> dict:
+        now = modified if modified is not None else time.time()
+        path = self.blob_path(sha256)
+        with self._lock:
+            if os.path.exists(path):
+                # Contenu déjà connu : seul l'alias est ajouté
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            with self._db:
+                self._db.execute(
+                    "INSERT OR IGNORE INTO blobs (sha256, size, created) VALUES (?, ?, ?)",
+                    (sha256, size, now),
+                )
+                previous = self._db.execute(
+                    "SELECT sha256 FROM versions WHERE filename = ?", (filename,)
+                ).fetchone()
+                self._db.execute(
+                    "INSERT INTO versions (filename, sha256, created, modified) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(filename) DO UPDATE SET sha256 = excluded.sha256, modified = excluded.modified",
+                    (filename, sha256, now, now),
+                )
+            if previous is not None and previous["sha256"] != sha256:
+                # Le nom désignait un autre contenu : supprimé s'il n'a plus d'alias
+                self._collect(previous["sha256"])
+        return self.get(filename)
+
+    def _collect(self, sha256: str):
+        with self._db:
+            deleted = self._db.execute(
+                "DELETE FROM blobs WHERE sha256 = ? AND NOT EXISTS "
+                "(SELECT 1 FROM versions WHERE sha256 = ?)",
+                (sha256, sha256),
+            ).rowcount
+        if deleted:
+            try:
+                os.unlink(self.blob_path(sha256))
+            except OSError:
+                pass
+            if self.on_collect is not None:
+                self.on_collect(sha256)
+
+    def _flat_files(self, directory: str) -> List[str]:
+        return [name for name in os.listdir(directory)
+                if name.lower().endswith(".pdf") and os.path.isfile(os.path.join(directory, name))]
+
+    def import_directory(self, directory: str):
+        """
+        Copie dans le stockage les PDF déposés à plat dans `directory` (ancienne
+        disposition, exemples du dépôt), une seule fois par fichier : un fichier déjà
+        importé n'est plus relu, et un nom déjà présent au catalogue n'est jamais
+        remplacé. Les fichiers d'origine sont laissés en place.
+        """
+        with self._lock:
+            imported = {row[0] for row in self._db.execute("SELECT filename FROM imports")}
+        for name in self._flat_files(directory):
+            if name in imported:
+                continue
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+            sha256 = digest.hexdigest()
+            if self.get(name) is None:
+                tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+                shutil.copyfile(path, tmp_path)
+                self._commit(name, tmp_path, sha256, stat.st_size, stat.st_mtime)
+            with self._lock, self._db:
+                self._db.execute("INSERT OR REPLACE INTO imports (filename, sha256) VALUES (?, ?)", (name, sha256))
+
+    def get(self, filename: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT v.filename, v.sha256, v.created, v.modified, b.size, b.num_pages "
+                "FROM versions v JOIN blobs b ON b.sha256 = v.sha256 WHERE v.filename = ?",
+                (filename,),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def list(self, offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+        """Versions triées par date de modification (la plus récente en dernier)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT v.filename, v.sha256, v.created, v.modified, b.size, b.num_pages "
+                "FROM versions v JOIN blobs b ON b.sha256 = v.sha256 "
+                "ORDER BY v.modified LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def find(self, sha256s: Iterable[str]) -> List[dict]:
+        """Versions (alias) des contenus `sha256s`, la plus récente en premier."""
+        sha256s = list(sha256s)
+        if not sha256s:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT v.filename, v.sha256, v.created, v.modified, b.size, b.num_pages "
+                "FROM versions v JOIN blobs b ON b.sha256 = v.sha256 "
+                f"WHERE v.sha256 IN ({','.join('?' * len(sha256s))}) ORDER BY v.modified DESC",
+                sha256s,
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def blobs(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT sha256 FROM blobs")]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM versions").fetchone()[0]
+
+    def set_num_pages(self, sha256: str, num_pages: int):
+        with self._lock, self._db:
+            self._db.execute("UPDATE blobs SET num_pages = ? WHERE sha256 = ?", (num_pages, sha256))
+
+    def clear(self):
+        """
+        Suppression en bloc : DELETE des tables, dossier des blobs et PDF déposés à plat
+        (sinon réimportés au démarrage suivant).
+        """
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM versions")
+                self._db.execute("DELETE FROM blobs")
+                self._db.execute("DELETE FROM imports")
+            shutil.rmtree(self.blob_dir, ignore_errors=True)
+            os.makedirs(self.blob_dir, exist_ok=True)
+            for name in self._flat_files(self.directory):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except OSError:
+                    pass
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Les modules du backend sont à plat dans backend/ (lancés depuis ce dossier en production)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,44 @@
+from alignment import PAGE_DELETED, PAGE_INSERTED, PAGE_MATCHED, PAGE_MOVED, align_pages
+
+
+def _page(n):
+    # Page au contenu propre (aucun shingle commun avec les autres pages)
+    return {"words": [{"text": f"p{n}w{k}"} for k in range(30)]}
+
+
+def test_identical_documents_are_matched_in_order():
+    pages = [_page(n) for n in range(4)]
+    assert align_pages(pages, list(pages)) == [(n, n, PAGE_MATCHED) for n in range(4)]
+
+
+def test_inserted_page_keeps_the_following_pages_matched():
+    pages1 = [_page(0), _page(1), _page(2)]
+    pages2 = [_page(0), _page(9), _page(1), _page(2)]
+    assert align_pages(pages1, pages2) == [
+        (0, 0, PAGE_MATCHED), (None, 1, PAGE_INSERTED), (1, 2, PAGE_MATCHED), (2, 3, PAGE_MATCHED),
+    ]
+
+
+def test_deleted_page():
+    pages1 = [_page(0), _page(1), _page(2)]
+    pages2 = [_page(0), _page(2)]
+    assert align_pages(pages1, pages2) == [(0, 0, PAGE_MATCHED), (1, None, PAGE_DELETED), (2, 1, PAGE_MATCHED)]
+
+
+def test_moved_page_is_shown_at_its_new_place():
+    pages1 = [_page(0), _page(1), _page(2), _page(3)]
+    pages2 = [_page(3), _page(0), _page(1), _page(2)]
+    assert align_pages(pages1, pages2) == [
+        (3, 0, PAGE_MOVED), (0, 1, PAGE_MATCHED), (1, 2, PAGE_MATCHED), (2, 3, PAGE_MATCHED),
+    ]
+
+
+def test_edited_page_is_still_matched():
+    edited = _page(1)
+    edited["words"][10] = {"text": "modifié"}
+    assert align_pages([_page(0), _page(1)], [_page(0), edited]) == [(0, 0, PAGE_MATCHED), (1, 1, PAGE_MATCHED)]
+
+
+def test_blank_pages_match_each_other():
+    blank = {"words": []}
+    assert align_pages([_page(0), blank], [_page(0), blank]) == [(0, 0, PAGE_MATCHED), (1, 1, PAGE_MATCHED)]
@@ -0,0 +1,79 @@
+import os
+import shutil
+
+from PIL import Image
+
+from cache import ComparisonCache, DocumentCache
+
+
+def _add(cache, sha256, pages=()):
+    doc = cache.create(sha256)
+    doc.pages = list(pages)
+    return cache.put(doc)
+
+
+def _add_comparison(cache, key, doc1, doc2):
+    entry = cache.create(key)
+    entry.info = {"doc1": doc1, "doc2": doc2, "mode": "char"}
+    return cache.put(entry)
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = DocumentCache(str(tmp_path), max_documents=2)
+    _add(cache, "a")
+    _add(cache, "b")
+    cache.get("a")
+    _add(cache, "c")
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert not os.path.exists(tmp_path / "b")
+
+
+def test_lru_order_survives_restart(tmp_path):
+    cache = DocumentCache(str(tmp_path), max_documents=2)
+    _add(cache, "a")
+    _add(cache, "b")
+    # Dates de meta.json explicites : la résolution du système de fichiers peut confondre les accès
+    os.utime(tmp_path / "a" / "meta.json", (2000, 2000))
+    os.utime(tmp_path / "b" / "meta.json", (1000, 1000))
+    reloaded = DocumentCache(str(tmp_path), max_documents=2)
+    _add(reloaded, "c")
+    assert "a" in reloaded and "b" not in reloaded
+
+
+def test_incomplete_entries_are_dropped_on_load(tmp_path):
+    cache = DocumentCache(str(tmp_path))
+    cache.create("partial")
+    DocumentCache(str(tmp_path))
+    assert not os.path.exists(tmp_path / "partial")
+
+
+def test_store_after_eviction_recreates_the_entry(tmp_path):
+    cache = DocumentCache(str(tmp_path))
+    doc = cache.create("a")
+    shutil.rmtree(doc.directory)
+    doc.store_raster(0, Image.new("RGB", (4, 4), "white"))
+    doc.store_image(0, b"webp")
+    cache.put(doc)
+    assert cache.get("a").load_image(0) == b"webp"
+    assert cache.get("a").load_raster(0).size == (4, 4)
+
+
+def test_invalidate_document_drops_its_comparisons_only(tmp_path):
+    cache = ComparisonCache(str(tmp_path))
+    _add_comparison(cache, "k1", "A", "B")
+    _add_comparison(cache, "k2", "C", "A")
+    _add_comparison(cache, "k3", "B", "C")
+    cache.invalidate_document("A")
+    assert "k1" not in cache and "k2" not in cache and "k3" in cache
+
+
+def test_invalidate_document_after_restart_and_eviction(tmp_path):
+    cache = ComparisonCache(str(tmp_path), max_documents=2)
+    _add_comparison(cache, "k1", "A", "B")
+    _add_comparison(cache, "k2", "A", "C")
+    _add_comparison(cache, "k3", "D", "C")
+    reloaded = ComparisonCache(str(tmp_path), max_documents=2)
+    reloaded.invalidate_document("C")
+    assert "k2" not in reloaded and "k3" not in reloaded
+    # k1, évincée, ne revient pas ; l'index des documents ne garde rien d'elle
+    assert reloaded._by_document == {}
@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from jobs import JOB_DONE, JOB_ERROR, JobRegistry
+
+
+def test_identical_requests_share_one_job():
+    release = threading.Event()
+    calls = []
+
+    def work(job):
+        calls.append(job.id)
+        release.wait(5)
+
+    with ThreadPoolExecutor(2) as executor:
+        registry = JobRegistry(executor)
+        job, created = registry.submit("k", work)
+        again, created_again = registry.submit("k", work)
+        assert created and not created_again and again is job
+        release.set()
+        assert registry.wait("k").status == JOB_DONE
+        # Job terminé : une nouvelle demande relance le calcul
+        _, created = registry.submit("k", work)
+        registry.wait("k")
+    assert created and calls == ["k", "k"]
+
+
+def test_failed_job_records_its_exception():
+    def work(job):
+        raise ValueError("PDF illisible")
+
+    with ThreadPoolExecutor(1) as executor:
+        registry = JobRegistry(executor)
+        registry.submit("k", work)
+        job = registry.wait("k")
+    assert job.status == JOB_ERROR and isinstance(job.exception, ValueError)
+
+
+def test_queue_is_bounded_by_max_active():
+    release = threading.Event()
+    with ThreadPoolExecutor(1) as executor:
+        registry = JobRegistry(executor, max_active=1)
+        registry.submit("a", lambda job: release.wait(5))
+        assert registry.submit("b", lambda job: None) == (None, False)
+        release.set()
+        registry.wait("a")
+        assert registry.submit("b", lambda job: None)[1]
+        registry.wait("b")
+
+
+def test_finished_jobs_are_trimmed_but_active_ones_kept():
+    release = threading.Event()
+    with ThreadPoolExecutor(2) as executor:
+        registry = JobRegistry(executor, max_jobs=1, max_active=None)
+        registry.submit("active", lambda job: release.wait(5))
+        for key in ("x", "y"):
+            registry.submit(key, lambda job: None)
+            registry.wait(key)
+        registry.submit("z", lambda job: None)
+        assert registry.get("active") is not None and registry.get("x") is None
+        release.set()
@@ -0,0 +1,43 @@
+from PIL import Image, ImageDraw
+
+from raster_diff import BLOCK_SIZE, changed_regions
+
+
+def _page(size=(200, 160)):
+    img = Image.new("RGB", size, "white")
+    ImageDraw.Draw(img).rectangle((10, 10, 190, 20), fill="black")
+    return img
+
+
+def test_identical_rasters_have_no_region():
+    assert changed_regions(_page(), _page()) == []
+
+
+def test_stamp_forms_one_region_on_the_block_grid():
+    stamped = _page()
+    ImageDraw.Draw(stamped).ellipse((100, 60, 140, 100), outline="red", width=3)
+    regions = changed_regions(_page(), stamped)
+    assert len(regions) == 1
+    x0, top, x1, bottom = regions[0]
+    assert x0 <= 100 and top <= 60 and x1 >= 140 and bottom >= 100
+    assert all(v % BLOCK_SIZE == 0 for v in (x0, top))
+
+
+def test_ignored_boxes_do_not_count():
+    changed = _page()
+    ImageDraw.Draw(changed).rectangle((20, 100, 60, 120), fill="black")
+    assert changed_regions(_page(), changed, ignore=[(16, 96, 64, 124)]) == []
+
+
+def test_isolated_pixels_are_noise():
+    noisy = _page()
+    noisy.putpixel((150, 120), (0, 0, 0))
+    assert changed_regions(_page(), noisy) == []
+
+
+def test_different_sizes_are_padded_with_white():
+    taller = Image.new("RGB", (200, 200), "white")
+    taller.paste(_page(), (0, 0))
+    ImageDraw.Draw(taller).rectangle((10, 170, 50, 190), fill="black")
+    regions = changed_regions(_page(), taller)
+    assert len(regions) == 1 and regions[0][1] >= 160 - BLOCK_SIZE
@@ -0,0 +1,79 @@
+import io
+import os
+
+import pytest
+
+from services import check_pdf
+from storage import InvalidUpload, UploadStore, UploadTooLarge
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SAMPLE_PDF = os.path.join(ROOT, "devis_v1.pdf")
+
+
+def _flat(directory, name, content):
+    with open(os.path.join(directory, name), "wb") as f:
+        f.write(content)
+
+
+def test_same_content_is_stored_once(tmp_path):
+    store = UploadStore(str(tmp_path))
+    a = store.save("a.pdf", io.BytesIO(b"contenu"))
+    b = store.save("b.pdf", io.BytesIO(b"contenu"))
+    assert a["sha256"] == b["sha256"] and store.blobs() == [a["sha256"]]
+
+
+def test_replaced_content_is_collected(tmp_path):
+    collected = []
+    store = UploadStore(str(tmp_path), on_collect=collected.append)
+    old = store.save("a.pdf", io.BytesIO(b"v1"))
+    store.save("a.pdf", io.BytesIO(b"v2"))
+    assert collected == [old["sha256"]]
+    assert not os.path.exists(store.blob_path(old["sha256"]))
+
+
+def test_oversized_upload_leaves_nothing(tmp_path):
+    store = UploadStore(str(tmp_path))
+    with pytest.raises(UploadTooLarge):
+        store.save("a.pdf", io.BytesIO(b"x" * 100), max_size=10)
+    assert store.count() == 0 and os.listdir(store.tmp_dir) == []
+
+
+def test_invalid_pdf_is_rejected_before_commit(tmp_path):
+    store = UploadStore(str(tmp_path), validate=check_pdf)
+    with pytest.raises(InvalidUpload):
+        store.save("a.pdf", io.BytesIO(b"%PDF-1.4 illisible"))
+    assert store.count() == 0 and os.listdir(store.tmp_dir) == []
+    with open(SAMPLE_PDF, "rb") as f:
+        assert store.save("devis.pdf", f)["size"] == os.path.getsize(SAMPLE_PDF)
+
+
+def test_flat_files_are_imported_once(tmp_path):
+    _flat(tmp_path, "devis.pdf", b"exemple")
+    store = UploadStore(str(tmp_path))
+    store.import_directory(str(tmp_path))
+    assert store.get("devis.pdf") is not None
+    assert os.path.exists(tmp_path / "devis.pdf")
+    # Un upload du même nom n'est pas écrasé par le fichier à plat au redémarrage
+    uploaded = store.save("devis.pdf", io.BytesIO(b"upload"))
+    restarted = UploadStore(str(tmp_path))
+    restarted.import_directory(str(tmp_path))
+    assert restarted.get("devis.pdf")["sha256"] == uploaded["sha256"]
+
+
+def test_existing_name_is_never_overridden_by_import(tmp_path):
+    store = UploadStore(str(tmp_path))
+    uploaded = store.save("devis.pdf", io.BytesIO(b"upload"))
+    _flat(tmp_path, "devis.pdf", b"exemple")
+    store.import_directory(str(tmp_path))
+    assert store.get("devis.pdf")["sha256"] == uploaded["sha256"]
+
+
+def test_reset_survives_restart(tmp_path):
+    _flat(tmp_path, "devis.pdf", b"exemple")
+    store = UploadStore(str(tmp_path))
+    store.import_directory(str(tmp_path))
+    store.clear()
+    assert not os.path.exists(tmp_path / "devis.pdf")
+    restarted = UploadStore(str(tmp_path))
+    restarted.import_directory(str(tmp_path))
+    assert restarted.count() == 0
@@ -0,0 +1,54 @@
+from text_alignment import align_lines
+
+
+def _lines(*texts):
+    return [t + "\n" for t in texts]
+
+
+def _check_cover(blocks, lines1, lines2):
+    # Blocs contigus et dans l'ordre, couvrant les deux textes ; blocs identiques exacts
+    pos1 = pos2 = 0
+    for s1, e1, s2, e2, equal in blocks:
+        assert (s1, s2) == (pos1, pos2)
+        if equal:
+            assert lines1[s1:e1] == lines2[s2:e2]
+        pos1, pos2 = e1, e2
+    assert (pos1, pos2) == (len(lines1), len(lines2))
+
+
+def test_identical_texts_form_one_block():
+    lines = _lines("a", "b", "c")
+    assert align_lines(lines, list(lines)) == [(0, 3, 0, 3, True)]
+
+
+def test_changed_line_is_isolated_by_anchors():
+    lines1 = _lines("titre", "x", "ligne 1", "ligne 2", "ligne 3", "y", "fin")
+    lines2 = _lines("titre", "z", "ligne 1", "ligne 2 modifiée", "ligne 3", "w", "fin")
+    blocks = align_lines(lines1, lines2)
+    _check_cover(blocks, lines1, lines2)
+    changed = [(s1, e1, s2, e2) for s1, e1, s2, e2, equal in blocks if not equal]
+    assert changed == [(1, 2, 1, 2), (3, 4, 3, 4), (5, 6, 5, 6)]
+
+
+def test_inserted_and_deleted_lines():
+    lines1 = _lines("a", "b", "c", "d")
+    lines2 = _lines("a", "nouveau", "b", "d")
+    blocks = align_lines(lines1, lines2)
+    _check_cover(blocks, lines1, lines2)
+    assert (1, 1, 1, 2, False) in blocks
+    assert (2, 3, 3, 3, False) in blocks
+
+
+def test_repeated_lines_are_not_anchors():
+    # Lignes répétées (filets, sous-totaux) : seules les lignes uniques servent d'ancres
+    lines1 = _lines("---", "a", "---", "b", "---")
+    lines2 = _lines("---", "b", "---", "a", "---")
+    blocks = align_lines(lines1, lines2)
+    _check_cover(blocks, lines1, lines2)
+    assert any(not equal for *_, equal in blocks)
+
+
+def test_empty_side():
+    lines = _lines("a", "b")
+    assert align_lines([], lines) == [(0, 0, 0, 2, False)]
+    assert align_lines(lines, []) == [(0, 2, 0, 0, False)]
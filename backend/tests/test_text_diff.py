@@ -0,0 +1,87 @@
+import pytest
+
+from services import _tokens_to_chars, compact_diff, diff_page_words, diff_texts
+
+DELETE, EQUAL, INSERT = -1, 0, 1
+
+
+def _sides(diffs):
+    # Textes des deux versions reconstitués à partir des opérations
+    text1 = "".join(text for op, text in diffs if op != INSERT)
+    text2 = "".join(text for op, text in diffs if op != DELETE)
+    return text1, text2
+
+
+def _words(text):
+    return [{"text": t, "top": 10.0} for t in text.split()]
+
+
+TEXT1 = "Devis n° 12\nArticle 1 : câble 3 x 100.00 €\nArticle 2 : prise 2 x 15.00 €\nTotal 330.00 €\n"
+TEXT2 = "Devis n° 12\nArticle 1 : câble 4 x 100.00 €\nArticle 2 : prise 2 x 15.00 €\nTotal 430.00 €\n"
+
+
+def test_tokens_to_chars_one_char_per_distinct_token():
+    chars1, chars2, tokens = _tokens_to_chars(["a ", "b ", "a "], ["b ", "c "])
+    assert chars1[0] == chars1[2] != chars1[1]
+    assert chars2[0] == chars1[1]
+    assert tokens[0] == ""
+    assert [tokens[ord(c)] for c in chars1 + chars2] == ["a ", "b ", "a ", "b ", "c "]
+
+
+@pytest.mark.parametrize("mode", ["char", "word", "line"])
+def test_diff_texts_rebuilds_both_texts(mode):
+    diffs = diff_texts(TEXT1, TEXT2, mode).to_data()
+    assert _sides(diffs) == (TEXT1, TEXT2)
+
+
+def test_word_mode_replaces_whole_words():
+    diffs = diff_texts(TEXT1, TEXT2, "word").to_data()
+    changed = [(op, text) for op, text in diffs if op != EQUAL]
+    assert changed == [(DELETE, "3 "), (INSERT, "4 "), (DELETE, "330.00 "), (INSERT, "430.00 ")]
+
+
+def test_line_mode_replaces_whole_lines():
+    diffs = diff_texts(TEXT1, TEXT2, "line").to_data()
+    for op, text in diffs:
+        if op != EQUAL:
+            assert text.endswith("\n")
+    assert (DELETE, "Total 330.00 €\n") in diffs
+
+
+def test_stats_count_changed_segments():
+    text_diff = diff_texts(TEXT1, TEXT2, "word")
+    assert text_diff.stats() == {"additions": 2, "deletions": 2, "changes": 4}
+    assert text_diff.complete
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        diff_texts(TEXT1, TEXT2, "paragraph")
+
+
+def test_compact_diff_round_trip():
+    diffs = diff_texts(TEXT1, TEXT2, "word").to_data()
+    compact = compact_diff(diffs)
+    assert [(op, compact["text"][start:start + length]) for op, start, length in compact["ops"]] == \
+        [(op, text) for op, text in diffs]
+
+
+def test_compact_diff_context_elides_common_text():
+    diffs = [(EQUAL, "a" * 100), (DELETE, "x"), (INSERT, "y"), (EQUAL, "b" * 100)]
+    compact = compact_diff(diffs, context=10)
+    assert compact["ops"] == [[EQUAL, None, 90], [EQUAL, 0, 10], [DELETE, 10, 1], [INSERT, 11, 1],
+                              [EQUAL, 12, 10], [EQUAL, None, 90]]
+    assert compact["text"] == "a" * 10 + "xy" + "b" * 10
+
+
+@pytest.mark.parametrize("mode", ["char", "word"])
+def test_diff_page_words_marks_changed_words(mode):
+    words1 = _words("Article 1 câble 3 x 100.00")
+    words2 = _words("Article 1 câble 4 x 100.00")
+    assert diff_page_words(words1, words2, mode) == ({3}, {3})
+
+
+def test_diff_page_words_line_mode_marks_whole_lines():
+    words1 = [{"text": "Total", "top": 10.0}, {"text": "330", "top": 10.0}, {"text": "Fin", "top": 30.0}]
+    words2 = [{"text": "Total", "top": 10.0}, {"text": "430", "top": 10.0}, {"text": "Fin", "top": 30.0}]
+    assert diff_page_words(words1, words2, "line") == ({0, 1}, {0, 1})
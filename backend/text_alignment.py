@@ -0,0 +1,96 @@
+from bisect import bisect_left
+from collections import Counter
+from typing import List, Tuple
+
+# Profondeur maximale de la recherche d'ancres dans les intervalles entre ancres
+MAX_ANCHOR_DEPTH = 8
+
+# Bloc aligné : (début1, fin1, début2, fin2, identique), indices de lignes, fins exclues
+Block = Tuple[int, int, int, int, bool]
+
+
+def _unique_anchors(lines1: list, lo1: int, hi1: int, lines2: list, lo2: int, hi2: int) -> List[Tuple[int, int]]:
+    """
+    Lignes présentes exactement une fois de chaque côté de l'intervalle, appariées par
+    leur contenu (haché par le dictionnaire), puis réduites à la plus longue suite
+    croissante des deux côtés : les ancres ne se croisent pas.
+    """
+    counts1 = Counter(lines1[lo1:hi1])
+    counts2 = Counter(lines2[lo2:hi2])
+    position2 = {lines2[i]: i for i in range(lo2, hi2) if counts2[lines2[i]] == 1}
+    pairs = [(i, position2[lines1[i]]) for i in range(lo1, hi1)
+             if counts1[lines1[i]] == 1 and lines1[i] in position2]
+    if not pairs:
+        return []
+
+    # Plus longue sous-suite croissante des positions dans lines2 (tri par patience)
+    tails, tail_index, previous = [], [], [-1] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        n = bisect_left(tails, j)
+        if n == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[n] = j
+            tail_index[n] = k
+        previous[k] = tail_index[n - 1] if n > 0 else -1
+    anchors = []
+    k = tail_index[-1]
+    while k >= 0:
+        anchors.append(pairs[k])
+        k = previous[k]
+    anchors.reverse()
+    return anchors
+
+
+def _align(lines1: list, lo1: int, hi1: int, lines2: list, lo2: int, hi2: int,
+           blocks: List[Block], depth: int):
+    # Préfixe et suffixe communs
+    start1, start2 = lo1, lo2
+    while start1 < hi1 and start2 < hi2 and lines1[start1] == lines2[start2]:
+        start1 += 1
+        start2 += 1
+    end1, end2 = hi1, hi2
+    while end1 > start1 and end2 > start2 and lines1[end1 - 1] == lines2[end2 - 1]:
+        end1 -= 1
+        end2 -= 1
+    if start1 > lo1:
+        blocks.append((lo1, start1, lo2, start2, True))
+
+    if start1 < end1 or start2 < end2:
+        anchors = []
+        if start1 < end1 and start2 < end2 and depth < MAX_ANCHOR_DEPTH:
+            anchors = _unique_anchors(lines1, start1, end1, lines2, start2, end2)
+        if not anchors:
+            blocks.append((start1, end1, start2, end2, False))
+        else:
+            gap1, gap2 = start1, start2
+            for i, j in anchors:
+                _align(lines1, gap1, i, lines2, gap2, j, blocks, depth + 1)
+                blocks.append((i, i + 1, j, j + 1, True))
+                gap1, gap2 = i + 1, j + 1
+            _align(lines1, gap1, end1, lines2, gap2, end2, blocks, depth + 1)
+
+    if end1 < hi1:
+        blocks.append((end1, hi1, end2, hi2, True))
+
+
+def align_lines(lines1: list, lines2: list) -> List[Block]:
+    """
+    Découpe deux textes (listes de lignes) en blocs alignés, dans l'ordre : blocs de
+    lignes identiques et régions modifiées, qui seules passent par le diff fin. Les
+    lignes uniques des deux côtés servent d'ancres (diff « patience ») ; entre deux
+    ancres, la recherche reprend sur l'intervalle. Les blocs consécutifs de même
+    nature sont fusionnés.
+    """
+    blocks: List[Block] = []
+    _align(lines1, 0, len(lines1), lines2, 0, len(lines2), blocks, 0)
+    merged: List[Block] = []
+    for block in blocks:
+        if block[0] == block[1] and block[2] == block[3]:
+            continue
+        if merged and block[4] == merged[-1][4]:
+            merged[-1] = (merged[-1][0], block[1], merged[-1][2], block[3], block[4])
+        else:
+            merged.append(block)
+    return merged
@@ -1,37 +1,92 @@
 import { useState, useEffect } from 'react';
-import { VersionManager } from './components/VersionManager';
-import { DiffViewer } from './components/DiffViewer';
-import { VisualDiffViewer } from './components/VisualDiffViewer';
+import { VersionManager, type DiffMode } from './components/VersionManager';
+import { DiffViewer, type CompactDiff, type DiffStats } from './components/DiffViewer';
+import { VisualDiffViewer, type Highlight, type PageStatus } from './components/VisualDiffViewer';
+import { SearchBar, type SearchResult } from './components/SearchBar';
+
+// URLs (relatives à l'API) des pages non annotées, leurs dimensions et les surlignages
+interface PageImages {
+  page: number;
+  // Pages correspondantes dans chaque version (null : page absente) et statut de l'alignement
+  page1: number | null;
+  page2: number | null;
+  status: PageStatus;
+  // Contenu identique : images non annotées, partagées entre comparaisons
+  unchanged: boolean;
+  img1: string | null;
+  img2: string | null;
+  size1: [number, number] | null;
+  size2: [number, number] | null;
+  // Dimensions des pages en points PDF, repère des surlignages (`overlay=data`)
+  points1: [number, number] | null;
+  points2: [number, number] | null;
+  highlights: Highlight[];
+}
 
 interface DiffResult {
-  html_diff: string;
-  raw_diff: Array<[number, string]>;
-  visual_diff: Array<{
-    page: number;
-    img1: string | null;
-    img2: string | null;
-  }>;
+  comparison_id: string;
+  compact_diff: CompactDiff;
+  stats: DiffStats;
+  complete: boolean;
+  visual_diff: PageImages[];
+  num_pages: number;
   filename1: string;
   filename2: string;
 }
 
+// Messages NDJSON de /compare-versions/stream
+type StreamMessage =
+  | ({ type: 'text' } & Omit<DiffResult, 'visual_diff'>)
+  | ({ type: 'page' } & PageImages)
+  | { type: 'done' }
+  | { type: 'error'; error: string };
+
+// Lit une réponse NDJSON ligne par ligne au fil de l'arrivée des données
+async function readNdjson(response: Response, onMessage: (msg: StreamMessage) => void) {
+  const reader = response.body!.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let newline: number;
+    while ((newline = buffer.indexOf('\n')) >= 0) {
+      const line = buffer.slice(0, newline).trim();
+      buffer = buffer.slice(newline + 1);
+      if (line) onMessage(JSON.parse(line));
+    }
+  }
+}
+
 interface Version {
   filename: string;
   path: string;
   size: number;
   created: number;
   modified: number;
+  // Analyse du document lancée à l'upload (null : pas encore analysé)
+  ingestion: 'pending' | 'running' | 'done' | 'error' | null;
+  num_pages: number | null;
+  pages_done: number;
 }
 
 function App() {
   const [diffResult, setDiffResult] = useState<DiffResult | null>(null);
   const [versions, setVersions] = useState<Version[]>([]);
   const [isLoading, setIsLoading] = useState(false);
+  const [isLoadingPages, setIsLoadingPages] = useState(false);
   const [isUploading, setIsUploading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [viewMode, setViewMode] = useState<'text' | 'visual'>('visual');
+  // Résultats de la recherche plein texte, surlignés dans la vue visuelle
+  const [searchResults, setSearchResults] = useState<SearchResult[]>([]);
 
   const API_URL = 'http://localhost:8001';
+  // Nombre de pages rendues par requête ; les suivantes sont chargées au défilement
+  const PAGE_WINDOW = 3;
+  // Texte identique conservé autour de chaque modification dans la diff compacte
+  const DIFF_CONTEXT = 300;
 
   const fetchVersions = async () => {
     try {
@@ -49,6 +104,14 @@ function App() {
     fetchVersions();
   }, []);
 
+  // Rafraîchit la liste tant qu'un document est en cours d'analyse
+  const isIngesting = versions.some(v => v.ingestion === 'pending' || v.ingestion === 'running');
+  useEffect(() => {
+    if (!isIngesting) return;
+    const timer = setTimeout(fetchVersions, 1000);
+    return () => clearTimeout(timer);
+  }, [versions, isIngesting]);
+
   const handleUpload = async (file: File) => {
     setIsUploading(true);
     setError(null);
@@ -80,30 +143,72 @@ function App() {
     }
   };
 
-  const handleCompare = async (file1: string, file2: string) => {
+  const handleCompare = async (file1: string, file2: string, mode: DiffMode, pixels: boolean) => {
     setIsLoading(true);
     setError(null);
     setDiffResult(null);
 
     try {
-      const response = await fetch(`${API_URL}/compare-versions`, {
+      const response = await fetch(`${API_URL}/compare-versions/stream?pages=1-${PAGE_WINDOW}&diff_format=compact&context=${DIFF_CONTEXT}&overlay=data`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ file1, file2 }),
+        body: JSON.stringify({ file1, file2, mode, pixels }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error('Erreur lors de la comparaison des fichiers');
       }
 
-      const data = await response.json();
-      setDiffResult(data);
+      // La diff texte arrive en premier, puis les pages annotées une à une
+      setIsLoadingPages(true);
+      await readNdjson(response, (msg) => {
+        if (msg.type === 'text') {
+          setDiffResult({
+            comparison_id: msg.comparison_id,
+            compact_diff: msg.compact_diff,
+            stats: msg.stats,
+            complete: msg.complete,
+            num_pages: msg.num_pages,
+            filename1: msg.filename1,
+            filename2: msg.filename2,
+            visual_diff: [],
+          });
+          setIsLoading(false);
+        } else if (msg.type === 'page') {
+          setDiffResult(prev => prev && { ...prev, visual_diff: [...prev.visual_diff, msg] });
+        } else if (msg.type === 'error') {
+          throw new Error(msg.error);
+        }
+      });
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Une erreur inconnue est survenue');
     } finally {
       setIsLoading(false);
+      setIsLoadingPages(false);
+    }
+  };
+
+  const loadMorePages = async () => {
+    if (!diffResult || isLoadingPages) return;
+    const first = diffResult.visual_diff.length + 1;
+    if (first > diffResult.num_pages) return;
+    const last = Math.min(first + PAGE_WINDOW - 1, diffResult.num_pages);
+
+    setIsLoadingPages(true);
+    try {
+      const res = await fetch(`${API_URL}/comparisons/${diffResult.comparison_id}/pages?pages=${first}-${last}&overlay=data`);
+      if (!res.ok) throw new Error("Erreur lors du chargement des pages");
+      const data = await res.json();
+      // Ignore la réponse si une autre comparaison a été lancée entre-temps
+      setDiffResult(prev => prev && prev.comparison_id === data.comparison_id
+        ? { ...prev, visual_diff: [...prev.visual_diff, ...data.visual_diff] }
+        : prev);
+    } catch (err) {
+      setError(err instanceof Error ? err.message : 'Une erreur inconnue est survenue');
+    } finally {
+      setIsLoadingPages(false);
     }
   };
 
@@ -123,6 +228,7 @@ function App() {
         <header className="p-6 border-b border-border bg-card shadow-sm flex-shrink-0">
           <h1 className="text-2xl font-bold text-primary">Comparateur de Devis</h1>
           <p className="text-muted-foreground text-sm mt-1">Gérez vos versions et visualisez les évolutions</p>
+          <SearchBar apiUrl={API_URL} onResults={setSearchResults} />
         </header>
 
         <main className="flex-1 overflow-y-auto p-4 md:p-8 bg-muted/10">
@@ -177,14 +283,20 @@ function App() {
 
                 {viewMode === 'visual' ? (
                   <VisualDiffViewer 
+                    apiUrl={API_URL}
                     visualDiff={diffResult.visual_diff}
+                    totalPages={diffResult.num_pages}
+                    isLoadingPages={isLoadingPages}
+                    onLoadMore={loadMorePages}
                     fileName1={diffResult.filename1}
                     fileName2={diffResult.filename2}
+                    searchResults={searchResults}
                   />
                 ) : (
                   <DiffViewer 
-                    htmlDiff={diffResult.html_diff}
-                    rawDiff={diffResult.raw_diff}
+                    diff={diffResult.compact_diff}
+                    stats={diffResult.stats}
+                    complete={diffResult.complete}
                     fileName1={diffResult.filename1}
                     fileName2={diffResult.filename2}
                   />
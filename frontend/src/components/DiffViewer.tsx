@@ -1,33 +1,56 @@
-import React from 'react';
+import React, { useMemo } from 'react';
+
+// Diff texte compacte du backend (`diff_format=compact`) : le texte des segments n'est
+// envoyé qu'une fois, chaque opération est [op, début, longueur] dans ce texte
+// (op : -1 supprimé, 0 identique, 1 ajouté). Un début null marque du texte identique
+// omis, hors du contexte des modifications.
+export interface CompactDiff {
+  text: string;
+  ops: Array<[number, number | null, number]>;
+}
+
+// Statistiques calculées par le backend (`stats`) : segments ajoutés et supprimés
+export interface DiffStats {
+  additions: number;
+  deletions: number;
+  changes: number;
+}
 
 interface DiffViewerProps {
-  htmlDiff: string;
-  rawDiff: Array<[number, string]>;
+  diff: CompactDiff;
+  stats: DiffStats;
+  // Faux si le budget de temps du backend n'a pas suffi à affiner toutes les régions
+  complete: boolean;
   fileName1: string;
   fileName2: string;
 }
 
-export const DiffViewer: React.FC<DiffViewerProps> = ({ htmlDiff, rawDiff, fileName1, fileName2 }) => {
-  
-  // Calcul simple des statistiques
-  const additions = rawDiff.filter(d => d[0] === 1).length;
-  const deletions = rawDiff.filter(d => d[0] === -1).length;
-  const changes = additions + deletions;
+export const DiffViewer: React.FC<DiffViewerProps> = ({ diff, stats, complete, fileName1, fileName2 }) => {
+  const { additions, deletions, changes } = stats;
+
+  const segments = useMemo(() => diff.ops.map(([op, start, length], i) => {
+    if (start === null) {
+      return (
+        <span key={i} className="block my-2 text-center text-xs text-muted-foreground select-none">
+          … {length} caractères inchangés …
+        </span>
+      );
+    }
+    const text = diff.text.slice(start, start + length);
+    if (op === 1) return <ins key={i}>{text}</ins>;
+    if (op === -1) return <del key={i}>{text}</del>;
+    return <span key={i}>{text}</span>;
+  }), [diff]);
 
   return (
     <div className="flex flex-col md:flex-row gap-6 w-full max-w-6xl mx-auto">
       {/* Panneau principal de visualisation */}
       <div className="flex-1 bg-card text-card-foreground p-6 rounded-lg shadow-md overflow-auto max-h-[80vh] border border-border">
         <h3 className="text-xl font-semibold mb-4 border-b border-border pb-2">Comparaison Visuelle</h3>
-        <div 
-          className="prose prose-sm max-w-none font-mono whitespace-pre-wrap dark:prose-invert"
-          dangerouslySetInnerHTML={{ __html: htmlDiff }} 
-          style={{
-            // Styles inline pour s'assurer que les balises générées par le backend sont bien stylisées
-            // Note: Google diff match patch utilise <ins> et <del> par défaut ou span avec style.
-            // On va injecter du CSS global dans App.css ou index.css pour cibler ins/del si nécessaire.
-          }}
-        />
+        {/* Balises ins/del stylées dans index.css */}
+        <div className="prose prose-sm max-w-none font-mono whitespace-pre-wrap dark:prose-invert">
+          {segments}
+        </div>
       </div>
 
       {/* Panneau latéral de résumé */}
@@ -59,6 +82,11 @@ export const DiffViewer: React.FC<DiffViewerProps> = ({ htmlDiff, rawDiff, fileN
               <div className="mt-2 bg-blue-50 p-3 rounded text-center dark:bg-blue-900/20">
                  <span className="text-blue-800 font-medium dark:text-blue-300">Total {changes} modifications</span>
               </div>
+              {!complete && (
+                <p className="mt-2 text-xs text-muted-foreground">
+                  Diff simplifiée : certaines zones sont affichées comme un bloc supprimé puis ajouté.
+                </p>
+              )}
             </div>
 
             <div className="text-xs text-muted-foreground mt-4">
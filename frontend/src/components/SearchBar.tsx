@@ -0,0 +1,94 @@
+import React, { useState } from 'react';
+
+// Page trouvée : dimensions en points PDF et rectangles [x0, top, x1, bottom] des mots trouvés
+export interface SearchPage {
+  page: number;
+  width: number;
+  height: number;
+  hits: [number, number, number, number][];
+}
+
+export interface SearchResult {
+  filename: string;
+  sha256: string;
+  modified: number;
+  pages: SearchPage[];
+}
+
+interface SearchBarProps {
+  apiUrl: string;
+  // Résultats courants, surlignés dans la vue visuelle (liste vide : recherche effacée)
+  onResults: (results: SearchResult[]) => void;
+}
+
+export const SearchBar: React.FC<SearchBarProps> = ({ apiUrl, onResults }) => {
+  const [query, setQuery] = useState('');
+  const [phrase, setPhrase] = useState(false);
+  const [results, setResults] = useState<SearchResult[] | null>(null);
+  const [totalPages, setTotalPages] = useState(0);
+  const [error, setError] = useState<string | null>(null);
+
+  const handleSearch = async (e: React.FormEvent) => {
+    e.preventDefault();
+    if (!query.trim()) {
+      setResults(null);
+      onResults([]);
+      return;
+    }
+    setError(null);
+    try {
+      const params = new URLSearchParams({ q: query, phrase: String(phrase) });
+      const res = await fetch(`${apiUrl}/search?${params}`);
+      if (!res.ok) throw new Error('Erreur lors de la recherche');
+      const data = await res.json();
+      setResults(data.results);
+      setTotalPages(data.total_pages);
+      onResults(data.results);
+    } catch (err) {
+      setError(err instanceof Error ? err.message : 'Erreur lors de la recherche');
+    }
+  };
+
+  return (
+    <div className="mt-4">
+      <form onSubmit={handleSearch} className="flex items-center gap-2">
+        <input
+          type="search"
+          value={query}
+          onChange={(e) => setQuery(e.target.value)}
+          placeholder="Rechercher un fournisseur, une référence, un prix..."
+          className="flex-1 p-1.5 text-sm border border-input bg-background rounded focus:ring-1 focus:ring-ring"
+        />
+        <label className="flex items-center gap-1 text-sm text-muted-foreground">
+          <input type="checkbox" checked={phrase} onChange={(e) => setPhrase(e.target.checked)} />
+          Expression exacte
+        </label>
+        <button type="submit" className="px-3 py-1.5 text-sm rounded bg-primary text-primary-foreground hover:bg-primary/90">
+          Rechercher
+        </button>
+      </form>
+
+      {error && <p className="text-sm text-destructive mt-2">{error}</p>}
+
+      {results && (
+        <div className="mt-2 text-sm text-muted-foreground max-h-32 overflow-y-auto">
+          {results.length === 0 ? (
+            <p className="italic">Aucun résultat</p>
+          ) : (
+            <>
+              <p>{totalPages} page(s) trouvée(s)</p>
+              <ul>
+                {results.map((result) => (
+                  <li key={result.filename}>
+                    <span className="font-medium text-foreground">{result.filename}</span>
+                    {' — '}page{result.pages.length > 1 ? 's' : ''} {result.pages.map((p) => p.page).join(', ')}
+                  </li>
+                ))}
+              </ul>
+            </>
+          )}
+        </div>
+      )}
+    </div>
+  );
+};
@@ -6,12 +6,19 @@ interface Version {
   size: number;
   created: number;
   modified: number;
+  // Analyse du document lancée à l'upload (null : pas encore analysé)
+  ingestion: 'pending' | 'running' | 'done' | 'error' | null;
+  num_pages: number | null;
+  pages_done: number;
 }
 
+// Granularité du diff demandée au backend
+export type DiffMode = 'char' | 'word' | 'line';
+
 interface VersionManagerProps {
   versions: Version[];
   onUpload: (file: File) => void;
-  onCompare: (v1: string, v2: string) => void;
+  onCompare: (v1: string, v2: string, mode: DiffMode, pixels: boolean) => void;
   onReset: () => void;
   isUploading: boolean;
 }
@@ -25,6 +32,8 @@ export const VersionManager: React.FC<VersionManagerProps> = ({
 }) => {
   const [selectedV1, setSelectedV1] = useState<string>('');
   const [selectedV2, setSelectedV2] = useState<string>('');
+  const [mode, setMode] = useState<DiffMode>('char');
+  const [pixels, setPixels] = useState(false);
   const fileInputRef = useRef<HTMLInputElement>(null);
 
   const handleFileChange = (e: React.ChangeEvent<HTMLInputElement>) => {
@@ -36,7 +45,7 @@ export const VersionManager: React.FC<VersionManagerProps> = ({
 
   const handleCompareClick = () => {
     if (selectedV1 && selectedV2) {
-      onCompare(selectedV1, selectedV2);
+      onCompare(selectedV1, selectedV2, mode, pixels);
     }
   };
 
@@ -118,6 +127,27 @@ export const VersionManager: React.FC<VersionManagerProps> = ({
                   ))}
                </select>
             </div>
+            <div>
+               <label className="text-xs font-semibold text-muted-foreground uppercase">Granularité</label>
+               <select 
+                  value={mode}
+                  onChange={(e) => setMode(e.target.value as DiffMode)}
+                  className="w-full mt-1 p-1.5 text-sm border border-input bg-background rounded focus:ring-1 focus:ring-ring"
+               >
+                  <option value="char">Caractère</option>
+                  <option value="word">Mot</option>
+                  <option value="line">Ligne</option>
+               </select>
+            </div>
+            {/* Comparaison des rendus : logos, tampons, signatures, pages scannées */}
+            <label className="flex items-center gap-2 text-sm text-foreground">
+               <input
+                  type="checkbox"
+                  checked={pixels}
+                  onChange={(e) => setPixels(e.target.checked)}
+               />
+               Différences graphiques
+            </label>
             <button
                 onClick={handleCompareClick}
                 disabled={!selectedV1 || !selectedV2 || selectedV1 === selectedV2}
@@ -166,6 +196,16 @@ export const VersionManager: React.FC<VersionManagerProps> = ({
                                 <div className="text-[10px] text-muted-foreground">
                                     {new Date(v.modified * 1000).toLocaleString()}
                                 </div>
+                                <div className="text-[10px] text-muted-foreground">
+                                    {v.ingestion === 'done' && `${v.num_pages} page${v.num_pages === 1 ? '' : 's'}`}
+                                    {v.ingestion === 'pending' && 'Analyse en attente...'}
+                                    {v.ingestion === 'running' && (
+                                        <span className="animate-pulse">
+                                            Analyse {v.num_pages ? `${v.pages_done}/${v.num_pages}` : ''}...
+                                        </span>
+                                    )}
+                                    {v.ingestion === 'error' && <span className="text-destructive">Analyse échouée</span>}
+                                </div>
                             </div>
                         </div>
                     </div>
@@ -1,17 +1,134 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
+import type { SearchPage, SearchResult } from './SearchBar';
+
+// Alignement des pages entre les deux versions
+export type PageStatus = 'matched' | 'moved' | 'inserted' | 'deleted';
+
+// Surlignage envoyé par le backend (`overlay=data`) : [op, x0, top, x1, bottom] en points
+// PDF, op -1 (suppression) sur la page de la version 1, 1 (ajout) sur celle de la version 2
+export type Highlight = [number, number, number, number, number];
 
 interface VisualDiffProps {
+  apiUrl: string;
+  // Les images sont des URLs relatives à l'API, servies en binaire (cache navigateur)
   visualDiff: Array<{
     page: number;
+    page1: number | null;
+    page2: number | null;
+    status: PageStatus;
+    unchanged: boolean;
     img1: string | null;
     img2: string | null;
+    size1: [number, number] | null;
+    size2: [number, number] | null;
+    points1: [number, number] | null;
+    points2: [number, number] | null;
+    highlights: Highlight[];
   }>;
+  totalPages: number;
+  isLoadingPages: boolean;
+  // Demande la fenêtre de pages suivante (appelé quand le bas de la liste devient visible)
+  onLoadMore: () => void;
   fileName1: string;
   fileName2: string;
+  // Occurrences de la recherche plein texte à surligner sur les pages des deux versions
+  searchResults?: SearchResult[];
 }
 
-export const VisualDiffViewer: React.FC<VisualDiffProps> = ({ visualDiff, fileName1, fileName2 }) => {
+const alignmentTitle = (pageData: VisualDiffProps['visualDiff'][number]) => {
+  switch (pageData.status) {
+    case 'inserted':
+      return `Page ${pageData.page2} (insérée)`;
+    case 'deleted':
+      return `Page ${pageData.page1} (supprimée)`;
+    case 'moved':
+      return `Page ${pageData.page1} → ${pageData.page2} (déplacée)`;
+    default:
+      return pageData.page1 === pageData.page2
+        ? `Page ${pageData.page1}`
+        : `Page ${pageData.page1} → ${pageData.page2}`;
+  }
+};
+
+const pageTitle = (pageData: VisualDiffProps['visualDiff'][number]) => {
+  const title = alignmentTitle(pageData);
+  return pageData.unchanged ? `${title} — identique` : title;
+};
+
+const findSearchPage = (results: SearchResult[], fileName: string, page: number | null) =>
+  results.find((r) => r.filename === fileName)?.pages.find((p) => p.page === page);
+
+// Rectangles en points PDF placés en pourcentage de la page : suivent le zoom de l'image
+const SearchHits: React.FC<{ searchPage?: SearchPage }> = ({ searchPage }) => (
+  <>
+    {searchPage?.hits.map(([x0, top, x1, bottom], i) => (
+      <div
+        key={i}
+        className="absolute bg-yellow-300/50 outline outline-2 outline-yellow-500 pointer-events-none"
+        style={{
+          left: `${(x0 / searchPage.width) * 100}%`,
+          top: `${(top / searchPage.height) * 100}%`,
+          width: `${((x1 - x0) / searchPage.width) * 100}%`,
+          height: `${((bottom - top) / searchPage.height) * 100}%`,
+        }}
+      />
+    ))}
+  </>
+);
+
+// Image refusée (503 : serveur occupé à d'autres rendus) : nouvelles tentatives espacées
+const retryImage = (event: React.SyntheticEvent<HTMLImageElement>) => {
+  const img = event.currentTarget;
+  const attempt = Number(img.dataset.retry ?? 0);
+  if (attempt >= 5) return;
+  img.dataset.retry = String(attempt + 1);
+  setTimeout(() => {
+    const url = new URL(img.src);
+    url.searchParams.set('retry', String(attempt + 1));
+    img.src = url.toString();
+  }, 2000 * (attempt + 1));
+};
+
+// Calque des modifications sur la page non annotée, en pourcentage comme les occurrences
+const DiffHighlights: React.FC<{ highlights: Highlight[]; op: number; points: [number, number] | null }> = ({ highlights, op, points }) => {
+  if (!points) return null;
+  const [width, height] = points;
+  const color = op === -1 ? 'bg-red-500/40' : 'bg-green-500/40';
+  return (
+    <>
+      {highlights.filter(([o]) => o === op).map(([, x0, top, x1, bottom], i) => (
+        <div
+          key={i}
+          className={`absolute ${color} pointer-events-none`}
+          style={{
+            left: `${(x0 / width) * 100}%`,
+            top: `${(top / height) * 100}%`,
+            width: `${((x1 - x0) / width) * 100}%`,
+            height: `${((bottom - top) / height) * 100}%`,
+          }}
+        />
+      ))}
+    </>
+  );
+};
+
+export const VisualDiffViewer: React.FC<VisualDiffProps> = ({ apiUrl, visualDiff, totalPages, isLoadingPages, onLoadMore, fileName1, fileName2, searchResults = [] }) => {
   const [scale, setScale] = useState(100);
+  const sentinelRef = useRef<HTMLDivElement>(null);
+
+  // Chargement progressif : les pages suivantes ne sont rendues côté serveur qu'au défilement
+  useEffect(() => {
+    const sentinel = sentinelRef.current;
+    if (!sentinel || isLoadingPages || visualDiff.length >= totalPages) return;
+    const observer = new IntersectionObserver(
+      (entries) => {
+        if (entries[0].isIntersecting) onLoadMore();
+      },
+      { rootMargin: '800px' }
+    );
+    observer.observe(sentinel);
+    return () => observer.disconnect();
+  }, [isLoadingPages, visualDiff.length, totalPages, onLoadMore]);
 
   return (
     <div className="mt-8 w-full max-w-6xl mx-auto">
@@ -37,7 +154,7 @@ export const VisualDiffViewer: React.FC<VisualDiffProps> = ({ visualDiff, fileNa
       <div className="space-y-8">
         {visualDiff.map((pageData, index) => (
           <div key={index} className="border border-border rounded-lg p-4 bg-muted/20 shadow-sm">
-            <h4 className="font-semibold mb-4 text-center text-foreground">Page {pageData.page}</h4>
+            <h4 className="font-semibold mb-4 text-center text-foreground">{pageTitle(pageData)}</h4>
             <div className="flex flex-col md:flex-row gap-4 justify-center overflow-auto">
               {pageData.img1 && (
                 <div className="flex-1 min-w-0">
@@ -45,11 +162,20 @@ export const VisualDiffViewer: React.FC<VisualDiffProps> = ({ visualDiff, fileNa
                     {fileName1} (Suppressions en rouge)
                   </div>
                   <div className="border border-border shadow-md inline-block bg-card">
-                    <img 
-                      src={`data:image/png;base64,${pageData.img1}`} 
-                      alt={`Page ${pageData.page} - ${fileName1}`}
-                      style={{ width: `${scale}%`, maxWidth: 'none' }} 
-                    />
+                    {/* Conteneur à la taille de l'image : surlignages et occurrences s'y placent en pourcentage */}
+                    <div className="relative" style={{ width: `${scale}%` }}>
+                      <img 
+                        src={`${apiUrl}${pageData.img1}`} 
+                        loading="lazy"
+                        onError={retryImage}
+                        width={pageData.size1?.[0]}
+                        height={pageData.size1?.[1]}
+                        alt={`Page ${pageData.page1} - ${fileName1}`}
+                        style={{ display: 'block', width: '100%', height: 'auto', maxWidth: 'none' }} 
+                      />
+                      <DiffHighlights highlights={pageData.highlights} op={-1} points={pageData.points1} />
+                      <SearchHits searchPage={findSearchPage(searchResults, fileName1, pageData.page1)} />
+                    </div>
                   </div>
                 </div>
               )}
@@ -60,17 +186,36 @@ export const VisualDiffViewer: React.FC<VisualDiffProps> = ({ visualDiff, fileNa
                     {fileName2} (Ajouts en vert)
                   </div>
                   <div className="border border-border shadow-md inline-block bg-card">
-                    <img 
-                      src={`data:image/png;base64,${pageData.img2}`} 
-                      alt={`Page ${pageData.page} - ${fileName2}`}
-                      style={{ width: `${scale}%`, maxWidth: 'none' }} 
-                    />
+                    {/* Conteneur à la taille de l'image : surlignages et occurrences s'y placent en pourcentage */}
+                    <div className="relative" style={{ width: `${scale}%` }}>
+                      <img 
+                        src={`${apiUrl}${pageData.img2}`} 
+                        loading="lazy"
+                        onError={retryImage}
+                        width={pageData.size2?.[0]}
+                        height={pageData.size2?.[1]}
+                        alt={`Page ${pageData.page2} - ${fileName2}`}
+                        style={{ display: 'block', width: '100%', height: 'auto', maxWidth: 'none' }} 
+                      />
+                      <DiffHighlights highlights={pageData.highlights} op={1} points={pageData.points2} />
+                      <SearchHits searchPage={findSearchPage(searchResults, fileName2, pageData.page2)} />
+                    </div>
                   </div>
                 </div>
               )}
             </div>
           </div>
         ))}
+
+        <div ref={sentinelRef} />
+
+        {/* Pages encore en cours de génération côté serveur */}
+        {isLoadingPages && visualDiff.length < totalPages && (
+          <div className="flex items-center justify-center gap-3 py-8 text-muted-foreground">
+            <div className="animate-spin rounded-full h-6 w-6 border-b-2 border-primary"></div>
+            <span className="text-sm">Génération des pages ({visualDiff.length}/{totalPages})...</span>
+          </div>
+        )}
       </div>
     </div>
   );